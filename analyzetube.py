@@ -5,237 +5,850 @@ Applicazione Flask standalone in un unico file.
 Estrae trascrizioni e commenti da video YouTube.
 
 Uso:
-    python3 analyzetube.py
+    python3 analyzetube.py [--port 5002] [--preload] [--import-report]
 
-Poi apri: http://localhost:5001
+Poi apri: http://localhost:5002
 """
 
-from flask import Flask, request, jsonify
-import yt_dlp
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 import re
+import io
+import html
+import codecs
+import os
+import sys
+import signal
+import argparse
+import gzip
+import hashlib
+import json
+import queue
+import random
+import sqlite3
+import threading
+import time
+import uuid
+import functools
+import importlib
+import importlib.util
+import subprocess
+import contextvars
+import multiprocessing
+import mmap
+import struct
+from array import array
+from itertools import chain
+from xml.etree import ElementTree
+from bisect import bisect_right
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import (
+    FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError,
+    as_completed, wait
+)
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import parse_qs, urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import requests
-from youtube_comment_downloader import YoutubeCommentDownloader, SORT_BY_POPULAR
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+class LazyModule:
+    """Modulo importato solo al primo accesso a un suo attributo
+
+    yt-dlp (centinaia di estrattori) e youtube-comment-downloader (dateparser)
+    costano quasi un secondo di import: così chi serve solo la pagina o un
+    risultato in cache non li carica mai.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.load_ms = None
+        self._module = None
+
+    def load(self):
+        if self._module is None:
+            start = time.perf_counter()
+            module = importlib.import_module(self.name)
+            self.load_ms = round((time.perf_counter() - start) * 1000, 1)
+            self._module = module
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+yt_dlp = LazyModule('yt_dlp')
+comment_downloader = LazyModule('youtube_comment_downloader')
+LAZY_MODULES = (yt_dlp, comment_downloader)
+
+try:
+    import brotli
+except ImportError:     # opzionale: senza, le risposte vengono compresse solo con gzip
+    brotli = None
+
+try:
+    import orjson
+except ImportError:     # opzionale: parser JSON più veloce per sottotitoli e cache
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:     # opzionale: senza, l'esportazione "packed" codifica i record in JSON
+    msgpack = None
+
+# Opzionale e pesante da importare: serve solo all'esportazione in formato Arrow
+pyarrow = LazyModule('pyarrow')
+pyarrow_ipc = LazyModule('pyarrow.ipc')
+HAVE_PYARROW = importlib.util.find_spec('pyarrow') is not None
 
 app = Flask(__name__)
 
 # ============================================================================
-# HTML/CSS/JS INCORPORATI
+# CONFIGURAZIONE
 # ============================================================================
 
-HTML_TEMPLATE = '''<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>AnalyzeTube - YouTube Video Analysis</title>
-    <style>
-        * { margin: 0; padding: 0; box-sizing: border-box; }
-
-        body {
-            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            min-height: 100vh;
-            padding: 20px;
-        }
+# Thread dedicati ai due rami di estrazione (info/trascrizione e commenti).
+# Ogni richiesta ne occupa due, quindi il pool regge ~8 richieste in parallelo.
+EXTRACT_WORKERS = 16
+
+# Timeout per ramo, in secondi, misurati dall'avvio della richiesta
+INFO_TIMEOUT = 60
+COMMENTS_TIMEOUT = 60
+
+_extract_executor = ThreadPoolExecutor(max_workers=EXTRACT_WORKERS, thread_name_prefix='extract')
+
+# Estrazione batch: video elaborati in parallelo. Ogni input (URL, ID,
+# playlist) finisce su YouTube, quindi il pool è il limite di concorrenza
+# del batch verso YouTube, condiviso da tutte le richieste batch del processo
+BATCH_WORKERS = 2
+BATCH_MAX_ITEMS = 500
+
+_batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix='batch')
+
+# Risorse condivise tra le richieste: sessione HTTP con pool di connessioni
+# e retry, istanze YoutubeDL e downloader dei commenti riutilizzati
+HTTP_POOL_CONNECTIONS = 10      # host distinti con un pool dedicato
+HTTP_POOL_SIZE = 32             # connessioni keep-alive per host
+HTTP_RETRIES = 3                # errori di connessione (urllib3) e risposte 5xx (limitatore)
+HTTP_BACKOFF = 0.5              # 0.5s, 1s, 2s tra i tentativi dopo un errore di connessione
+YDL_POOL_SIZE = EXTRACT_WORKERS
+COMMENT_DOWNLOADER_POOL_SIZE = EXTRACT_WORKERS
+
+# Parametri di default dell'estrazione (fanno parte della chiave di cache)
+DEFAULT_LANGS = ['en', 'it']
+MAX_LANGS = 10
+
+# Sottotitoli: tracce candidate scaricate in parallelo e formati in ordine
+# di preferenza (tutti vengono letti, json3 è il più ricco di tempi)
+SUBTITLE_PARALLEL = 3
+SUBTITLE_WORKERS = 16
+SUBTITLE_FORMATS = ['json3', 'srv3', 'srv2', 'srv1', 'vtt', 'ttml']
+SUBTITLE_CHUNK = 64 * 1024
+SUBTITLE_STREAM_THRESHOLD = 1024 * 1024     # con orjson, sotto questa dimensione json3 si legge in un colpo
+
+_subtitle_executor = ThreadPoolExecutor(max_workers=SUBTITLE_WORKERS, thread_name_prefix='subtitles')
+DEFAULT_COMMENTS_LIMIT = 50
+
+# Prompt per ChatGPT costruito dal server: budget di token di default e
+# quota del budget riservata alla trascrizione (il resto va ai commenti)
+PROMPT_TOKEN_BUDGET = 12000
+PROMPT_MIN_BUDGET = 1000
+PROMPT_MAX_BUDGET = 200000
+PROMPT_TRANSCRIPT_SHARE = 0.7
+PROMPT_BLOCK_TOKENS = 150       # granularità della selezione della trascrizione
+
+# Compressione delle risposte (brotli se installato, altrimenti gzip)
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_MIMETYPES = {'application/json', 'text/html', 'text/plain', 'text/css', 'application/javascript'}
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Risorse statiche della pagina: compresse una volta all'avvio al livello massimo
+ASSET_MAX_AGE = 31536000        # un anno: l'URL contiene l'hash del contenuto
+ASSET_HASH_LENGTH = 12
+ASSET_GZIP_LEVEL = 9
+ASSET_BROTLI_QUALITY = 11
+
+# Paginazione di trascrizione e commenti (caricamento lazy dalla pagina)
+TRANSCRIPT_PAGE_CHARS = 20000
+COMMENTS_PER_PAGE = 20
+
+# Commenti inviati per ogni evento dello stream SSE
+COMMENTS_CHUNK = 10
+
+# Pipeline commenti: limite massimo per richiesta e filtri di default.
+# I commenti di 10 caratteri o meno ("first!", emoji) non aggiungono nulla.
+COMMENTS_MAX_LIMIT = 5000
+DEFAULT_MIN_LENGTH = 11
+DEFAULT_MIN_VOTES = 0
+
+# Dati locali (cache, ecc.) accanto al file
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.analyzetube')
+
+# yt-dlp "leggero": servono solo titolo e tracce dei sottotitoli, quindi
+# niente elaborazione dei formati, niente manifest DASH/HLS e niente player JS
+YDL_LEAN = True
+YDL_CACHE_DIR = os.path.join(DATA_DIR, 'yt-dlp')
+YDL_LEAN_ARGS = {'youtube': {'skip': ['dash', 'hls'], 'player_skip': ['js']}}
+
+# Campi che si possono chiedere a /api/extract con fields= (default: tutti)
+EXTRACT_FIELDS = ('title', 'transcript', 'comments')
+
+# Cache dei risultati: LRU in memoria + SQLite su disco
+CACHE_ENABLED = True
+CACHE_DB = os.path.join(DATA_DIR, 'cache.sqlite3')
+CACHE_MEMORY_ITEMS = 256
+CACHE_DISK_MAX_BYTES = 256 * 1024 * 1024
+INFO_TTL = 24 * 3600        # titolo e trascrizione cambiano raramente
+COMMENTS_TTL = 30 * 60      # i commenti invece si muovono in fretta
+CACHE_STALE_GRACE = 7 * 24 * 3600   # le voci scadute restano come riserva se YouTube non risponde
+
+# Archivio locale dei commenti (per video e ID commento). Con comments_mode=refresh
+# si scaricano solo i commenti più recenti fino al segno dell'ultimo refresh, più
+# la prima pagina dei più votati per aggiornare i like
+COMMENT_STORE_ENABLED = True
+COMMENT_STORE_DB = os.path.join(DATA_DIR, 'comments.sqlite3')
+COMMENT_STORE_BATCH = 100
+COMMENT_MODES = ('popular', 'refresh')
+COMMENTS_KNOWN_STOP = 3     # commenti più vecchi del segno, consecutivi, che chiudono il refresh
+COMMENTS_TOP_REFRESH = 20   # una pagina di youtube-comment-downloader
+COMMENTS_SEED = 20          # primo refresh senza segno: una pagina dei più recenti
+DEFAULT_COMMENTS_LATEST = 20
+
+# Indice di ricerca full-text (SQLite FTS5, altrimenti LIKE) su trascrizioni e commenti estratti
+SEARCH_ENABLED = True
+SEARCH_DB = os.path.join(DATA_DIR, 'search.sqlite3')
+SEARCH_PASSAGE_CHARS = 300      # i segmenti dei sottotitoli si indicizzano a gruppi di questa lunghezza
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+
+# Metriche: limiti superiori (secondi) dei bucket degli istogrammi
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+# Limite alle richieste verso YouTube (condiviso da yt-dlp, sottotitoli e commenti)
+YOUTUBE_RATE = 5.0              # richieste al secondo in media
+YOUTUBE_BURST = 10              # richieste consecutive consentite senza attesa
+YOUTUBE_MAX_WAIT = 20           # secondi massimi di attesa per un turno
+BACKOFF_BASE = 1.0              # primo rallentamento dopo un 429/5xx, raddoppia a ogni errore
+BACKOFF_MAX = 60.0
+BREAKER_THRESHOLD = 5           # errori consecutivi che aprono il circuito
+BREAKER_COOLDOWN = 60           # secondi a circuito aperto prima di riprovare
+
+# Job asincroni: coda su SQLite elaborata da un pool di thread
+JOBS_DB = os.path.join(DATA_DIR, 'jobs.sqlite3')
+JOB_WORKERS = 4
+JOB_POLL_INTERVAL = 1.0         # secondi tra due controlli della coda
+JOB_STALE_AFTER = 5 * 60        # un job "running" fermo da così tanto viene ripreso
+JOB_RETENTION = 24 * 3600       # i job conclusi vengono conservati per un giorno
+
+# Prefetch delle watchlist: canali e playlist controllati periodicamente; i
+# video nuovi vengono estratti in anticipo nella cache, a bassa priorità
+PREFETCH_ENABLED = True
+PREFETCH_DB = os.path.join(DATA_DIR, 'prefetch.sqlite3')
+PREFETCH_INTERVAL = 15 * 60     # secondi tra due controlli dello stesso canale/playlist
+PREFETCH_RECENT = 10            # ultimi video considerati per canale/playlist
+PREFETCH_WORKERS = 1            # estrazioni di prefetch in parallelo (per processo)
+PREFETCH_PER_HOUR = 60          # budget: video estratti all'ora al massimo (per processo)
+PREFETCH_MIN_TOKENS = 0.5       # quota del burst verso YouTube da lasciare alle richieste degli utenti
+PREFETCH_BUSY_INFLIGHT = 2      # con almeno tante estrazioni in corso il prefetch aspetta
+PREFETCH_IDLE_WAIT = 5.0        # secondi tra due controlli quando il prefetch aspetta
+
+# Esportazione binaria: 'arrow' (file IPC di pyarrow) o 'packed' (record con
+# prefisso di lunghezza, msgpack se installato); entrambi leggibili con mmap
+EXPORT_FORMATS = ('arrow', 'packed')
+EXPORT_MAX_IDS = 1000           # video per richiesta a /api/export (il comando dump non ha limiti)
+EXPORT_MAGIC = b'ATUBEPK1'
+
+# Server: processi worker, thread per processo e attesa massima alla chiusura
+SERVE_HOST = '0.0.0.0'
+SERVE_PORT = 5002
+SERVE_WORKERS = 2
+SERVE_THREADS = 8
+SERVE_TIMEOUT = 120             # secondi senza risposta prima che gunicorn riavvii un worker
+DRAIN_TIMEOUT = 30              # secondi concessi alle estrazioni in corso alla chiusura
+
+# Fasi CPU (parsing dei sottotitoli, costruzione dei prompt): nel thread della
+# richiesta ('thread') o in un pool di processi ('process'), che sotto carico
+# usa più core invece di contendersi il GIL. Al pool arrivano dati grezzi (i
+# byte della traccia, testo e indice dei segmenti) e il lavoro si fa lì.
+# extract_info resta nei thread: è quasi tutto rete e deve passare dal limite
+# verso YouTube e dalle istanze riusate di questo processo. Anche la
+# formattazione dei commenti resta nei thread: procede a flusso mentre le
+# pagine arrivano e costa meno del pickle dei commenti verso un altro processo
+CPU_STAGES = ('subtitles', 'prompt')
+CPU_MODES = {stage: 'thread' for stage in CPU_STAGES}
+CPU_WORKERS = os.cpu_count() or 2   # processi del pool, per processo worker
+CPU_START_METHOD = 'spawn'          # fork con thread già attivi non è sicuro
+
+# Benchmark offline: risposte registrate (o sintetiche) servite da un server locale
+FIXTURES_DIR = os.path.join(DATA_DIR, 'fixtures')
+BENCH_DIR = os.path.join(DATA_DIR, 'bench')
+BENCH_COMMENTS_PAGE = 20        # commenti per pagina, come youtube-comment-downloader
+BENCH_SYNTHETIC_MINUTES = (5, 30, 120)
+BENCH_SYNTHETIC_COMMENTS = 500
 
-        .container {
-            max-width: 900px;
-            margin: 0 auto;
-            background: white;
-            border-radius: 20px;
-            box-shadow: 0 20px 60px rgba(0, 0, 0, 0.3);
-            overflow: hidden;
-        }
+# ============================================================================
+# HTML/CSS/JS INCORPORATI
+# ============================================================================
 
-        header {
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            padding: 40px 30px;
-            text-align: center;
-        }
+# CSS e JS vengono serviti come risorse separate, con l'hash del contenuto
+# nell'URL (vedi RISORSE STATICHE)
+PAGE_CSS = '''* { margin: 0; padding: 0; box-sizing: border-box; }
+
+body {
+    font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
+    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+    min-height: 100vh;
+    padding: 20px;
+}
+
+.container {
+    max-width: 900px;
+    margin: 0 auto;
+    background: white;
+    border-radius: 20px;
+    box-shadow: 0 20px 60px rgba(0, 0, 0, 0.3);
+    overflow: hidden;
+}
+
+header {
+    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+    color: white;
+    padding: 40px 30px;
+    text-align: center;
+}
+
+header h1 { font-size: 2.5em; margin-bottom: 10px; }
+.subtitle { font-size: 1.1em; opacity: 0.9; }
+main { padding: 40px 30px; }
+.input-section { margin-bottom: 30px; }
+
+label {
+    display: block;
+    margin-bottom: 10px;
+    font-weight: 600;
+    color: #555;
+}
+
+input[type="text"] {
+    width: 100%;
+    padding: 15px;
+    font-size: 16px;
+    border: 2px solid #e0e0e0;
+    border-radius: 10px;
+    transition: border-color 0.3s;
+}
+
+input[type="text"]:focus {
+    outline: none;
+    border-color: #667eea;
+}
+
+button {
+    width: 100%;
+    padding: 15px;
+    margin-top: 15px;
+    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+    color: white;
+    border: none;
+    border-radius: 10px;
+    font-size: 16px;
+    font-weight: 600;
+    cursor: pointer;
+    transition: transform 0.2s;
+}
+
+button:hover:not(:disabled) { transform: translateY(-2px); }
+button:disabled { opacity: 0.6; cursor: not-allowed; }
+
+.loading { text-align: center; padding: 40px; }
+
+.spinner {
+    border: 4px solid #f3f3f3;
+    border-top: 4px solid #667eea;
+    border-radius: 50%;
+    width: 50px;
+    height: 50px;
+    animation: spin 1s linear infinite;
+    margin: 0 auto 20px;
+}
+
+@keyframes spin {
+    0% { transform: rotate(0deg); }
+    100% { transform: rotate(360deg); }
+}
+
+.hidden { display: none !important; }
+
+.error {
+    background: #fee;
+    border: 2px solid #fcc;
+    color: #c33;
+    padding: 15px;
+    border-radius: 10px;
+    margin-bottom: 20px;
+}
+
+.results { animation: fadeIn 0.5s; }
+
+@keyframes fadeIn {
+    from { opacity: 0; transform: translateY(20px); }
+    to { opacity: 1; transform: translateY(0); }
+}
+
+.video-info {
+    margin-bottom: 30px;
+    padding: 20px;
+    background: #f8f9fa;
+    border-radius: 10px;
+}
+
+.video-info h2 { color: #333; margin-bottom: 15px; }
+.stats { display: flex; gap: 20px; flex-wrap: wrap; }
+
+.stats span {
+    background: white;
+    padding: 8px 15px;
+    border-radius: 20px;
+    font-size: 0.9em;
+    color: #666;
+}
+
+.chatgpt-section {
+    margin-bottom: 30px;
+    padding: 25px;
+    background: linear-gradient(135deg, #10a37f 0%, #0d8a6a 100%);
+    border-radius: 10px;
+    color: white;
+}
+
+.chatgpt-section h3 { margin-bottom: 10px; }
+.instruction { margin-bottom: 15px; opacity: 0.95; }
+
+.prompt-box textarea {
+    width: 100%;
+    min-height: 200px;
+    padding: 15px;
+    border: 2px solid rgba(255, 255, 255, 0.3);
+    border-radius: 8px;
+    font-family: 'Courier New', monospace;
+    font-size: 13px;
+    resize: vertical;
+    background: rgba(255, 255, 255, 0.95);
+    color: #333;
+}
+
+.copy-btn {
+    margin-top: 10px;
+    background: white;
+    color: #10a37f;
+    padding: 12px 20px;
+    width: auto;
+}
+
+.chatgpt-link { margin-top: 15px; text-align: center; }
+
+.chatgpt-button {
+    display: inline-block;
+    padding: 12px 30px;
+    background: rgba(255, 255, 255, 0.2);
+    color: white;
+    text-decoration: none;
+    border-radius: 8px;
+    font-weight: 600;
+    transition: background 0.3s;
+}
+
+.chatgpt-button:hover { background: rgba(255, 255, 255, 0.3); }
+
+.details-section {
+    margin-bottom: 20px;
+    border: 2px solid #e0e0e0;
+    border-radius: 10px;
+    overflow: hidden;
+}
+
+summary {
+    padding: 15px 20px;
+    background: #f8f9fa;
+    cursor: pointer;
+    font-weight: 600;
+    color: #555;
+    user-select: none;
+}
+
+summary:hover { background: #e9ecef; }
+
+.content-box {
+    padding: 20px;
+    max-height: 400px;
+    overflow-y: auto;
+    line-height: 1.6;
+    color: #555;
+    white-space: pre-wrap;
+}
+
+.more-btn {
+    margin: 0 20px 20px;
+    padding: 8px 15px;
+    width: auto;
+    font-size: 0.9em;
+}
+
+footer {
+    text-align: center;
+    padding: 20px;
+    background: #f8f9fa;
+    color: #666;
+}
+
+@media (max-width: 600px) {
+    header h1 { font-size: 2em; }
+    main { padding: 20px 15px; }
+}
+'''
+
+PAGE_JS = '''async function analyzeVideo() {
+    const urlInput = document.getElementById('youtube-url');
+    const url = urlInput.value.trim();
+
+    if (!url) {
+        showError('Please enter a valid YouTube URL');
+        return;
+    }
 
-        header h1 { font-size: 2.5em; margin-bottom: 10px; }
-        .subtitle { font-size: 1.1em; opacity: 0.9; }
-        main { padding: 40px 30px; }
-        .input-section { margin-bottom: 30px; }
+    hideError();
+    hideResults();
+    showLoading('Extracting transcript and comments...');
+    disableButton(true);
+
+    try {
+        // Con SSE titolo e trascrizione compaiono prima dei commenti
+        const data = window.EventSource ? await streamVideo(url) : await extractWithJob(url);
+        displayResults(data);
+
+    } catch (error) {
+        console.error('Error:', error);
+        showError(error.message);
+    } finally {
+        hideLoading();
+        disableButton(false);
+    }
+}
 
-        label {
-            display: block;
-            margin-bottom: 10px;
-            font-weight: 600;
-            color: #555;
-        }
+function streamVideo(url) {
+    return new Promise((resolve, reject) => {
+        // Lo stream è "lazy": trascrizione e commenti si caricano a pagine all'apertura dei pannelli
+        const data = { title: '' };
+        const source = new EventSource('/api/extract/stream?lazy=1&url=' + encodeURIComponent(url));
+        const on = (name, handler) => source.addEventListener(name, event => handler(JSON.parse(event.data)));
+        let finished = false;
 
-        input[type="text"] {
-            width: 100%;
-            padding: 15px;
-            font-size: 16px;
-            border: 2px solid #e0e0e0;
-            border-radius: 10px;
-            transition: border-color 0.3s;
-        }
+        const showPartial = () => {
+            document.getElementById('results').classList.remove('hidden');
+            document.getElementById('chatgpt-prompt').value = 'Waiting for the extraction to finish...';
+        };
 
-        input[type="text"]:focus {
-            outline: none;
-            border-color: #667eea;
-        }
+        on('metadata', payload => {
+            data.title = payload.title;
+            data.video_id = payload.video_id;
+            document.getElementById('video-title').textContent = data.title;
+            showPartial();
+            showLoading('Title received, extracting transcript and comments...');
+        });
 
-        button {
-            width: 100%;
-            padding: 15px;
-            margin-top: 15px;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            border: none;
-            border-radius: 10px;
-            font-size: 16px;
-            font-weight: 600;
-            cursor: pointer;
-            transition: transform 0.2s;
-        }
+        on('transcript', payload => {
+            data.transcriptLength = payload.length;
+            document.getElementById('transcript-length').textContent = `Transcript: ${payload.length} characters`;
+            showPartial();
+        });
 
-        button:hover:not(:disabled) { transform: translateY(-2px); }
-        button:disabled { opacity: 0.6; cursor: not-allowed; }
+        on('comments', payload => {
+            if (payload.count) {
+                document.getElementById('comments-count').textContent = `Comments: ${payload.count} loaded`;
+            }
+            showPartial();
+        });
 
-        .loading { text-align: center; padding: 40px; }
+        on('error', payload => console.warn(`Extraction of ${payload.leg} failed:`, payload.error));
 
-        .spinner {
-            border: 4px solid #f3f3f3;
-            border-top: 4px solid #667eea;
-            border-radius: 50%;
-            width: 50px;
-            height: 50px;
-            animation: spin 1s linear infinite;
-            margin: 0 auto 20px;
-        }
+        on('done', payload => {
+            finished = true;
+            source.close();
+            if (payload.error) {
+                reject(new Error(payload.error));
+            } else {
+                resolve(data);
+            }
+        });
 
-        @keyframes spin {
-            0% { transform: rotate(0deg); }
-            100% { transform: rotate(360deg); }
-        }
+        source.onerror = () => {
+            if (!finished) {
+                source.close();
+                reject(new Error('Connection lost during extraction'));
+            }
+        };
 
-        .hidden { display: none !important; }
+        resetPanels(null);
+    });
+}
 
-        .error {
-            background: #fee;
-            border: 2px solid #fcc;
-            color: #c33;
-            padding: 15px;
-            border-radius: 10px;
-            margin-bottom: 20px;
-        }
+async function extractWithJob(url) {
+    const response = await fetch('/api/jobs', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ url: url })
+    });
 
-        .results { animation: fadeIn 0.5s; }
+    const job = await response.json();
 
-        @keyframes fadeIn {
-            from { opacity: 0; transform: translateY(20px); }
-            to { opacity: 1; transform: translateY(0); }
-        }
+    if (!response.ok) {
+        throw new Error(job.error || 'Error during extraction');
+    }
 
-        .video-info {
-            margin-bottom: 30px;
-            padding: 20px;
-            background: #f8f9fa;
-            border-radius: 10px;
-        }
+    return waitForJob(job.status_url);
+}
 
-        .video-info h2 { color: #333; margin-bottom: 15px; }
-        .stats { display: flex; gap: 20px; flex-wrap: wrap; }
+const STAGE_LABELS = {
+    queued: 'Waiting in queue...',
+    starting: 'Extracting transcript and comments...',
+    info: 'Transcript extracted, waiting for comments...',
+    comments: 'Comments extracted, waiting for transcript...'
+};
 
-        .stats span {
-            background: white;
-            padding: 8px 15px;
-            border-radius: 20px;
-            font-size: 0.9em;
-            color: #666;
-        }
+async function waitForJob(statusUrl) {
+    // Interroga lo stato del job finché non è concluso
+    while (true) {
+        const response = await fetch(statusUrl);
+        const job = await response.json();
 
-        .chatgpt-section {
-            margin-bottom: 30px;
-            padding: 25px;
-            background: linear-gradient(135deg, #10a37f 0%, #0d8a6a 100%);
-            border-radius: 10px;
-            color: white;
+        if (!response.ok || job.status === 'failed') {
+            throw new Error(job.error || 'Error during extraction');
         }
-
-        .chatgpt-section h3 { margin-bottom: 10px; }
-        .instruction { margin-bottom: 15px; opacity: 0.95; }
-
-        .prompt-box textarea {
-            width: 100%;
-            min-height: 200px;
-            padding: 15px;
-            border: 2px solid rgba(255, 255, 255, 0.3);
-            border-radius: 8px;
-            font-family: 'Courier New', monospace;
-            font-size: 13px;
-            resize: vertical;
-            background: rgba(255, 255, 255, 0.95);
-            color: #333;
+        if (job.status === 'done') {
+            return job.result;
         }
 
-        .copy-btn {
-            margin-top: 10px;
-            background: white;
-            color: #10a37f;
-            padding: 12px 20px;
-            width: auto;
-        }
+        showLoading(STAGE_LABELS[job.stage] || 'Extracting data...');
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+}
+
+function displayResults(data) {
+    const hasText = typeof data.transcript === 'string';
+    const length = hasText ? data.transcript.length : data.transcriptLength;
+    document.getElementById('video-title').textContent = data.title;
+    document.getElementById('transcript-length').textContent = `Transcript: ${length} characters`;
+    document.getElementById('comments-count').textContent = `Comments extracted`;
+
+    document.getElementById('chatgpt-prompt').value = 'Building prompt...';
+    resetPanels(data.video_id);
+    if (hasText) {
+        // Risultato completo (job asincrono): i pannelli non vanno caricati a pagine
+        panels.transcriptLoaded = panels.commentsLoaded = true;
+        document.getElementById('transcript-content').textContent = data.transcript;
+        document.getElementById('comments-content').textContent = data.comments;
+    }
 
-        .chatgpt-link { margin-top: 15px; text-align: center; }
-
-        .chatgpt-button {
-            display: inline-block;
-            padding: 12px 30px;
-            background: rgba(255, 255, 255, 0.2);
-            color: white;
-            text-decoration: none;
-            border-radius: 8px;
-            font-weight: 600;
-            transition: background 0.3s;
-        }
+    // Svuota il campo URL per permettere un nuovo inserimento
+    document.getElementById('youtube-url').value = '';
+
+    document.getElementById('results').classList.remove('hidden');
+    document.getElementById('results').scrollIntoView({ behavior: 'smooth' });
+
+    loadPrompt(data);
+}
+
+const panels = { videoId: null };
+
+function resetPanels(videoId) {
+    Object.assign(panels, {
+        videoId: videoId,
+        transcriptOffset: 0,
+        commentsPage: 1,
+        transcriptLoaded: false,
+        commentsLoaded: false
+    });
+    for (const name of ['transcript', 'comments']) {
+        document.getElementById(`${name}-content`).textContent = '';
+        document.getElementById(`${name}-more`).classList.add('hidden');
+        document.getElementById(`${name}-panel`).open = false;
+    }
+}
+
+async function fetchPage(params) {
+    const query = new URLSearchParams({ url: panels.videoId, ...params });
+    const response = await fetch('/api/extract?' + query);
+    const page = await response.json();
+    if (!response.ok) {
+        throw new Error(page.error || 'Error while loading');
+    }
+    return page;
+}
+
+async function loadTranscriptPage() {
+    const content = document.getElementById('transcript-content');
+    const more = document.getElementById('transcript-more');
+    panels.transcriptLoaded = true;
+    more.classList.add('hidden');
+
+    try {
+        const page = await fetchPage({ transcript_offset: panels.transcriptOffset });
+        content.append(page.transcript);
+        panels.transcriptOffset = page.transcript_next_offset;
+        more.classList.toggle('hidden', page.transcript_next_offset === null);
+    } catch (error) {
+        content.append(`\\n${error.message}`);
+    }
+}
+
+async function loadCommentsPage() {
+    const content = document.getElementById('comments-content');
+    const more = document.getElementById('comments-more');
+    panels.commentsLoaded = true;
+    more.classList.add('hidden');
+
+    try {
+        const page = await fetchPage({ comments_page: panels.commentsPage });
+        content.append(page.comments);
+        panels.commentsPage = page.comments_page + 1;
+        more.classList.toggle('hidden', page.comments_page >= page.comments_pages);
+    } catch (error) {
+        content.append(`\\n${error.message}`);
+    }
+}
 
-        .chatgpt-button:hover { background: rgba(255, 255, 255, 0.3); }
+document.getElementById('transcript-panel').addEventListener('toggle', event => {
+    if (event.target.open && panels.videoId && !panels.transcriptLoaded) {
+        loadTranscriptPage();
+    }
+});
 
-        .details-section {
-            margin-bottom: 20px;
-            border: 2px solid #e0e0e0;
-            border-radius: 10px;
-            overflow: hidden;
-        }
+document.getElementById('comments-panel').addEventListener('toggle', event => {
+    if (event.target.open && panels.videoId && !panels.commentsLoaded) {
+        loadCommentsPage();
+    }
+});
 
-        summary {
-            padding: 15px 20px;
-            background: #f8f9fa;
-            cursor: pointer;
-            font-weight: 600;
-            color: #555;
-            user-select: none;
-        }
+async function loadPrompt(data) {
+    // Il prompt viene costruito dal server, entro il budget di token
+    const promptBox = document.getElementById('chatgpt-prompt');
 
-        summary:hover { background: #e9ecef; }
+    try {
+        const response = await fetch('/api/prompt', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ url: data.video_id })
+        });
+
+        const result = await response.json();
 
-        .content-box {
-            padding: 20px;
-            max-height: 400px;
-            overflow-y: auto;
-            line-height: 1.6;
-            color: #555;
-            white-space: pre-wrap;
+        if (!response.ok) {
+            throw new Error(result.error || 'Error while building the prompt');
         }
 
-        footer {
-            text-align: center;
-            padding: 20px;
-            background: #f8f9fa;
-            color: #666;
+        promptBox.value = result.prompt;
+        let summary = `Prompt: ~${result.tokens.total} tokens`;
+        if (result.transcript_truncated) {
+            summary += ' (transcript condensed)';
         }
+        document.getElementById('comments-count').textContent =
+            `Comments: ${result.comments_included}/${result.comments_total} in prompt · ${summary}`;
 
-        @media (max-width: 600px) {
-            header h1 { font-size: 2em; }
-            main { padding: 20px 15px; }
+    } catch (error) {
+        console.error('Error:', error);
+        promptBox.value = '';
+        showError(error.message);
+    }
+}
+
+function copyPrompt() {
+    const promptText = document.getElementById('chatgpt-prompt');
+    promptText.select();
+    promptText.setSelectionRange(0, 99999);
+
+    navigator.clipboard.writeText(promptText.value).then(() => {
+        showCopySuccess();
+    }).catch(() => {
+        document.execCommand('copy');
+        showCopySuccess();
+    });
+}
+
+function copyPromptAndOpen(event) {
+    const promptText = document.getElementById('chatgpt-prompt');
+
+    // Copia il prompt
+    promptText.select();
+    promptText.setSelectionRange(0, 99999);
+
+    try {
+        if (navigator.clipboard && navigator.clipboard.writeText) {
+            navigator.clipboard.writeText(promptText.value);
+        } else {
+            document.execCommand('copy');
         }
-    </style>
+    } catch (err) {
+        console.error('Errore durante la copia:', err);
+    }
+
+    // Il link si aprirà normalmente grazie al target="_blank"
+}
+
+function showCopySuccess() {
+    const btn = event.target;
+    const originalText = btn.textContent;
+    btn.textContent = '✓ Copied!';
+    btn.style.background = '#4caf50';
+
+    setTimeout(() => {
+        btn.textContent = originalText;
+        btn.style.background = '';
+    }, 2000);
+}
+
+function showLoading(text) {
+    document.getElementById('loading-text').textContent = text;
+    document.getElementById('loading').classList.remove('hidden');
+}
+
+function hideLoading() {
+    document.getElementById('loading').classList.add('hidden');
+}
+
+function showError(message) {
+    const errorDiv = document.getElementById('error');
+    errorDiv.textContent = '❌ ' + message;
+    errorDiv.classList.remove('hidden');
+    errorDiv.scrollIntoView({ behavior: 'smooth' });
+}
+
+function hideError() {
+    document.getElementById('error').classList.add('hidden');
+}
+
+function hideResults() {
+    document.getElementById('results').classList.add('hidden');
+}
+
+function disableButton(disabled) {
+    document.getElementById('analyze-btn').disabled = disabled;
+}
+
+document.getElementById('youtube-url').addEventListener('keypress', function(e) {
+    if (e.key === 'Enter') {
+        analyzeVideo();
+    }
+});
+'''
+
+HTML_TEMPLATE = '''<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>AnalyzeTube - YouTube Video Analysis</title>
+    <link rel="stylesheet" href="__CSS_URL__">
 </head>
 <body>
     <div class="container">
@@ -281,14 +894,16 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
                     </div>
                 </div>
 
-                <details class="details-section">
+                <details id="transcript-panel" class="details-section">
                     <summary>Full Transcript</summary>
                     <div id="transcript-content" class="content-box"></div>
+                    <button id="transcript-more" class="more-btn hidden" onclick="loadTranscriptPage()">Load more</button>
                 </details>
 
-                <details class="details-section">
+                <details id="comments-panel" class="details-section">
                     <summary>Extracted Comments</summary>
                     <div id="comments-content" class="content-box"></div>
+                    <button id="comments-more" class="more-btn hidden" onclick="loadCommentsPage()">Load more</button>
                 </details>
             </div>
         </main>
@@ -298,181 +913,888 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
         </footer>
     </div>
 
-    <script>
-        async function analyzeVideo() {
-            const urlInput = document.getElementById('youtube-url');
-            const url = urlInput.value.trim();
-
-            if (!url) {
-                showError('Please enter a valid YouTube URL');
-                return;
-            }
-
-            hideError();
-            hideResults();
-            showLoading('Extracting transcript and comments...');
-            disableButton(true);
-
-            try {
-                const response = await fetch('/api/extract', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ url: url })
-                });
+    <script src="__JS_URL__"></script>
+</body>
+</html>'''
 
-                const data = await response.json();
+# ============================================================================
+# METRICHE E TEMPI PER FASE
+# ============================================================================
 
-                if (!response.ok) {
-                    throw new Error(data.error || 'Error during extraction');
-                }
+class Metrics:
+    """Contatori e istogrammi in memoria, esportati nel formato testuale di Prometheus
+
+    Ogni metrica va dichiarata con describe(); le etichette si passano come
+    argomenti con nome. I valori sono per processo.
+    """
+
+    def __init__(self, buckets=METRICS_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._meta = {}     # nome -> (tipo, descrizione)
+        self._values = {}   # nome -> {etichette: valore o [conteggi per bucket, somma, totale]}
+
+    def describe(self, name, kind, help_text):
+        self._meta[name] = (kind, help_text)
+        self._values.setdefault(name, {})
+
+    def inc(self, name, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._values[name]
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._values[name]
+            entry = series.get(key)
+            if entry is None:
+                entry = series[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect_right(self.buckets, value - 1e-12)
+            if index < len(self.buckets):
+                entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        """Testo per /metrics (formato di esposizione 0.0.4)"""
+        lines = []
+        with self._lock:
+            for name, (kind, help_text) in self._meta.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for key, value in sorted(self._values[name].items()):
+                    if kind != 'histogram':
+                        lines.append(f'{name}{_labels(key)} {value}')
+                        continue
+                    counts, total, count = value
+                    cumulative = 0
+                    for bound, bucket in zip(self.buckets, counts):
+                        cumulative += bucket
+                        lines.append(f'{name}_bucket{_labels(key, le=bound)} {cumulative}')
+                    lines.append(f'{name}_bucket{_labels(key, le="+Inf")} {count}')
+                    lines.append(f'{name}_sum{_labels(key)} {round(total, 6)}')
+                    lines.append(f'{name}_count{_labels(key)} {count}')
+        return '\n'.join(lines) + '\n'
+
+def _labels(key, **extra):
+    pairs = list(key) + list(extra.items())
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+metrics = Metrics()
+metrics.describe('analyzetube_stage_seconds', 'histogram', 'Durata delle fasi di estrazione')
+metrics.describe('analyzetube_http_request_seconds', 'histogram', 'Durata delle richieste HTTP servite')
+metrics.describe('analyzetube_http_requests_total', 'counter', 'Richieste HTTP servite per endpoint e stato')
+metrics.describe('analyzetube_youtube_requests_total', 'counter', 'Richieste HTTP verso YouTube per tipo e stato')
+metrics.describe('analyzetube_cache_lookups_total', 'counter', 'Letture della cache dei risultati per esito')
+metrics.describe('analyzetube_subtitle_attempts_total', 'counter', 'Download di tracce di sottotitoli per esito')
+metrics.describe('analyzetube_subtitle_results_total', 'counter', 'Scelta della trascrizione: prima traccia, ripiego o nessuna')
+metrics.describe('analyzetube_errors_total', 'counter', 'Rami di estrazione falliti per tipo di errore')
+metrics.describe('analyzetube_cpu_offload_total', 'counter', 'Fasi CPU eseguite nel pool di processi')
+metrics.describe('analyzetube_prefetch_total', 'counter', 'Video delle watchlist accodati ed estratti in anticipo')
+
+# Fasi della richiesta in corso, per l'header Server-Timing; la lista è
+# condivisa con i thread del pool che ricevono una copia del contesto
+_server_timing = contextvars.ContextVar('server_timing', default=None)
+
+@contextmanager
+def timed(stage):
+    """Misura una fase: istogramma analyzetube_stage_seconds e voce Server-Timing (usabile anche come decoratore)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.observe('analyzetube_stage_seconds', elapsed, stage=stage)
+        stages = _server_timing.get()
+        if stages is not None:
+            stages.append((stage, elapsed))
+
+def in_context(func):
+    """func da eseguire in un altro thread con il contesto corrente (fasi della richiesta)"""
+    return functools.partial(contextvars.copy_context().run, func)
+
+def count_error(leg, kind):
+    metrics.inc('analyzetube_errors_total', leg=leg, error=kind)
+
+def server_timing_header(stages, total):
+    """Header Server-Timing: fasi ripetute sommate, con il numero di ripetizioni"""
+    summary = OrderedDict()
+    for stage, elapsed in stages:
+        count, duration = summary.get(stage, (0, 0.0))
+        summary[stage] = (count + 1, duration + elapsed)
+
+    entries = [f'{stage};dur={duration * 1000:.1f}' + (f';desc="x{count}"' if count > 1 else '')
+               for stage, (count, duration) in summary.items()]
+    entries.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(entries)
 
-                displayResults(data);
+# ============================================================================
+# LIMITE VERSO YOUTUBE
+# ============================================================================
 
-            } catch (error) {
-                console.error('Error:', error);
-                showError(error.message);
-            } finally {
-                hideLoading();
-                disableButton(false);
+class YouTubeThrottled(Exception):
+    """YouTube sta limitando le richieste (o il circuito è aperto)"""
+
+class OutboundLimiter:
+    """Token bucket con backoff adattivo e circuit breaker per le richieste verso YouTube
+
+    Ogni richiesta prende un token (rate al secondo, fino a burst accumulati).
+    Un 429 o un 5xx impone a tutti una pausa esponenziale con jitter; dopo
+    threshold errori consecutivi il circuito si apre e le richieste falliscono
+    subito con YouTubeThrottled per cooldown secondi, poi ne passa una di
+    prova: se va bene il circuito si richiude.
+    """
+
+    def __init__(self, rate=YOUTUBE_RATE, burst=YOUTUBE_BURST, backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX,
+                 threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.rate = rate
+        self.burst = burst
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._refilled = time.monotonic()
+        self._backoff_until = 0.0
+        self._failures = 0          # errori consecutivi
+        self._state = 'closed'      # 'closed', 'open' o 'half_open'
+        self._opened = 0.0          # apertura del circuito o avvio della richiesta di prova
+        self.counts = {'allowed': 0, 'throttled': 0, 'rejected': 0, 'waited_ms': 0.0}
+
+    def acquire(self, max_wait=YOUTUBE_MAX_WAIT):
+        """Attende il turno per una richiesta; YouTubeThrottled se il circuito è aperto o l'attesa è troppa"""
+        deadline = time.monotonic() + max_wait
+        waited = 0.0
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if self._state != 'closed':
+                    if now - self._opened < self.cooldown:
+                        self.counts['rejected'] += 1
+                        raise YouTubeThrottled(
+                            f"YouTube sta limitando le richieste, riprova tra {self.cooldown - (now - self._opened):.0f}s"
+                        )
+                    # Cooldown finito: passa una sola richiesta di prova
+                    self._state, self._opened = 'half_open', now
+                    self._take(waited)
+                    return
+
+                self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+                self._refilled = now
+                delay = max(self._backoff_until - now, 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate)
+                if delay <= 0:
+                    self._tokens -= 1
+                    self._take(waited)
+                    return
+                if now + delay > deadline:
+                    self.counts['rejected'] += 1
+                    raise YouTubeThrottled("Troppe richieste verso YouTube in coda, riprova più tardi")
+
+            time.sleep(delay)
+            waited += delay
+
+    def record(self, throttled):
+        """Esito di una richiesta: True se YouTube ha risposto 429/5xx o con un blocco"""
+        with self._lock:
+            now = time.monotonic()
+            if not throttled:
+                self._failures = 0
+                self._state = 'closed'
+                return
+
+            self._failures += 1
+            self.counts['throttled'] += 1
+            pause = min(self.backoff_max, self.backoff_base * 2 ** (self._failures - 1))
+            self._backoff_until = max(self._backoff_until, now + pause / 2 + random.uniform(0, pause / 2))
+            if self._state == 'half_open' or self._failures >= self.threshold:
+                self._state, self._opened = 'open', now
+
+    def stats(self):
+        """Stato del limitatore e del circuito"""
+        with self._lock:
+            now = time.monotonic()
+            return {
+                'state': self._state,
+                'tokens': round(min(self.burst, self._tokens + (now - self._refilled) * self.rate), 2),
+                'rate': self.rate,
+                'burst': self.burst,
+                'consecutive_failures': self._failures,
+                'backoff_remaining': round(max(0.0, self._backoff_until - now), 2),
+                'retry_in': round(max(0.0, self.cooldown - (now - self._opened)), 1) if self._state == 'open' else 0,
+                **{key: round(value, 1) for key, value in self.counts.items()},
             }
-        }
-
-        function displayResults(data) {
-            document.getElementById('video-title').textContent = data.title;
-            document.getElementById('transcript-length').textContent = `Transcript: ${data.transcript.length} characters`;
-            document.getElementById('comments-count').textContent = `Comments extracted`;
-
-            const prompt = generatePrompt(data);
-            document.getElementById('chatgpt-prompt').value = prompt;
-            document.getElementById('transcript-content').textContent = data.transcript;
-            document.getElementById('comments-content').textContent = data.comments;
-
-            // Svuota il campo URL per permettere un nuovo inserimento
-            document.getElementById('youtube-url').value = '';
-
-            document.getElementById('results').classList.remove('hidden');
-            document.getElementById('results').scrollIntoView({ behavior: 'smooth' });
-        }
 
-        function generatePrompt(data) {
-            return `Analyze this YouTube video and verify if what is said in the video is confirmed by user comments and if it has verifiable real-world evidence on the web.
-
-VIDEO TITLE: ${data.title}
-
-TRANSCRIPT:
-${data.transcript}
-
-COMMENTS:
-${data.comments}
-
----
-
-Please provide a comprehensive analysis that answers:
-
-1. What is the main topic of the video?
-
-2. Do user comments confirm or contradict what is said in the video?
+    def _take(self, waited):
+        self.counts['allowed'] += 1
+        self.counts['waited_ms'] += waited * 1000
+
+_youtube_limiter = OutboundLimiter()
+
+def is_throttled_response(response):
+    """429, 5xx o rimando alla pagina dei consensi: YouTube ci sta rallentando"""
+    host = (urlparse(response.url).hostname or '').lower()
+    return response.status_code == 429 or response.status_code >= 500 or host.startswith('consent.')
+
+def is_throttled_error(error):
+    """Errori di yt-dlp che indicano un rallentamento (429, verifica anti-bot, consensi)"""
+    message = str(error)
+    return any(marker in message for marker in ('HTTP Error 429', 'Too Many Requests', 'Sign in to confirm', 'consent.'))
+
+def youtube_endpoint(url):
+    """Tipo di richiesta verso YouTube, usato come nome della fase"""
+    path = urlparse(url).path
+    if path.startswith('/api/timedtext'):
+        return 'subtitle_http'
+    if path.startswith(('/youtubei/', '/comment_service_ajax')):
+        return 'comments_page'
+    if path.startswith('/watch'):
+        return 'watch_page'
+    return 'youtube_http'
+
+class ThrottledAdapter(HTTPAdapter):
+    """HTTPAdapter che passa dal limitatore verso YouTube prima di ogni tentativo
+
+    I retry sulle risposte 5xx li fa l'adapter e non urllib3: così ogni
+    tentativo prende un token, e il backoff e il circuit breaker del
+    limitatore vedono ogni errore. Anche le eccezioni (connessione, timeout)
+    vengono registrate come fallimenti.
+    """
+
+    def send(self, request, **kwargs):
+        endpoint = youtube_endpoint(request.url)
+        retry = request.method in ('GET', 'HEAD')
+
+        for attempt in range(HTTP_RETRIES + 1):
+            _youtube_limiter.acquire()
+            throttled, status = True, 'error'
+            try:
+                with timed(endpoint):
+                    response = super().send(request, **kwargs)
+                throttled, status = is_throttled_response(response), response.status_code
+            finally:
+                _youtube_limiter.record(throttled)
+                metrics.inc('analyzetube_youtube_requests_total', endpoint=endpoint, status=status)
+
+            if not retry or response.status_code < 500 or attempt == HTTP_RETRIES:
+                return response
+            response.close()    # il prossimo acquire attende il backoff impostato da record()
+
+def youtube_call(func, *args, **kwargs):
+    """Esegue una chiamata a yt-dlp come una richiesta del limitatore"""
+    _youtube_limiter.acquire()
+    try:
+        result = func(*args, **kwargs)
+    except yt_dlp.utils.DownloadError as e:
+        _youtube_limiter.record(is_throttled_error(e))
+        raise
+    _youtube_limiter.record(False)
+    return result
 
-3. Are there significant discrepancies between the video content and user reactions?
+# ============================================================================
+# RISORSE CONDIVISE
+# ============================================================================
 
-4. What is the general sentiment of the comments?
+class ResourcePool:
+    """Pool thread-safe di oggetti costosi da creare (YoutubeDL, downloader, ...)
+
+    acquire() presta un oggetto in uso esclusivo e al rilascio lo rimette
+    nel pool; oltre max_idle oggetti inattivi, quelli in più vengono chiusi.
+    Il numero di oggetti in uso non è limitato qui: il parallelismo è già
+    limitato dai pool di thread.
+    """
+
+    def __init__(self, factory, max_idle):
+        self._factory = factory
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._idle = []
+        self.created = 0
+        self.acquired = 0
+
+    @contextmanager
+    def acquire(self):
+        with self._lock:
+            self.acquired += 1
+            item = self._idle.pop() if self._idle else None
+
+        if item is None:
+            item = self._factory()
+            with self._lock:
+                self.created += 1
 
-5. **WEB VERIFICATION**: Search the web to see if the story told in the video has real and verifiable evidence. If you find relevant information, provide:
-   - Confirmation or refutation of the facts presented in the video
-   - Reliable sources that support or contradict the narrative
-   - Direct links to the sources found
-
-Limit your response to 300-400 words, including links to sources.
+        try:
+            yield item
+        finally:
+            with self._lock:
+                if len(self._idle) < self.max_idle:
+                    self._idle.append(item)
+                    item = None
+            if item is not None and hasattr(item, 'close'):
+                item.close()
+
+    def idle_items(self):
+        """Copia dell'elenco degli oggetti inattivi"""
+        with self._lock:
+            return list(self._idle)
+
+    def stats(self):
+        """Oggetti creati, prestiti e quota di prestiti serviti da un oggetto riutilizzato"""
+        with self._lock:
+            reused = self.acquired - self.created
+            return {
+                'created': self.created,
+                'acquired': self.acquired,
+                'reused': reused,
+                'idle': len(self._idle),
+                'reuse_rate': round(reused / self.acquired, 3) if self.acquired else None,
+            }
 
-**IMPORTANT**: Please respond in your default chat language settings (not necessarily in English).`;
-        }
+def _tune_session(session):
+    """Monta sulla sessione un adapter con pool di connessioni ampio, retry con backoff e limitatore
+
+    urllib3 ripete solo gli errori di connessione: le risposte 5xx le ripete
+    ThrottledAdapter, passando ogni volta dal limitatore.
+    """
+    retries = Retry(
+        total=HTTP_RETRIES,
+        backoff_factor=HTTP_BACKOFF,
+        status_forcelist=(),
+        allowed_methods=('GET', 'HEAD'),
+    )
+    adapter = ThrottledAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_SIZE,
+                               max_retries=retries)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def _connection_stats(sessions):
+    """Richieste e nuove connessioni aperte dai pool urllib3 delle sessioni"""
+    requests_count, connections = 0, 0
+    for session in sessions:
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    requests_count += pool.num_requests
+                    connections += pool.num_connections
+
+    return {
+        'requests': requests_count,
+        'connections_opened': connections,
+        'reuse_rate': round(1 - connections / requests_count, 3) if requests_count else None,
+    }
 
-        function copyPrompt() {
-            const promptText = document.getElementById('chatgpt-prompt');
-            promptText.select();
-            promptText.setSelectionRange(0, 99999);
-
-            navigator.clipboard.writeText(promptText.value).then(() => {
-                showCopySuccess();
-            }).catch(() => {
-                document.execCommand('copy');
-                showCopySuccess();
-            });
-        }
+def _new_comment_downloader():
+    """youtube-comment-downloader usa una propria sessione: la si configura come quella condivisa"""
+    downloader = comment_downloader.YoutubeCommentDownloader()
+    _tune_session(downloader.session)
+    return downloader
+
+def _new_youtube_dl(ydl_opts):
+    """Istanza YoutubeDL; le classi in _ydl_extractors (es. benchmark) precedono gli estrattori di yt-dlp"""
+    if not _ydl_extractors:
+        return yt_dlp.YoutubeDL(ydl_opts)
+    ydl = yt_dlp.YoutubeDL(ydl_opts, auto_init=False)
+    for extractor in _ydl_extractors:
+        ydl.add_info_extractor(extractor())     # un'istanza per YoutubeDL: non sono thread-safe
+    ydl.add_default_info_extractors()
+    return ydl
+
+_http_session = None
+_ydl_pools = {}
+_ydl_extractors = ()
+_comment_downloaders = ResourcePool(_new_comment_downloader, COMMENT_DOWNLOADER_POOL_SIZE)
+_resources_lock = threading.Lock()
+
+def get_http_session():
+    """Sessione requests condivisa (keep-alive, pool di connessioni, retry)"""
+    global _http_session
+    if _http_session is None:
+        with _resources_lock:
+            if _http_session is None:
+                _http_session = _tune_session(requests.Session())
+    return _http_session
+
+def ydl_pool(name, ydl_opts):
+    """Pool di istanze YoutubeDL con le stesse opzioni, identificato da name
+
+    Una YoutubeDL non è thread-safe, ma può eseguire più extract_info di
+    seguito: ogni istanza viene prestata a un solo thread alla volta e
+    conserva tra una richiesta e l'altra estrattori già inizializzati.
+    """
+    with _resources_lock:
+        pool = _ydl_pools.get(name)
+        if pool is None:
+            pool = _ydl_pools[name] = ResourcePool(lambda: _new_youtube_dl(ydl_opts), YDL_POOL_SIZE)
+        return pool
+
+def resource_stats():
+    """Statistiche di riutilizzo di sessioni, istanze YoutubeDL e downloader"""
+    with _resources_lock:
+        ydl = {name: pool.stats() for name, pool in _ydl_pools.items()}
+        sessions = [_http_session] if _http_session is not None else []
+
+    return {
+        'http_session': _connection_stats(sessions),
+        'youtube_dl': ydl,
+        'comment_downloaders': _comment_downloaders.stats(),
+        'comment_connections': _connection_stats(d.session for d in _comment_downloaders.idle_items()),
+        'lazy_imports': {module.name: module.load_ms for module in LAZY_MODULES},
+        'cpu': {'modes': dict(CPU_MODES), 'workers': CPU_WORKERS, 'pool_started': _cpu_pool is not None},
+    }
 
-        function copyPromptAndOpen(event) {
-            const promptText = document.getElementById('chatgpt-prompt');
-
-            // Copia il prompt
-            promptText.select();
-            promptText.setSelectionRange(0, 99999);
-
-            try {
-                if (navigator.clipboard && navigator.clipboard.writeText) {
-                    navigator.clipboard.writeText(promptText.value);
-                } else {
-                    document.execCommand('copy');
-                }
-            } catch (err) {
-                console.error('Errore durante la copia:', err);
-            }
+def warm_up():
+    """Importa subito i moduli pesanti (e l'estrattore YouTube di yt-dlp): restituisce i tempi in ms
+
+    Chiamata nel processo padre prima di creare i worker, fa sì che questi
+    condividano i moduli già caricati (copy-on-write) invece di importarli
+    ciascuno alla prima richiesta.
+    """
+    for module in LAZY_MODULES:
+        module.load()
+    start = time.perf_counter()
+    importlib.import_module('yt_dlp.extractor.youtube')
+    timings = {module.name: module.load_ms for module in LAZY_MODULES}
+    timings['yt_dlp.extractor.youtube'] = round((time.perf_counter() - start) * 1000, 1)
+    return timings
+
+def import_report(limit=15):
+    """Tempi di import dell'app con warm_up (python -X importtime), per dipendenza diretta"""
+    app_module = os.path.splitext(os.path.basename(__file__))[0]
+    command = [sys.executable, '-X', 'importtime', '-c',
+               f'import sys; sys.path.insert(0, {os.path.dirname(os.path.abspath(__file__))!r}); '
+               f'import {app_module}; {app_module}.warm_up()']
+    stderr = subprocess.run(command, capture_output=True, text=True).stderr
+
+    # Le righe dei moduli importati precedono quella di chi li importa: i
+    # figli di primo livello dell'app si tengono da parte finché non arriva
+    # l'app; i tempi si sommano per pacchetto di primo livello
+    packages, children, total = {}, [], 0
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        if not self_us.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        total += int(self_us)
+        if depth == 1:
+            children.append((name, int(cumulative_us)))
+        elif depth == 0:
+            entries = children + [(f'{app_module} (proprio)', int(self_us))] if name == app_module else \
+                [(name, int(cumulative_us))]
+            for entry, micros in entries:
+                package = entry.split('.')[0]
+                packages[package] = packages.get(package, 0) + micros
+            children = []
+
+    lines = [f'Import totale: {total / 1000:.0f} ms (inclusi i moduli caricati da warm_up)']
+    for name, micros in sorted(packages.items(), key=lambda item: -item[1])[:limit]:
+        lines.append(f'{micros / 1000:9.1f} ms  {name}')
+    return lines
 
-            // Il link si aprirà normalmente grazie al target="_blank"
-        }
+# ============================================================================
+# PROCESSI PER LE FASI CPU
+# ============================================================================
 
-        function showCopySuccess() {
-            const btn = event.target;
-            const originalText = btn.textContent;
-            btn.textContent = '✓ Copied!';
-            btn.style.background = '#4caf50';
+_cpu_pool = None
+_cpu_pool_lock = threading.Lock()
+
+def get_cpu_pool():
+    """Pool di processi per le fasi CPU, creato al primo utilizzo"""
+    global _cpu_pool
+    if _cpu_pool is None:
+        with _cpu_pool_lock:
+            if _cpu_pool is None:
+                context = multiprocessing.get_context(CPU_START_METHOD)
+                _cpu_pool = ProcessPoolExecutor(max_workers=CPU_WORKERS, mp_context=context)
+    return _cpu_pool
+
+def cpu_mode(stage):
+    """'thread' o 'process' per la fase indicata"""
+    return CPU_MODES.get(stage, 'thread')
+
+def run_cpu(stage, func, *args):
+    """Esegue func(*args) nel thread corrente o in un processo del pool, secondo CPU_MODES
+
+    In modalità process argomenti e risultato passano come pickle: func
+    deve essere una funzione di modulo e i dati serializzabili. Se un
+    processo del pool muore, il pool viene ricreato alla chiamata successiva.
+    """
+    global _cpu_pool
+    if cpu_mode(stage) != 'process':
+        return func(*args)
+
+    pool = get_cpu_pool()
+    metrics.inc('analyzetube_cpu_offload_total', stage=stage)
+    try:
+        return pool.submit(func, *args).result()
+    except BrokenProcessPool:
+        with _cpu_pool_lock:
+            if _cpu_pool is pool:
+                _cpu_pool = None
+        raise
+
+def parse_cpu_modes(values):
+    """Modalità per fase da --cpu-mode: 'process', 'thread' o 'fase=modalità' (ValueError se non valide)"""
+    modes = dict(CPU_MODES)
+    for value in values:
+        stage, _, mode = value.rpartition('=')
+        if mode not in ('thread', 'process') or (stage and stage not in CPU_STAGES):
+            raise ValueError(f"--cpu-mode {value}: usa thread, process o fase=modalità con fase in {', '.join(CPU_STAGES)}")
+        for name in ([stage] if stage else CPU_STAGES):
+            modes[name] = mode
+    return modes
 
-            setTimeout(() => {
-                btn.textContent = originalText;
-                btn.style.background = '';
-            }, 2000);
-        }
+# ============================================================================
+# TRASCRIZIONE CON TEMPI
+# ============================================================================
 
-        function showLoading(text) {
-            document.getElementById('loading-text').textContent = text;
-            document.getElementById('loading').classList.remove('hidden');
+class Segment:
+    """Segmento della trascrizione: inizio e durata in millisecondi, testo"""
+
+    __slots__ = ('start', 'duration', 'text')
+
+    def __init__(self, start, duration, text):
+        self.start = start
+        self.duration = duration
+        self.text = text
+
+    @property
+    def end(self):
+        return self.start + self.duration
+
+    def to_dict(self):
+        return {'start_ms': self.start, 'duration_ms': self.duration, 'text': self.text}
+
+    def __repr__(self):
+        return f"Segment({self.start}, {self.duration}, {self.text!r})"
+
+class Transcript:
+    """Trascrizione compatta con i tempi dei segmenti
+
+    Il testo è un'unica stringa (i segmenti uniti da spazi, come la
+    trascrizione "piatta" di sempre); inizio, durata e posizione nel testo di
+    ogni segmento stanno in tre array di interi paralleli. Le ricerche per
+    tempo e per posizione nel testo sono bisezioni su questi array, quindi
+    anche le trascrizioni lunghe si affettano senza riparsarle.
+    """
+
+    __slots__ = ('text', 'starts', 'durations', 'offsets')
+
+    def __init__(self, text='', starts=None, durations=None, offsets=None):
+        self.text = text
+        self.starts = starts if starts is not None else array('q')
+        self.durations = durations if durations is not None else array('q')
+        self.offsets = offsets if offsets is not None else array('q')
+
+    @classmethod
+    def from_segments(cls, segments):
+        """Costruisce la trascrizione da (inizio ms, durata ms, testo); i testi vuoti sono scartati"""
+        starts, durations, offsets = array('q'), array('q'), array('q')
+        parts, position = [], 0
+
+        for start, duration, text in segments:
+            text = text.strip()
+            if not text:
+                continue
+            if parts:
+                position += 1   # spazio separatore
+            starts.append(start)
+            durations.append(max(0, duration))
+            offsets.append(position)
+            parts.append(text)
+            position += len(text)
+
+        return cls(' '.join(parts), starts, durations, offsets)
+
+    @classmethod
+    def from_json3(cls, data):
+        """Trascrizione dal formato json3 di YouTube (events/segs con tStartMs e tOffsetMs)"""
+        return cls.from_segments(json3_segments(data.get('events', [])))
+
+    @classmethod
+    def from_index(cls, text, index):
+        """Ricostruisce la trascrizione dal testo e dal risultato di to_index()"""
+        return cls(text, array('q', index['starts']), array('q', index['durations']), array('q', index['offsets']))
+
+    def to_index(self):
+        """Tempi e posizioni serializzabili in JSON (il testo si salva a parte)"""
+        return {
+            'starts': self.starts.tolist(),
+            'durations': self.durations.tolist(),
+            'offsets': self.offsets.tolist(),
         }
 
-        function hideLoading() {
-            document.getElementById('loading').classList.add('hidden');
-        }
+    def __len__(self):
+        return len(self.starts)
+
+    def __bool__(self):
+        return bool(self.text)
+
+    def __str__(self):
+        return self.text
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        end = self.offsets[i + 1] - 1 if i + 1 < len(self) else len(self.text)
+        return Segment(self.starts[i], self.durations[i], self.text[self.offsets[i]:end])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def index_at(self, ms):
+        """Indice del segmento in corso all'istante ms (l'ultimo iniziato), oppure None"""
+        i = bisect_right(self.starts, ms) - 1
+        return i if i >= 0 else None
+
+    def text_at(self, ms):
+        """Testo pronunciato all'istante ms"""
+        i = self.index_at(ms)
+        return self[i].text if i is not None else ''
+
+    def time_range(self, char_start, char_end):
+        """Intervallo (inizio ms, fine ms) dei segmenti che coprono i caratteri [char_start, char_end)"""
+        if not len(self):
+            return None
+        first = max(0, bisect_right(self.offsets, char_start) - 1)
+        last = max(first, bisect_right(self.offsets, max(char_start, char_end - 1)) - 1)
+        return self.starts[first], self.starts[last] + self.durations[last]
+
+    def segments_between(self, start_ms, end_ms):
+        """Segmenti che si sovrappongono all'intervallo [start_ms, end_ms)"""
+        first = max(0, bisect_right(self.starts, start_ms) - 1)
+        if first < len(self) and self.starts[first] + self.durations[first] <= start_ms:
+            first += 1
+        last = bisect_right(self.starts, end_ms - 1) if end_ms > 0 else 0
+        return [self[i] for i in range(first, last)]
 
-        function showError(message) {
-            const errorDiv = document.getElementById('error');
-            errorDiv.textContent = '❌ ' + message;
-            errorDiv.classList.remove('hidden');
-            errorDiv.scrollIntoView({ behavior: 'smooth' });
-        }
+# ============================================================================
+# PARSING DEI SOTTOTITOLI
+# ============================================================================
 
-        function hideError() {
-            document.getElementById('error').classList.add('hidden');
-        }
+_JSON3_EVENTS = re.compile(r'"events"\s*:\s*\[')
+_VTT_TIMING = re.compile(r'((?:\d+:)?\d{1,2}:\d{2}[.,]\d{3})\s+-->\s+((?:\d+:)?\d{1,2}:\d{2}[.,]\d{3})')
+_MARKUP = re.compile(r'<[^>]*>')
+
+def json_loads(data):
+    """json.loads, oppure orjson se installato"""
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+def iter_text(chunks):
+    """Decodifica UTF-8 incrementale di una sequenza di chunk di byte"""
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    for chunk in chunks:
+        yield decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
+
+def iter_json3_events(chunks):
+    """Eventi di una traccia json3, decodificati uno alla volta man mano che arrivano i chunk
+
+    Non tiene in memoria né il testo completo né l'intero documento: del
+    buffer resta solo la parte non ancora decodificata.
+    """
+    decoder = json.JSONDecoder()
+    buffer, in_events = '', False
+
+    for text in iter_text(chunks):
+        buffer += text
+        if not in_events:
+            match = _JSON3_EVENTS.search(buffer)
+            if match is None:
+                buffer = buffer[-32:]   # la chiave potrebbe essere a cavallo di due chunk
+                continue
+            buffer, in_events = buffer[match.end():], True
+
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                event, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break           # evento incompleto: serve il chunk successivo
+            yield event
+        buffer = buffer[position:]
+
+    if not in_events or buffer.strip():
+        raise ValueError("Traccia json3 incompleta o non valida")
+
+def json3_segments(events, dedupe=False):
+    """Segmenti (inizio ms, durata ms, testo) dagli eventi json3
+
+    Con dedupe gli eventi identici al precedente (righe ripetute dei
+    sottotitoli automatici) vengono scartati.
+    """
+    previous = None
+    for event in events:
+        segs = event.get('segs')
+        if not segs:
+            continue
+        if dedupe:
+            text = ''.join(seg.get('utf8', '') for seg in segs).strip()
+            if text and text == previous:
+                continue
+            previous = text or previous
+
+        event_start = event.get('tStartMs', 0)
+        event_end = event_start + event.get('dDurationMs', 0)
+        for i, seg in enumerate(segs):
+            if 'utf8' not in seg:
+                continue
+            start = event_start + seg.get('tOffsetMs', 0)
+            end = event_start + segs[i + 1].get('tOffsetMs', 0) if i + 1 < len(segs) else event_end
+            yield start, end - start, seg['utf8']
+
+def _clock_ms(value):
+    """Tempo in millisecondi da '01:02:03.456', '02:03,456', '12.5s' o '1500ms'"""
+    value = value.strip().replace(',', '.')
+    if value.endswith('ms'):
+        return round(float(value[:-2]))
+    if value.endswith('s'):
+        return round(float(value[:-1]) * 1000)
+    parts = value.split(':')[:3]
+    return round(sum(float(part) * 60 ** i for i, part in enumerate(reversed(parts))) * 1000)
+
+def vtt_cues(chunks):
+    """Cue (inizio ms, durata ms, testo) di una traccia WebVTT, senza tag di formattazione"""
+    cue, remainder = None, ''
+
+    def flush():
+        if cue is not None and cue[2]:
+            yield cue[0], cue[1], '\n'.join(cue[2])
+
+    for text in chain(iter_text(chunks), ['\n']):
+        lines = (remainder + text).split('\n')
+        remainder = lines.pop()
+        for line in lines:
+            line = line.rstrip('\r')
+            timing = _VTT_TIMING.search(line)
+            if timing:
+                yield from flush()
+                start = _clock_ms(timing.group(1))
+                cue = (start, _clock_ms(timing.group(2)) - start, [])
+            elif not line.strip():
+                yield from flush()
+                cue = None
+            elif cue is not None:
+                cue[2].append(html.unescape(_MARKUP.sub('', line)))
+    yield from flush()
+
+def _xml_text(element):
+    """Testo di un elemento XML, con <br/> come a capo"""
+    parts = [element.text or '']
+    for child in element:
+        parts.append('\n' if child.tag.rsplit('}', 1)[-1] == 'br' else ''.join(child.itertext()))
+        parts.append(child.tail or '')
+    return html.unescape(''.join(parts))
+
+def _xml_timing(attrib):
+    """(inizio ms, durata ms) dagli attributi di srv1 (start/dur in s), srv2/srv3 (t/d in ms) o TTML (begin/end)"""
+    if 't' in attrib:
+        return int(attrib['t']), int(attrib.get('d', 0))
+    if 'start' in attrib:
+        return round(float(attrib['start']) * 1000), round(float(attrib.get('dur', 0)) * 1000)
+    if 'begin' in attrib:
+        start = _clock_ms(attrib['begin'])
+        if 'end' in attrib:
+            return start, _clock_ms(attrib['end']) - start
+        return start, _clock_ms(attrib['dur']) if 'dur' in attrib else 0
+    return None
 
-        function hideResults() {
-            document.getElementById('results').classList.add('hidden');
-        }
+def xml_cues(chunks):
+    """Cue di una traccia XML (srv1, srv2, srv3 o TTML), letta in streaming"""
+    parser = ElementTree.XMLPullParser(events=('end',))
+
+    def cues():
+        for _, element in parser.read_events():
+            if element.tag.rsplit('}', 1)[-1] not in ('p', 'text'):
+                continue
+            timing = _xml_timing(element.attrib)
+            if timing is not None:
+                yield timing[0], timing[1], _xml_text(element)
+            element.clear()
+
+    for chunk in chunks:
+        parser.feed(chunk)
+        yield from cues()
+    parser.close()
+    yield from cues()
+
+def dedupe_rolling(cues):
+    """Scarta le righe già mostrate dal cue precedente (sottotitoli automatici "a scorrimento")"""
+    shown = []
+    for start, duration, text in cues:
+        lines = [line.strip() for line in text.split('\n') if line.strip()]
+        new = [line for line in lines if line not in shown]
+        shown = lines
+        if new:
+            yield start, duration, ' '.join(new)
+
+def parse_subtitles(chunks, automatic=False):
+    """Trascrizione da una traccia in qualunque formato di YouTube, letta a chunk (None se illeggibile)
+
+    Il formato si riconosce dal contenuto (json3, WebVTT o XML). Con orjson
+    installato le tracce json3 piccole si leggono in un colpo solo, le altre
+    vengono decodificate evento per evento. Per le tracce automatiche le
+    righe ripetute vengono scartate.
+    """
+    chunks = iter(chunks)
+    head = b''
+    for head in chunks:
+        if head.strip():
+            break
+    start = head.lstrip(b'\xef\xbb\xbf \t\r\n')
+    chunks = chain([head], chunks)
+
+    if start.startswith(b'{'):
+        if orjson is not None:
+            buffered, size = [], 0
+            for chunk in chunks:
+                buffered.append(chunk)
+                size += len(chunk)
+                if size > SUBTITLE_STREAM_THRESHOLD:
+                    break
+            else:
+                events = orjson.loads(b''.join(buffered)).get('events', [])
+                return Transcript.from_segments(json3_segments(events, automatic)) or None
+            chunks = chain(buffered, chunks)
+        segments = json3_segments(iter_json3_events(chunks), automatic)
+    elif start.startswith(b'WEBVTT'):
+        segments = vtt_cues(chunks)
+    elif start.startswith(b'<'):
+        segments = xml_cues(chunks)
+    else:
+        return None
 
-        function disableButton(disabled) {
-            document.getElementById('analyze-btn').disabled = disabled;
-        }
+    if not start.startswith(b'{'):
+        # I cue su più righe diventano una riga sola, come il resto della trascrizione
+        segments = dedupe_rolling(segments) if automatic else (
+            (begin, duration, ' '.join(text.split())) for begin, duration, text in segments)
+    return Transcript.from_segments(segments) or None
 
-        document.getElementById('youtube-url').addEventListener('keypress', function(e) {
-            if (e.key === 'Enter') {
-                analyzeVideo();
-            }
-        });
-    </script>
-</body>
-</html>'''
+def parse_subtitle_bytes(data, automatic=False):
+    """parse_subtitles su una traccia già scaricata (per il pool di processi)"""
+    return parse_subtitles((data[i:i + SUBTITLE_CHUNK] for i in range(0, len(data), SUBTITLE_CHUNK)), automatic)
 
 # ============================================================================
 # FUNZIONI BACKEND
 # ============================================================================
 
+@timed('video_id')
 def extract_video_id(url):
     """Estrae l'ID del video dall'URL YouTube"""
     patterns = [
@@ -487,30 +1809,48 @@ def extract_video_id(url):
 
     return None
 
-def extract_video_info(video_id):
-    """Estrae informazioni video e trascrizione usando yt-dlp"""
+def fetch_raw_info(video_id):
+    """Dizionario info di yt-dlp per il video (titolo, tracce sottotitoli, ...)"""
     url = f"https://www.youtube.com/watch?v={video_id}"
 
+    # Le lingue non servono a yt-dlp: l'elenco completo delle tracce è
+    # sempre nel dizionario info e la scelta la fa extract_subtitles
     ydl_opts = {
         'skip_download': True,
-        'writesubtitles': True,
-        'writeautomaticsub': True,
-        'subtitleslangs': ['en', 'it'],
         'quiet': True,
         'no_warnings': True,
+        'cachedir': YDL_CACHE_DIR,
+    }
+    if YDL_LEAN:
+        # Senza process il dizionario resta quello grezzo dell'estrattore:
+        # titolo e tracce ci sono già, la selezione dei formati si salta
+        ydl_opts['extractor_args'] = YDL_LEAN_ARGS
+
+    with ydl_pool('info', ydl_opts).acquire() as ydl, timed('extract_info'):
+        return youtube_call(ydl.extract_info, url, download=False, process=not YDL_LEAN)
+
+def fetch_title(video_id):
+    """Solo il titolo: nessun download di sottotitoli"""
+    return {'title': fetch_raw_info(video_id).get('title', 'Titolo non disponibile')}
+
+def fetch_video_info(video_id, langs=None):
+    """Estrae titolo e trascrizione con yt-dlp, propagando eventuali errori"""
+    langs = langs or DEFAULT_LANGS
+    info = fetch_raw_info(video_id)
+
+    title = info.get('title', 'Titolo non disponibile')
+    transcript, timed = extract_transcript(info, langs)
+
+    return {
+        'title': title,
+        'transcript': transcript,
+        'segments': timed.to_index() if timed else None,
     }
 
+def extract_video_info(video_id):
+    """Estrae informazioni video e trascrizione usando yt-dlp"""
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-
-            title = info.get('title', 'Titolo non disponibile')
-            transcript = extract_subtitles(info)
-
-            return {
-                'title': title,
-                'transcript': transcript
-            }
+        return fetch_video_info(video_id)
 
     except Exception as e:
         return {
@@ -518,150 +1858,3664 @@ def extract_video_info(video_id):
             'transcript': f"Impossibile estrarre informazioni: {str(e)}"
         }
 
-def extract_subtitles(info):
-    """Estrae i sottotitoli dal dizionario info di yt-dlp"""
+def rank_subtitle_tracks(info, langs=None):
+    """Tracce di sottotitoli candidate, dalla migliore: (lingua, automatica, formato, url)
+
+    Ordine: sottotitoli manuali nelle lingue richieste, poi automatici nelle
+    lingue richieste, infine la traccia automatica nella lingua originale
+    (o la prima disponibile). Una lingua regionale ('en-US') vale come la
+    lingua base, subito dopo la corrispondenza esatta. Per ogni traccia si
+    sceglie il formato migliore secondo SUBTITLE_FORMATS.
+    """
+    langs = langs or DEFAULT_LANGS
+
+    def lang_rank(lang):
+        if lang in langs:
+            return langs.index(lang) * 2
+        base = lang.split('-')[0]
+        if base in langs:
+            return langs.index(base) * 2 + 1
+        return None
+
+    def best_format(formats):
+        def rank(fmt):
+            ext = fmt.get('ext')
+            return SUBTITLE_FORMATS.index(ext) if ext in SUBTITLE_FORMATS else len(SUBTITLE_FORMATS)
+        usable = [fmt for fmt in formats or [] if fmt.get('url')]
+        return min(usable, key=rank) if usable else None
+
+    candidates = []
+    for automatic, tracks in ((False, info.get('subtitles') or {}), (True, info.get('automatic_captions') or {})):
+        for lang, formats in tracks.items():
+            rank = lang_rank(lang)
+            fmt = best_format(formats)
+            if rank is not None and fmt is not None:
+                candidates.append(((automatic, rank), lang, automatic, fmt.get('ext'), fmt['url']))
+
+    # Nessuna lingua richiesta: ripiega sulla traccia automatica originale
+    auto_subs = info.get('automatic_captions') or {}
+    if not candidates and auto_subs:
+        fallback = next((lang for lang in auto_subs if lang.endswith('-orig')), next(iter(auto_subs)))
+        fmt = best_format(auto_subs[fallback])
+        if fmt is not None:
+            candidates.append(((True, 0), fallback, True, fmt.get('ext'), fmt['url']))
+
+    candidates.sort(key=lambda candidate: candidate[0])
+    return [candidate[1:] for candidate in candidates]
+
+def resolve_subtitles(info, langs=None):
+    """Scarica la migliore traccia disponibile: restituisce (Transcript, (lingua, automatica, formato)) o None
+
+    Le prime SUBTITLE_PARALLEL candidate partono in parallelo; quando una
+    fallisce parte la successiva. Vince la candidata di rango più alto tra
+    quelle riuscite, senza aspettare le peggiori, che vengono annullate.
+    """
+    candidates = rank_subtitle_tracks(info, langs)
+    cancel = threading.Event()
+    outcomes = {}       # indice candidata -> Transcript (None se fallita)
+    running = {}        # Future -> indice candidata
+    next_index = 0
+
     try:
-        subtitles = info.get('subtitles', {})
-        auto_subs = info.get('automatic_captions', {})
-
-        # Prova inglese, poi italiano
-        for lang in ['en', 'it']:
-            if lang in subtitles and subtitles[lang]:
-                result = download_subtitle_content(subtitles[lang][0].get('url'))
-                if result and not result.startswith('Errore'):
-                    return result
-
-        for lang in ['en', 'it']:
-            if lang in auto_subs and auto_subs[lang]:
-                result = download_subtitle_content(auto_subs[lang][0].get('url'))
-                if result and not result.startswith('Errore'):
-                    return result
-
-        # Prova qualsiasi lingua
-        if auto_subs:
-            first_lang = list(auto_subs.keys())[0]
-            result = download_subtitle_content(auto_subs[first_lang][0].get('url'))
-            if result and not result.startswith('Errore'):
-                return result
-
-        return "⚠️ Trascrizione non disponibile per questo video"
+        while True:
+            while next_index < len(candidates) and len(running) < SUBTITLE_PARALLEL:
+                _, automatic, _, url = candidates[next_index]
+                running[_subtitle_executor.submit(in_context(download_transcript), url, cancel, automatic)] = next_index
+                next_index += 1
+
+            # La migliore candidata decide se c'è già un vincitore o se bisogna aspettare
+            for index in range(len(candidates)):
+                if index not in outcomes:
+                    break
+                if outcomes[index]:
+                    lang, automatic, fmt, _ = candidates[index]
+                    metrics.inc('analyzetube_subtitle_results_total', result='fallback' if index else 'first')
+                    return outcomes[index], (lang, automatic, fmt)
+            else:
+                metrics.inc('analyzetube_subtitle_results_total', result='missing')
+                return None
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = running.pop(future)
+                try:
+                    outcomes[index] = future.result() or None
+                    outcome = 'ok' if outcomes[index] else 'empty'
+                except YouTubeThrottled:
+                    metrics.inc('analyzetube_subtitle_attempts_total', outcome='throttled')
+                    raise       # non è la traccia a mancare: non si ripiega sulle altre
+                except Exception:
+                    outcomes[index] = None
+                    outcome = 'error'
+                metrics.inc('analyzetube_subtitle_attempts_total', outcome=outcome)
+    finally:
+        cancel.set()
+        for future in running:
+            future.cancel()
+
+def extract_transcript(info, langs=None):
+    """Trascrizione dal dizionario info di yt-dlp: (testo, Transcript con i tempi o None)
+
+    Se non c'è una trascrizione utilizzabile il testo è il messaggio da mostrare.
+    """
+    try:
+        resolved = resolve_subtitles(info, langs)
+        if resolved is not None:
+            return resolved[0].text, resolved[0]
+
+        return "⚠️ Trascrizione non disponibile per questo video", None
 
     except Exception as e:
-        return f"Errore estrazione sottotitoli: {str(e)}"
+        return f"Errore estrazione sottotitoli: {str(e)}", None
 
-def download_subtitle_content(url):
+def extract_subtitles(info, langs=None):
+    """Estrae i sottotitoli dal dizionario info di yt-dlp"""
+    return extract_transcript(info, langs)[0]
+
+def parse_langs(params):
+    """Lingue dei sottotitoli in ordine di priorità (lista o stringa 'en,it'), oppure None"""
+    langs = params.get('langs')
+    if isinstance(langs, str):
+        langs = langs.split(',')
+    if not isinstance(langs, list):
+        return None
+
+    langs = [str(lang).strip() for lang in langs if str(lang).strip()]
+    return langs[:MAX_LANGS] or None
+
+def parse_flag(value):
+    """Flag booleano da JSON o query string: True, 1, '1', 'true', 'yes' (il resto è falso)"""
+    return str(value).strip().lower() in ('1', 'true', 'yes')
+
+@timed('subtitle_download')
+def download_transcript(url, cancel=None, automatic=False):
+    """Scarica una traccia di sottotitoli e la converte in Transcript (None se illeggibile)
+
+    La traccia viene analizzata mentre arriva, senza tenerla tutta in
+    memoria; con CPU_MODES['subtitles'] == 'process' viene invece scaricata
+    per intero e analizzata nel pool di processi. Gli errori di rete vengono
+    propagati. Se viene passato un threading.Event, il download si
+    interrompe appena l'evento viene impostato (traccia non più necessaria).
+    """
+    response = get_http_session().get(url, timeout=10, stream=True)
+    if response.status_code == 429:
+        response.close()
+        raise YouTubeThrottled("YouTube sta limitando il download dei sottotitoli")
+
+    def chunks():
+        for chunk in response.iter_content(chunk_size=SUBTITLE_CHUNK):
+            if cancel is not None and cancel.is_set():
+                return
+            yield chunk
+
+    with response:
+        try:
+            if cpu_mode('subtitles') == 'process':
+                transcript = run_cpu('subtitles', parse_subtitle_bytes, b''.join(chunks()), automatic)
+            else:
+                transcript = parse_subtitles(chunks(), automatic)
+        except (ValueError, ElementTree.ParseError, KeyError, TypeError, AttributeError):
+            return None
+    if cancel is not None and cancel.is_set():
+        return None
+    return transcript
+
+def download_subtitle_content(url, cancel=None):
     """Scarica e processa il contenuto dei sottotitoli"""
     try:
-        import json
+        transcript = download_transcript(url, cancel)
+        return transcript.text if transcript else None
 
-        response = requests.get(url, timeout=10)
+    except Exception as e:
+        return f"Errore download sottotitoli: {str(e)}"
 
-        # Formato JSON (moderno)
-        try:
-            data = json.loads(response.text)
+class ExtractionCancelled(Exception):
+    """Estrazione interrotta dalla pipeline prima del completamento"""
 
-            texts = []
-            for event in data.get('events', []):
-                if 'segs' in event:
-                    for seg in event['segs']:
-                        if 'utf8' in seg:
-                            texts.append(seg['utf8'].strip())
+def iter_raw_comments(video_id, limit=None, cancel=None, sort_by=None):
+    """Genera i commenti grezzi di youtube-comment-downloader, al massimo limit
 
-            if texts:
-                return ' '.join(texts)
+    Se viene passato un threading.Event, lo scaricamento si interrompe con
+    ExtractionCancelled appena l'evento viene impostato (es. timeout della
+    pipeline), così un elenco troncato non finisce in cache. sort_by è
+    SORT_BY_POPULAR (default) o SORT_BY_RECENT.
+    """
+    url = f"https://www.youtube.com/watch?v={video_id}"
+    limit = limit or DEFAULT_COMMENTS_LIMIT
+    if sort_by is None:
+        sort_by = comment_downloader.SORT_BY_POPULAR
+
+    # Il downloader resta in prestito finché il generatore non viene chiuso
+    with _comment_downloaders.acquire() as downloader:
+        comments = downloader.get_comments_from_url(url, sort_by=sort_by)
+
+        for count, comment in enumerate(comments, 1):
+            if cancel is not None and cancel.is_set():
+                raise ExtractionCancelled("Estrazione commenti annullata")
+            yield comment
+            if count >= limit:
+                break
 
-        except (json.JSONDecodeError, KeyError):
-            pass
+def parse_votes(votes):
+    """Converte il numero di like di YouTube ('1,234', '1.2K', '3M') in intero"""
+    text = str(votes or '').strip().upper().replace(',', '')
+    multiplier = 1
+    if text.endswith(('K', 'M', 'B')):
+        multiplier = {'K': 1_000, 'M': 1_000_000, 'B': 1_000_000_000}[text[-1]]
+        text = text[:-1]
 
-        return None
+    try:
+        if multiplier == 1:
+            return int(text.replace('.', ''))
+        return int(float(text) * multiplier)
+    except ValueError:
+        return 0
+
+def comment_record(comment):
+    """Record strutturato di un commento grezzo"""
+    return {
+        'id': comment.get('cid'),
+        'author': comment.get('author', 'Utente'),
+        'text': comment.get('text', ''),
+        'votes': parse_votes(comment.get('votes')),
+        'time': comment.get('time'),
+        'reply': bool(comment.get('reply', False)),
+    }
 
-    except Exception as e:
-        return f"Errore download sottotitoli: {str(e)}"
+class CommentPipeline:
+    """Pipeline lazy dei commenti: download, record strutturati, filtri
+
+    Iterandola si ottengono i record che superano i filtri, uno alla volta,
+    senza mai tenere in memoria l'elenco completo. limit vale sui commenti
+    letti, prima dei filtri; 'read' conta quelli letti finora. Tutti i
+    commenti letti finiscono a blocchi anche nell'archivio locale.
+    """
+
+    def __init__(self, video_id, limit=None, min_length=DEFAULT_MIN_LENGTH,
+                 min_votes=DEFAULT_MIN_VOTES, cancel=None):
+        self.video_id = video_id
+        self.limit = limit or DEFAULT_COMMENTS_LIMIT
+        self.min_length = min_length
+        self.min_votes = min_votes
+        self.cancel = cancel
+        self.store = get_comment_store() if COMMENT_STORE_ENABLED else None
+        self.read = 0
+
+    def __iter__(self):
+        batch = []
+        for comment in iter_raw_comments(self.video_id, self.limit, self.cancel):
+            self.read += 1
+            if self.store is not None:
+                batch.append(comment)
+                if len(batch) >= COMMENT_STORE_BATCH:
+                    self.store.merge(self.video_id, batch)
+                    batch = []
+            record = comment_record(comment)
+            if len(record['text']) >= self.min_length and record['votes'] >= self.min_votes:
+                yield record
+
+        if batch:
+            self.store.merge(self.video_id, batch)
+
+def format_comment(i, record):
+    """Testo di un commento numerato"""
+    header = f"{i}. {record['author']}"
+    if record['votes'] > 0:
+        header += f" [{record['votes']} likes]"
+    return f"{header}\n{record['text']}\n\n"
+
+def format_comments(items):
+    """Testo dei commenti numerati"""
+    return ''.join(format_comment(i, record) for i, record in enumerate(items, 1))
+
+def iter_comment_chunks(pipeline, chunk_size=COMMENTS_CHUNK):
+    """Genera i commenti a blocchi: (testo formattato, record del blocco)
+
+    L'ultimo blocco viene sempre generato, anche vuoto; a quel punto
+    pipeline.read contiene il numero totale di commenti letti.
+    """
+    buffer, items = io.StringIO(), []
+    for i, record in enumerate(pipeline, 1):
+        buffer.write(format_comment(i, record))
+        items.append(record)
+        if len(items) >= chunk_size:
+            yield buffer.getvalue(), items
+            buffer, items = io.StringIO(), []
+
+    yield buffer.getvalue(), items
+
+def finish_comments(comments_text, count):
+    """Testo finale dei commenti, con i messaggi per i casi senza commenti utili"""
+    if not count:
+        return "Nessun commento disponibile"
+    return comments_text if comments_text else "Commenti non disponibili"
+
+def fetch_comments(video_id, options=None, cancel=None):
+    """Estrae i commenti con youtube-comment-downloader, propagando eventuali errori
+
+    Restituisce {'text': testo formattato, 'items': record strutturati}.
+    Con options['mode'] == 'refresh' passa dal refresh incrementale.
+
+    Il risultato va in cache e nella risposta JSON, quindi è tenuto tutto in
+    memoria: per questo limit non supera mai COMMENTS_MAX_LIMIT. Per molti
+    commenti a memoria costante c'è /api/comments, che scrive a flusso.
+    """
+    options = options or comment_options({})
+    if options.get('mode') == 'refresh':
+        return refresh_comments(video_id, options, cancel)
+    limit = min(options['limit'] or DEFAULT_COMMENTS_LIMIT, COMMENTS_MAX_LIMIT)
+    pipeline = CommentPipeline(video_id, limit, options['min_length'], options['min_votes'], cancel)
+
+    buffer, items = io.StringIO(), []
+    for i, record in enumerate(pipeline, 1):
+        buffer.write(format_comment(i, record))
+        items.append(record)
+
+    return {'text': finish_comments(buffer.getvalue(), pipeline.read), 'items': items}
+
+def comment_options(params):
+    """Opzioni della pipeline commenti (limit, min_length, min_votes, mode, latest) dai parametri della richiesta
+
+    I valori non validi tornano al default, quelli fuori scala vengono limitati.
+    """
+    def number(name, default, maximum):
+        try:
+            value = int(params.get(name, default))
+        except (TypeError, ValueError):
+            value = default
+        return max(0, min(value, maximum))
+
+    return {
+        'limit': number('comments_limit', DEFAULT_COMMENTS_LIMIT, COMMENTS_MAX_LIMIT) or DEFAULT_COMMENTS_LIMIT,
+        'min_length': number('min_length', DEFAULT_MIN_LENGTH, 10_000),
+        'min_votes': number('min_votes', DEFAULT_MIN_VOTES, 10**12),
+        'mode': params.get('comments_mode') if params.get('comments_mode') in COMMENT_MODES else 'popular',
+        'latest': number('comments_latest', DEFAULT_COMMENTS_LATEST, COMMENTS_MAX_LIMIT),
+    }
 
 def extract_comments(video_id):
     """Estrae i commenti del video usando youtube-comment-downloader"""
+    try:
+        return fetch_comments(video_id)['text']
+
+    except Exception as e:
+        return f"Errore estrazione commenti: {str(e)}"
+
+# ============================================================================
+# ARCHIVIO COMMENTI E REFRESH INCREMENTALE
+# ============================================================================
+
+class CommentStore:
+    """Archivio SQLite dei commenti già visti, per video e ID commento
+
+    Ogni estrazione vi unisce i commenti letti: quelli nuovi vengono inseriti,
+    di quelli noti si aggiornano like e testo. È la base del refresh
+    incrementale, che scarica solo ciò che manca: per ogni video si tiene
+    un segno (ID e data del commento più recente visto in ordine di data),
+    aggiornato solo dalle letture per data.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS comments ('
+                'video_id TEXT NOT NULL, id TEXT NOT NULL, author TEXT NOT NULL, text TEXT NOT NULL, '
+                'votes INTEGER NOT NULL, time TEXT, reply INTEGER NOT NULL, published REAL, '
+                'first_seen REAL NOT NULL, updated REAL NOT NULL, PRIMARY KEY (video_id, id))'
+            )
+            self._db.execute('CREATE INDEX IF NOT EXISTS comments_votes ON comments (video_id, votes)')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS watermarks ('
+                'video_id TEXT PRIMARY KEY, id TEXT NOT NULL, published REAL, updated REAL NOT NULL)'
+            )
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"Archivio commenti disabilitato: {e}")
+            self._db = None
+
+    @property
+    def enabled(self):
+        return self._db is not None
+
+    def count(self, video_id):
+        """Commenti già archiviati per il video"""
+        if self._db is None:
+            return 0
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM comments WHERE video_id = ?', (video_id,)).fetchone()[0]
+
+    def merge(self, video_id, comments):
+        """Unisce commenti grezzi all'archivio e restituisce quanti erano nuovi"""
+        if self._db is None:
+            return 0
+
+        now = time.time()
+        rows = []
+        for comment in comments:
+            record = comment_record(comment)
+            if record['id']:
+                rows.append((record, comment.get('time_parsed')))
+
+        with self._lock:
+            before = self._db.total_changes
+            self._db.executemany(
+                'INSERT OR IGNORE INTO comments VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(video_id, r['id'], r['author'], r['text'], r['votes'], r['time'], int(r['reply']),
+                  published, now, now) for r, published in rows]
+            )
+            added = self._db.total_changes - before
+            self._db.executemany(
+                'UPDATE comments SET votes = ?, text = ?, time = ?, updated = ? WHERE video_id = ? AND id = ?',
+                [(r['votes'], r['text'], r['time'], now, video_id, r['id']) for r, _ in rows]
+            )
+            self._db.commit()
+        return added
+
+    def watermark(self, video_id):
+        """Segno del video: (ID, data di pubblicazione o None), oppure None se mai letto per data"""
+        if self._db is None:
+            return None
+        with self._lock:
+            return self._db.execute(
+                'SELECT id, published FROM watermarks WHERE video_id = ?', (video_id,)).fetchone()
+
+    def set_watermark(self, video_id, cid, published):
+        """Registra il segno: va chiamato solo dopo una lettura in ordine di data"""
+        if self._db is None:
+            return
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO watermarks VALUES (?, ?, ?, ?)',
+                             (video_id, cid, published, time.time()))
+            self._db.commit()
+
+    def top(self, video_id, limit, min_length=0, min_votes=0):
+        """I commenti più votati del video, come record"""
+        return self._records(
+            'WHERE video_id = ? AND length(text) >= ? AND votes >= ? ORDER BY votes DESC, first_seen',
+            (video_id, min_length, min_votes, limit)
+        )
+
+    def latest(self, video_id, limit, min_length=0):
+        """I commenti più recenti del video (per data di pubblicazione, se nota)"""
+        return self._records(
+            'WHERE video_id = ? AND length(text) >= ? ORDER BY COALESCE(published, first_seen) DESC, rowid',
+            (video_id, min_length, limit)
+        )
+
+    def stats(self):
+        """Video e commenti archiviati"""
+        if self._db is None:
+            return None
+        with self._lock:
+            videos, comments = self._db.execute(
+                'SELECT COUNT(DISTINCT video_id), COUNT(*) FROM comments').fetchone()
+        return {'videos': videos, 'comments': comments}
+
+    def _records(self, where, params):
+        if self._db is None:
+            return []
+        with self._lock:
+            rows = self._db.execute(
+                f'SELECT id, author, text, votes, time, reply FROM comments {where} LIMIT ?', params
+            ).fetchall()
+        return [{'id': cid, 'author': author, 'text': text, 'votes': votes, 'time': when, 'reply': bool(reply)}
+                for cid, author, text, votes, when, reply in rows]
+
+_comment_store = None
+_comment_store_lock = threading.Lock()
+
+def get_comment_store():
+    """Restituisce l'archivio dei commenti, creandolo al primo utilizzo"""
+    global _comment_store
+    if _comment_store is None:
+        with _comment_store_lock:
+            if _comment_store is None:
+                _comment_store = CommentStore(COMMENT_STORE_DB)
+    return _comment_store
+
+def iter_new_comments(video_id, watermark, cancel=None):
+    """Commenti dal più recente fino al segno (ID, data) dell'ultimo refresh
+
+    Ci si ferma al commento del segno oppure, se nel frattempo è stato
+    cancellato, dopo COMMENTS_KNOWN_STOP commenti consecutivi più vecchi del
+    segno: uno solo non basta, perché il commento fissato in alto compare
+    per primo anche nell'ordinamento per data.
+    """
+    cid, published = watermark
+    older = 0
+    recent = iter_raw_comments(video_id, COMMENTS_MAX_LIMIT, cancel, sort_by=comment_downloader.SORT_BY_RECENT)
+    for comment in recent:
+        if comment.get('cid') == cid:
+            break
+        if published is not None and not comment.get('reply') and comment.get('time_parsed', published) < published:
+            older += 1
+            if older >= COMMENTS_KNOWN_STOP:
+                break
+        elif not comment.get('reply'):
+            older = 0
+        yield comment
+
+def newest_comment(comments, watermark=None):
+    """Nuovo segno da una lettura per data: (ID, data) del commento principale più recente
+
+    Si sceglie per data e non per posizione, così il commento fissato (che
+    precede tutti) non diventa il segno; senza date si prende il primo. Il
+    segno precedente resta se nessun commento letto è più recente.
+    """
+    best = None
+    for comment in comments:
+        if comment.get('reply') or not comment.get('cid'):
+            continue
+        if best is None or comment.get('time_parsed', 0) > (best[1] or 0):
+            best = (comment['cid'], comment.get('time_parsed'))
+    if best is None or (watermark is not None and (best[1] or 0) < (watermark[1] or 0)):
+        return watermark
+    return best
+
+def refresh_comments(video_id, options=None, cancel=None):
+    """Commenti dall'archivio locale, scaricando solo quelli nuovi
+
+    Per un video già letto per data bastano di solito una o due pagine: i
+    commenti più recenti fino al segno dell'ultimo refresh, più la prima
+    pagina dei più votati per aggiornare i like. Senza segno se ne legge
+    una sola pagina per data (COMMENTS_SEED) per fissarlo, più i più votati
+    fino a limit se il video non è ancora in archivio. Restituisce i limit
+    più votati seguiti dai latest più recenti, con 'new' = commenti nuovi trovati.
+    """
+    options = options or comment_options({'comments_mode': 'refresh'})
+    store = get_comment_store() if COMMENT_STORE_ENABLED else None
+    if store is None or not store.enabled:
+        return fetch_comments(video_id, dict(options, mode='popular'), cancel)
+
+    watermark = store.watermark(video_id)
+    with timed('comments_refresh'):
+        if watermark is not None:
+            recent = list(iter_new_comments(video_id, watermark, cancel))
+        else:
+            recent = list(iter_raw_comments(video_id, COMMENTS_SEED, cancel,
+                                            sort_by=comment_downloader.SORT_BY_RECENT))
+        top = COMMENTS_TOP_REFRESH if store.count(video_id) else options['limit']
+        added = store.merge(video_id, recent + list(iter_raw_comments(video_id, top, cancel)))
+
+        newest = newest_comment(recent, watermark)
+        if newest is not None and newest != watermark and not (cancel is not None and cancel.is_set()):
+            store.set_watermark(video_id, *newest)
+
+    items = store.top(video_id, options['limit'], options['min_length'], options['min_votes'])
+    shown = {record['id'] for record in items}
+    latest = store.latest(video_id, options['latest'] + len(items), options['min_length'])
+    items += [record for record in latest if record['id'] not in shown][:options['latest']]
+
+    return {'text': finish_comments(format_comments(items), len(items)), 'items': items, 'new': added}
+
+# ============================================================================
+# INDICE DI RICERCA
+# ============================================================================
+
+_search_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='search')
+
+class SearchIndex:
+    """Indice full-text dei passaggi di trascrizione e dei commenti estratti
+
+    I passaggi stanno in una tabella normale (unici per video, tipo e
+    riferimento), indicizzata da una tabella FTS5 a contenuto esterno tenuta
+    allineata dai trigger. Se SQLite è compilato senza FTS5 si ripiega su
+    una ricerca con LIKE, più lenta ma con gli stessi risultati.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self.engine = None
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'id INTEGER PRIMARY KEY, video_id TEXT NOT NULL, kind TEXT NOT NULL, ref TEXT NOT NULL, '
+                'start_ms INTEGER, end_ms INTEGER, text TEXT NOT NULL, UNIQUE (video_id, kind, ref))'
+            )
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS videos ('
+                'video_id TEXT PRIMARY KEY, title TEXT, transcript_hash TEXT, indexed REAL NOT NULL)'
+            )
+            self.engine = 'fts5' if self._create_fts() else 'like'
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"Indice di ricerca disabilitato: {e}")
+            self._db = None
+
+    def _create_fts(self):
+        try:
+            self._db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5("
+                "text, content='entries', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+            )
+        except sqlite3.OperationalError:
+            return False
+        self._db.executescript(
+            'CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN '
+            'INSERT INTO entries_fts (rowid, text) VALUES (new.id, new.text); END;'
+            'CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN '
+            "INSERT INTO entries_fts (entries_fts, rowid, text) VALUES ('delete', old.id, old.text); END;"
+        )
+        return True
+
+    @property
+    def enabled(self):
+        return self._db is not None
+
+    def add_title(self, video_id, title):
+        """Registra (o aggiorna) il titolo del video"""
+        if self._db is None:
+            return
+        with self._lock:
+            self._db.execute(
+                'INSERT INTO videos (video_id, title, indexed) VALUES (?, ?, ?) '
+                'ON CONFLICT (video_id) DO UPDATE SET title = excluded.title, indexed = excluded.indexed',
+                (video_id, title, time.time())
+            )
+            self._db.commit()
+
+    def add_transcript(self, video_id, title, text, segments):
+        """Indicizza la trascrizione a passaggi con i tempi; salta se è identica a quella già indicizzata"""
+        if self._db is None:
+            return False
+        digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        with self._lock:
+            row = self._db.execute('SELECT transcript_hash FROM videos WHERE video_id = ?', (video_id,)).fetchone()
+            if row is not None and row[0] == digest:
+                return False
+
+            passages = transcript_passages(Transcript.from_index(text, segments))
+            self._db.execute("DELETE FROM entries WHERE video_id = ? AND kind = 'transcript'", (video_id,))
+            self._db.executemany(
+                "INSERT INTO entries (video_id, kind, ref, start_ms, end_ms, text) VALUES (?, 'transcript', ?, ?, ?, ?)",
+                [(video_id, str(i), start, end, passage) for i, (start, end, passage) in enumerate(passages)]
+            )
+            self._db.execute(
+                'INSERT INTO videos (video_id, title, transcript_hash, indexed) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (video_id) DO UPDATE SET title = excluded.title, '
+                'transcript_hash = excluded.transcript_hash, indexed = excluded.indexed',
+                (video_id, title, digest, time.time())
+            )
+            self._db.commit()
+        return True
+
+    def add_comments(self, video_id, items):
+        """Indicizza i commenti non ancora presenti (per ID): restituisce quanti sono nuovi"""
+        if self._db is None:
+            return 0
+        rows = [(video_id, item['id'], item['text']) for item in items if item.get('id') and item.get('text')]
+        with self._lock:
+            # rowcount, non total_changes: quest'ultimo conta anche le scritture dei trigger FTS5
+            added = self._db.executemany(
+                "INSERT OR IGNORE INTO entries (video_id, kind, ref, text) VALUES (?, 'comment', ?, ?)", rows
+            ).rowcount
+            self._db.execute(
+                'INSERT INTO videos (video_id, indexed) VALUES (?, ?) '
+                'ON CONFLICT (video_id) DO UPDATE SET indexed = excluded.indexed',
+                (video_id, time.time())
+            )
+            self._db.commit()
+        return added
+
+    def search(self, query, kind=None, video_id=None, limit=SEARCH_DEFAULT_LIMIT, offset=0):
+        """Passaggi che contengono tutti i termini della query, dal più pertinente"""
+        terms = search_terms(query)
+        if self._db is None or not terms:
+            return []
+
+        filters, params = [], []
+        if kind is not None:
+            filters.append('e.kind = ?')
+            params.append(kind)
+        if video_id is not None:
+            filters.append('e.video_id = ?')
+            params.append(video_id)
+
+        if self.engine == 'fts5':
+            match = ' '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+            sql = (
+                "SELECT e.video_id, v.title, e.kind, e.ref, e.start_ms, e.end_ms, "
+                "snippet(entries_fts, 0, '[', ']', '…', 16), bm25(entries_fts) "
+                'FROM entries_fts JOIN entries e ON e.id = entries_fts.rowid '
+                'LEFT JOIN videos v ON v.video_id = e.video_id '
+                'WHERE entries_fts MATCH ? ' + ''.join(f'AND {f} ' for f in filters) +
+                'ORDER BY bm25(entries_fts) LIMIT ? OFFSET ?'
+            )
+            params = [match] + params
+        else:
+            # Punteggio: occorrenze dei termini (negativo, come bm25: più basso è meglio)
+            occurrences = ' + '.join(
+                "(length(lower(e.text)) - length(replace(lower(e.text), ?, ''))) / length(?)" for _ in terms)
+            sql = (
+                'SELECT e.video_id, v.title, e.kind, e.ref, e.start_ms, e.end_ms, e.text, '
+                f'-({occurrences}) AS score FROM entries e LEFT JOIN videos v ON v.video_id = e.video_id '
+                'WHERE ' + ' AND '.join([r"lower(e.text) LIKE ? ESCAPE '\'"] * len(terms) + filters) +
+                ' ORDER BY score, e.id LIMIT ? OFFSET ?'
+            )
+            params = ([t for term in terms for t in (term, term)] +
+                      [f'%{like_escape(term)}%' for term in terms] + params)
+
+        with self._lock:
+            rows = self._db.execute(sql, params + [limit, offset]).fetchall()
+        if self.engine != 'fts5':
+            rows = [row[:6] + (_like_snippet(row[6], terms),) + row[7:] for row in rows]
+        return [search_hit(row) for row in rows]
+
+    def stats(self):
+        """Video e passaggi indicizzati, per tipo"""
+        if self._db is None:
+            return None
+        with self._lock:
+            kinds = dict(self._db.execute('SELECT kind, COUNT(*) FROM entries GROUP BY kind').fetchall())
+            videos = self._db.execute('SELECT COUNT(*) FROM videos').fetchone()[0]
+        return {'engine': self.engine, 'videos': videos, 'entries': kinds}
+
+_search_index = None
+_search_index_lock = threading.Lock()
+
+def get_search_index():
+    """Restituisce l'indice di ricerca, creandolo al primo utilizzo"""
+    global _search_index
+    if _search_index is None:
+        with _search_index_lock:
+            if _search_index is None:
+                _search_index = SearchIndex(SEARCH_DB)
+    return _search_index
+
+def transcript_passages(transcript, size=SEARCH_PASSAGE_CHARS):
+    """Segmenti consecutivi raggruppati in passaggi di circa size caratteri: (inizio ms, fine ms, testo)"""
+    passages, parts, length, start = [], [], 0, None
+    for segment in transcript:
+        if start is None:
+            start = segment.start
+        parts.append(segment.text)
+        length += len(segment.text) + 1
+        end = segment.start + segment.duration
+        if length >= size:
+            passages.append((start, end, ' '.join(parts)))
+            parts, length, start = [], 0, None
+    if parts:
+        passages.append((start, end, ' '.join(parts)))
+    return passages
+
+def like_escape(term):
+    """Termine letterale per LIKE ... ESCAPE '\\': %, _ e \\ non fanno da jolly"""
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def search_terms(query):
+    """Termini della query: parole singole e frasi tra virgolette, in minuscolo"""
+    return [phrase or word for phrase, word in re.findall(r'"([^"]+)"|(\S+)', query.lower())
+            if (phrase or word).strip('"')]
+
+def _like_snippet(text, terms, width=120):
+    """Estratto del testo attorno al primo termine trovato (ricerca senza FTS5)"""
+    lowered = text.lower()
+    position = min((lowered.find(term) for term in terms if term in lowered), default=0)
+    start = max(0, position - width // 2)
+    snippet = text[start:start + width]
+    return ('…' if start else '') + snippet + ('…' if start + width < len(text) else '')
+
+def search_hit(row):
+    """Risultato della ricerca come dizionario, con link al punto del video"""
+    video_id, title, kind, ref, start_ms, end_ms, text, score = row
     url = f"https://www.youtube.com/watch?v={video_id}"
+    hit = {'video_id': video_id, 'title': title, 'kind': kind, 'score': round(-score, 3)}
+
+    if kind == 'transcript':
+        hit.update({'start_ms': start_ms, 'end_ms': end_ms, 'timestamp': _format_timestamp(start_ms)})
+        url += f"&t={start_ms // 1000}s"
+    else:
+        hit['comment_id'] = ref
+        url += f"&lc={ref}"
+    hit.update({'url': url, 'snippet': text})
+    return hit
+
+def index_result(video_id, value):
+    """Accoda l'indicizzazione del risultato di un ramo (trascrizione, titolo o commenti)"""
+    if SEARCH_ENABLED:
+        _search_executor.submit(_index_value, video_id, value)
+
+def _index_value(video_id, value):
+    index = get_search_index()
+    try:
+        with timed('search_index'):
+            if value.get('segments'):
+                index.add_transcript(video_id, value['title'], value['transcript'], value['segments'])
+            elif 'title' in value:
+                index.add_title(video_id, value['title'])
+            if value.get('items'):
+                index.add_comments(video_id, value['items'])
+    except sqlite3.Error as e:
+        print(f"Indicizzazione di {video_id} non riuscita: {e}")
+
+# ============================================================================
+# CACHE RISULTATI
+# ============================================================================
+
+class ResultCache:
+    """Cache a due livelli: LRU in memoria e SQLite su disco, con TTL per voce
+
+    I valori devono essere serializzabili in JSON. Il livello su disco
+    sopravvive ai riavvii ed è condiviso tra processi; quando supera
+    disk_max_bytes vengono eliminate le voci usate meno di recente. Le voci
+    scadute restano su disco per CACHE_STALE_GRACE come riserva.
+    """
+
+    def __init__(self, path, memory_items=CACHE_MEMORY_ITEMS, disk_max_bytes=CACHE_DISK_MAX_BYTES):
+        self.memory_items = memory_items
+        self.disk_max_bytes = disk_max_bytes
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()    # chiave -> (scadenza, valore)
+        self.hits = {'memory': 0, 'disk': 0, 'stale': 0}
+        self.misses = 0
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL, '
+                'size INTEGER NOT NULL, accessed REAL NOT NULL)'
+            )
+            self._db.execute('CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)')
+            self._db.commit()
+        except sqlite3.Error as e:
+            # Disco non scrivibile: si continua con la sola cache in memoria
+            print(f"Cache su disco disabilitata: {e}")
+            self._db = None
+
+    def get(self, key, allow_stale=False):
+        """Restituisce (valore, livello) oppure None se assente o scaduto
+
+        Con allow_stale=True restituisce anche le voci scadute da meno di
+        CACHE_STALE_GRACE, con livello 'stale' (riserva quando YouTube non risponde).
+        """
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self._hit('memory')
+                    return entry[1], 'memory'
+                if allow_stale:
+                    self._hit('stale')
+                    return entry[1], 'stale'
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    'SELECT value, expires FROM cache WHERE key = ? AND expires > ?',
+                    (key, now - CACHE_STALE_GRACE if allow_stale else now)
+                ).fetchone()
+                if row is not None:
+                    self._db.execute('UPDATE cache SET accessed = ? WHERE key = ?', (now, key))
+                    self._db.commit()
+                    value = json_loads(row[0])
+                    if row[1] <= now:
+                        self._hit('stale')
+                        return value, 'stale'
+                    self._remember(key, row[1], value)
+                    self._hit('disk')
+                    return value, 'disk'
+
+            if not allow_stale:
+                self.misses += 1
+                metrics.inc('analyzetube_cache_lookups_total', result='miss')
+            return None
+
+    def set(self, key, value, ttl):
+        """Salva un valore in entrambi i livelli con scadenza ttl (secondi)"""
+        now = time.time()
+        expires = now + ttl
+
+        with self._lock:
+            self._remember(key, expires, value)
+
+            if self._db is not None:
+                blob = json.dumps(value, ensure_ascii=False)
+                self._db.execute(
+                    'INSERT OR REPLACE INTO cache (key, value, expires, size, accessed) VALUES (?, ?, ?, ?, ?)',
+                    (key, blob, expires, len(blob), now)
+                )
+                self._evict_disk(now)
+                self._db.commit()
+
+    def peek(self, key):
+        """Valore anche scaduto (entro CACHE_STALE_GRACE) senza toccare LRU e statistiche, oppure None
+
+        Per le esportazioni: leggere migliaia di voci non deve svuotare la
+        cache in memoria delle voci usate davvero.
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                return entry[1]
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                'SELECT value FROM cache WHERE key = ? AND expires > ?', (key, time.time() - CACHE_STALE_GRACE)
+            ).fetchone()
+        return json_loads(row[0]) if row is not None else None
+
+    def iter_keys(self, prefix):
+        """Chiavi su disco che iniziano con prefix, in ordine"""
+        if self._db is None:
+            return
+        last = ''
+        while True:
+            # A blocchi, per non tenere il lock (né la lista) per tutta la cache
+            with self._lock:
+                rows = self._db.execute(
+                    'SELECT key FROM cache WHERE key > ? AND substr(key, 1, ?) = ? ORDER BY key LIMIT 500',
+                    (last, len(prefix), prefix)
+                ).fetchall()
+            if not rows:
+                return
+            for (key,) in rows:
+                yield key
+            last = rows[-1][0]
+
+    def stats(self):
+        """Statistiche di utilizzo della cache"""
+        with self._lock:
+            stats = {
+                'memory_items': len(self._memory),
+                'hits': dict(self.hits),
+                'misses': self.misses,
+            }
+            if self._db is not None:
+                count, size = self._db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache').fetchone()
+                stats.update({'disk_items': count, 'disk_bytes': size})
+            return stats
+
+    def _hit(self, tier):
+        self.hits[tier] += 1
+        metrics.inc('analyzetube_cache_lookups_total', result=tier)
+
+    def _remember(self, key, expires, value):
+        self._memory[key] = (expires, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self, now):
+        self._db.execute('DELETE FROM cache WHERE expires <= ?', (now - CACHE_STALE_GRACE,))
+        total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM cache').fetchone()[0]
+        if total <= self.disk_max_bytes:
+            return
+
+        # Elimina le voci meno usate finché non si rientra nel limite
+        rows = self._db.execute('SELECT key, size FROM cache ORDER BY accessed').fetchall()
+        for key, size in rows:
+            if total <= self.disk_max_bytes:
+                break
+            self._db.execute('DELETE FROM cache WHERE key = ?', (key,))
+            total -= size
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """Restituisce la cache dei risultati, creandola al primo utilizzo"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache(CACHE_DB)
+    return _cache
+
+# Da incrementare quando cambia il formato dei valori in cache
+CACHE_VERSION = 2
+
+def cache_key(kind, video_id, *params):
+    """Chiave di cache: versione, tipo, ID video e parametri che influenzano il risultato"""
+    return ':'.join([f'v{CACHE_VERSION}', kind, video_id] + [str(p) for p in params])
 
+# ============================================================================
+# PIPELINE DI ESTRAZIONE CONCORRENTE
+# ============================================================================
+
+class SingleFlight:
+    """Coalescenza delle richieste concorrenti identiche
+
+    La prima chiamata per una chiave avvia il lavoro sull'executor; le
+    chiamate successive, finché quella è in corso, ricevono lo stesso Future
+    e ne condividono il risultato invece di ripetere l'estrazione.
+    """
+
+    def __init__(self, executor):
+        self._executor = executor
+        self._lock = threading.Lock()
+        self._calls = {}    # chiave -> Future in corso
+        self.started = 0
+        self.shared = 0
+
+    def submit(self, key, func, *args):
+        """Restituisce (future, leader): leader è False se il lavoro era già in corso"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.shared += 1
+                return future, False
+
+            future = self._executor.submit(in_context(func), *args)
+            self._calls[key] = future
+            self.started += 1
+
+        future.add_done_callback(lambda f: self._forget(key, f))
+        return future, True
+
+    def running(self, key):
+        """Future in corso per la chiave, oppure None"""
+        with self._lock:
+            return self._calls.get(key)
+
+    def stats(self):
+        """Esecuzioni avviate, richieste accodate a un'esecuzione esistente e in corso"""
+        with self._lock:
+            return {'started': self.started, 'shared': self.shared, 'in_flight': len(self._calls)}
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+
+_inflight = SingleFlight(_extract_executor)
+
+def _run_leg(func, args, cache, key, ttl):
+    """Esegue un ramo e ne salva il risultato in cache: restituisce (risultato, ms)
+
+    Il salvataggio avviene nel worker, prima che la chiamata esca da
+    _inflight, così chi arriva subito dopo trova già il valore in cache.
+    """
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = (time.perf_counter() - start) * 1000
+    if _cacheable(result):
+        if cache is not None:
+            cache.set(key, result, ttl)
+        index_result(args[0], result)   # il primo argomento di ogni ramo è l'ID video
+    return result, elapsed
+
+def _collect_leg(name, future, deadline, started, leader=True):
+    """Attende un ramo fino alla scadenza: restituisce (risultato, ms, errore)"""
     try:
-        downloader = YoutubeCommentDownloader()
-        comments = downloader.get_comments_from_url(url, sort_by=SORT_BY_POPULAR)
+        result, elapsed = future.result(timeout=max(0, deadline - time.perf_counter()))
+        return result, elapsed, None
+    except FuturesTimeoutError:
+        # Un Future condiviso può annullarlo solo chi lo ha avviato
+        if leader:
+            future.cancel()
+        count_error(name, 'Timeout')
+        elapsed = (time.perf_counter() - started) * 1000
+        return None, elapsed, f"Timeout dopo {elapsed / 1000:.1f}s"
+    except Exception as e:
+        count_error(name, type(e).__name__)
+        return None, (time.perf_counter() - started) * 1000, str(e)
 
-        comments_list = []
-        for comment in comments:
-            comments_list.append(comment)
-            if len(comments_list) >= 50:
+def stale_fallback(cache, key):
+    """Valore in cache anche se scaduto, da servire quando il ramo fallisce: (valore, livello) o None"""
+    if cache is None:
+        return None
+    return cache.get(key, allow_stale=True)
+
+def _cacheable(value):
+    """Gli errori "morbidi" (testi che iniziano con 'Errore') non vanno in cache"""
+    text = value.get('transcript', value.get('text', ''))
+    return not (isinstance(text, str) and text.startswith('Errore'))
+
+def info_cache_key(video_id, langs):
+    """Chiave di cache di titolo e trascrizione: dipende dalle lingue richieste"""
+    return cache_key('info', video_id, ','.join(langs))
+
+def title_cache_key(video_id):
+    return cache_key('title', video_id)
+
+def cached_title(cache, video_id, langs):
+    """Titolo preso dal ramo info in cache per le stesse lingue: (valore, livello) o None"""
+    cached = cache.get(info_cache_key(video_id, langs)) if cache is not None else None
+    if cached is None:
+        return None
+    return {'title': cached[0]['title']}, cached[1]
+
+def title_future(info_future):
+    """Future del solo titolo, risolto quando termina il ramo info da cui dipende"""
+    future = Future()
+
+    def done(f):
+        try:
+            info, elapsed = f.result()
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(({'title': info['title']}, elapsed))
+
+    info_future.add_done_callback(done)
+    return future
+
+def parse_fields(params):
+    """Campi richiesti (lista o stringa 'title,comments'); tutti se assenti o non validi"""
+    fields = params.get('fields')
+    if isinstance(fields, str):
+        fields = fields.split(',')
+    fields = {str(field).strip() for field in fields or []} & set(EXTRACT_FIELDS)
+    return fields or set(EXTRACT_FIELDS)
+
+def comments_cache_key(video_id, options):
+    """Chiave di cache dei commenti: dipende da limite, filtri e modalità"""
+    params = [options['limit'], options['min_length'], options['min_votes']]
+    if options.get('mode') == 'refresh':
+        params += ['refresh', options['latest']]
+    return cache_key('comments', video_id, *params)
+
+def run_extraction(video_id, langs=None, comment_opts=None, refresh=False, on_progress=None, fields=None,
+                   segments=False):
+    """Estrae in parallelo info/trascrizione e commenti
+
+    Ogni ramo ha il proprio timeout; se un ramo fallisce gli altri dati
+    vengono comunque restituiti, con l'errore in 'errors' e 'partial' a True.
+    I tempi di ciascun ramo (ms) sono riportati in 'timings'.
+
+    I rami già presenti in cache non vengono rieseguiti (salvo refresh=True);
+    l'esito della cache per ciascun ramo è riportato in 'cache' ('stale' se il
+    ramo è fallito e si è ripiegato su una voce scaduta). Se un ramo
+    identico è già in corso per un'altra richiesta, se ne attende il
+    risultato invece di rieseguirlo: questi rami sono elencati in 'coalesced'.
+
+    on_progress, se indicato, viene chiamato con il nome di ciascun ramo
+    appena questo termina (anche dai thread del pool).
+
+    fields limita il lavoro ai campi indicati (vedi EXTRACT_FIELDS): senza
+    'comments' il ramo commenti non parte, con il solo 'title' si salta
+    anche il download dei sottotitoli. Il titolo si prende dal ramo info
+    (stesse lingue) se questo è in cache o in corso. Nel risultato mancano
+    i campi non chiesti.
+
+    Con segments=True il risultato contiene anche 'segments', i tempi della
+    trascrizione (Transcript.to_index(), None se non ci sono), presi dallo
+    stesso risultato del ramo info.
+    """
+    langs = langs or DEFAULT_LANGS
+    comment_opts = comment_opts or comment_options({})
+    fields = set(fields or EXTRACT_FIELDS)
+    cache = get_cache() if CACHE_ENABLED else None
+    cancel = threading.Event()
+    started = time.perf_counter()
+
+    # nome ramo -> (chiave cache, TTL, timeout, funzione, argomenti)
+    legs = {}
+    if 'transcript' in fields:
+        legs['info'] = (info_cache_key(video_id, langs), INFO_TTL, INFO_TIMEOUT,
+                        fetch_video_info, (video_id, langs))
+    elif 'title' in fields:
+        legs['title'] = (title_cache_key(video_id), INFO_TTL, INFO_TIMEOUT, fetch_title, (video_id,))
+    if 'comments' in fields:
+        legs['comments'] = (comments_cache_key(video_id, comment_opts), COMMENTS_TTL, COMMENTS_TIMEOUT,
+                            fetch_comments, (video_id, comment_opts, cancel))
+
+    results, timings, errors, cache_status, futures = {}, {}, {}, {}, {}
+    coalesced = []
+    for name, (key, ttl, timeout, func, args) in legs.items():
+        cached = cache.get(key) if cache is not None and not refresh else None
+        if cached is None and name == 'title' and not refresh:
+            # Il titolo c'è già se la trascrizione è stata estratta: niente secondo giro su yt-dlp
+            cached = cached_title(cache, video_id, langs)
+        shared = _inflight.running(info_cache_key(video_id, langs)) if name == 'title' else None
+        if cached is not None:
+            results[name], cache_status[name] = cached
+            timings[name] = 0.0
+            if on_progress is not None:
+                on_progress(name)
+        else:
+            if shared is not None:
+                futures[name] = (title_future(shared), False)
+            else:
+                futures[name] = _inflight.submit(key, _run_leg, func, args, cache, key, ttl)
+            cache_status[name] = 'miss'
+            if not futures[name][1]:
+                coalesced.append(name)
+            if on_progress is not None:
+                futures[name][0].add_done_callback(lambda f, name=name: on_progress(name))
+
+    for name, (future, leader) in futures.items():
+        timeout = legs[name][2]
+        value, elapsed, error = _collect_leg(name, future, started + timeout, started, leader)
+        timings[name] = round(elapsed, 1)
+        failed = error is not None or not _cacheable(value)
+        stale = stale_fallback(cache, legs[name][0]) if failed else None
+        if stale is not None:
+            # YouTube non risponde (o limita): meglio un dato vecchio che nessun dato
+            results[name], cache_status[name] = stale
+        elif error is None:
+            results[name] = value
+        else:
+            errors[name] = error
+
+    # Il ramo commenti controlla l'evento a ogni commento e si ferma subito.
+    # Vale solo per i rami avviati da questa richiesta: quelli condivisi
+    # usano l'evento di chi li ha avviati.
+    cancel.set()
+
+    info_leg = 'info' if 'info' in legs else 'title'
+    info = results.get(info_leg) or {
+        'title': 'Errore',
+        'transcript': f"Impossibile estrarre informazioni: {errors.get(info_leg)}"
+    }
+    comments = results.get('comments') or {
+        'text': f"Errore estrazione commenti: {errors.get('comments')}",
+        'items': [],
+    }
+
+    timings['total'] = round((time.perf_counter() - started) * 1000, 1)
+
+    extracted = {}
+    if info_leg in legs:
+        extracted['title'] = info['title']
+    if 'info' in legs:
+        extracted['transcript'] = info['transcript']
+        if segments:
+            extracted['segments'] = info.get('segments')
+    if 'comments' in legs:
+        extracted.update({'comments': comments['text'], 'comment_items': comments['items']})
+
+    return {
+        **extracted,
+        'video_id': video_id,
+        'partial': bool(errors),
+        'errors': errors,
+        'timings': timings,
+        'cache': cache_status,
+        'coalesced': coalesced,
+    }
+
+# ============================================================================
+# ESTRAZIONE BATCH
+# ============================================================================
+
+# Alias dello stesso host: un video su youtu.be colpisce comunque youtube.com
+YOUTUBE_HOSTS = {'youtube.com', 'www.youtube.com', 'm.youtube.com', 'music.youtube.com', 'youtu.be'}
+
+def is_collection_url(url):
+    """True per URL di playlist o canale, da espandere nei singoli video"""
+    parsed = urlparse(url)
+    if (parsed.hostname or '').lower() not in YOUTUBE_HOSTS:
+        return False
+    path = parsed.path
+    return (path.startswith(('/playlist', '/@', '/channel/', '/c/', '/user/'))
+            or ('list=' in parsed.query and extract_video_id(url) is None))
+
+def expand_playlist(url, limit=BATCH_MAX_ITEMS):
+    """Elenca gli ID dei video di una playlist o canale (estrazione "flat" di yt-dlp)"""
+    ydl_opts = {
+        'extract_flat': 'in_playlist',
+        'playlistend': limit,
+        'quiet': True,
+        'no_warnings': True,
+    }
+
+    # Un pool per limite: playlistend fa parte delle opzioni dell'istanza
+    with ydl_pool(f'flat:{limit}', ydl_opts).acquire() as ydl:
+        info = youtube_call(ydl.extract_info, url, download=False)
+
+    video_ids = []
+    for entry in info.get('entries') or []:
+        # I canali restituiscono le schede (Video, Shorts, ...) come sotto-playlist
+        if entry and entry.get('_type') == 'playlist':
+            video_ids.extend(expand_playlist(entry['url'], limit))
+        elif entry and entry.get('id'):
+            video_ids.append(entry['id'])
+        if len(video_ids) >= limit:
+            break
+
+    return video_ids[:limit]
+
+def resolve_batch_inputs(items):
+    """Risolve URL, ID e playlist in una lista di (input, video_id) senza duplicati
+
+    Restituisce (video, errori, troncato); gli errori sono righe già pronte
+    per la risposta NDJSON.
+    """
+    videos, failures, seen = [], [], set()
+    truncated = False
+
+    for item in items:
+        item = str(item).strip()
+
+        if is_collection_url(item):
+            try:
+                video_ids = expand_playlist(item)
+            except Exception as e:
+                failures.append({'input': item, 'error': f"Impossibile espandere la playlist: {str(e)}"})
+                continue
+        else:
+            video_id = extract_video_id(item)
+            if not video_id:
+                failures.append({'input': item, 'error': 'URL YouTube non valido'})
+                continue
+            video_ids = [video_id]
+
+        for video_id in video_ids:
+            if video_id in seen:
+                continue
+            if len(videos) >= BATCH_MAX_ITEMS:
+                truncated = True
                 break
+            seen.add(video_id)
+            videos.append((item, video_id))
 
-        if comments_list:
-            comments_text = ""
-            for i, comment in enumerate(comments_list, 1):
-                author = comment.get('author', 'Utente')
-                text = comment.get('text', '')
-                votes = comment.get('votes', '0')
+    return videos, failures, truncated
 
-                try:
-                    votes_int = int(str(votes).replace(',', '').replace('.', ''))
-                except:
-                    votes_int = 0
+def stream_batch(videos, failures, truncated, **options):
+    """Genera le righe NDJSON del batch man mano che i video vengono completati
 
-                if text and len(text) > 10:
-                    comments_text += f"{i}. {author}"
-                    if votes_int > 0:
-                        comments_text += f" [{votes} likes]"
-                    comments_text += f"\n{text}\n\n"
+    options (langs, comment_opts, refresh) viene passato a run_extraction.
+    """
+    def line(obj):
+        return json.dumps(obj, ensure_ascii=False) + '\n'
 
-            return comments_text if comments_text else "Commenti non disponibili"
+    for failure in failures:
+        yield line(failure)
+
+    futures = {
+        _batch_executor.submit(run_extraction, video_id, **options): (item, video_id)
+        for item, video_id in videos
+    }
+    completed, errors = 0, len(failures)
+
+    try:
+        for future in as_completed(futures):
+            item, video_id = futures[future]
+            try:
+                yield line({'input': item, **future.result()})
+                completed += 1
+            except Exception as e:
+                errors += 1
+                yield line({'input': item, 'video_id': video_id,
+                            'error': f"Errore durante l'estrazione: {str(e)}"})
+    finally:
+        # Client disconnesso: i video non ancora avviati vengono scartati
+        for future in futures:
+            future.cancel()
+
+    yield line({'summary': {
+        'videos': len(videos),
+        'completed': completed,
+        'errors': errors,
+        'truncated': truncated,
+    }})
+
+def _get_leg(name, key, ttl, timeout, func, args, refresh=False):
+    """Un solo ramo dell'estrazione, passando da cache e coalescenza come run_extraction"""
+    cache = get_cache() if CACHE_ENABLED else None
+
+    cached = cache.get(key) if cache is not None and not refresh else None
+    if cached is not None:
+        return cached[0]
+
+    future, _ = _inflight.submit(key, _run_leg, func, args, cache, key, ttl)
+    try:
+        return future.result(timeout=timeout)[0]
+    except Exception as e:
+        count_error(name, 'Timeout' if isinstance(e, FuturesTimeoutError) else type(e).__name__)
+        stale = stale_fallback(cache, key)
+        if stale is None:
+            raise
+        return stale[0]
+
+def get_video_info(video_id, langs=None, refresh=False):
+    """Solo titolo e trascrizione (con tempi)"""
+    langs = langs or DEFAULT_LANGS
+    return _get_leg('info', info_cache_key(video_id, langs), INFO_TTL, INFO_TIMEOUT,
+                    fetch_video_info, (video_id, langs), refresh)
+
+def get_comments(video_id, comment_opts=None, refresh=False):
+    """Solo i commenti: {'text': ..., 'items': [...]}"""
+    comment_opts = comment_opts or comment_options({})
+    return _get_leg('comments', comments_cache_key(video_id, comment_opts), COMMENTS_TTL, COMMENTS_TIMEOUT,
+                    fetch_comments, (video_id, comment_opts, None), refresh)
+
+def extraction_error(result):
+    """Messaggio d'errore se tutti i rami sono falliti (nessun dato parziale), altrimenti None"""
+    if result['errors'] and len(result['errors']) == len(result['cache']):
+        return 'Errore durante l\'estrazione: ' + '; '.join(result['errors'].values())
+    return None
+
+# ============================================================================
+# RISPOSTE: PAGINAZIONE, ETAG E COMPRESSIONE
+# ============================================================================
+
+# Campi della risposta che cambiano a ogni richiesta e non fanno parte del contenuto
+VOLATILE_FIELDS = {'timings', 'cache', 'coalesced'}
+
+def content_etag(video_id, payload):
+    """ETag debole: ID video più hash del contenuto (esclusi tempi ed esito della cache)"""
+    content = {key: value for key, value in payload.items() if key not in VOLATILE_FIELDS}
+    digest = hashlib.sha1(json.dumps(content, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+    return f"{video_id}-{digest[:20]}"
+
+def _page_number(params, name, default, minimum, maximum):
+    try:
+        value = int(params.get(name, default))
+    except (TypeError, ValueError):
+        raise ValueError(f"Parametro {name} non valido")
+    return max(minimum, min(value, maximum))
+
+def paged_sections(params):
+    """Sezioni richieste a pagine ('transcript', 'comments'): vuoto se la richiesta non è paginata"""
+    sections = []
+    if 'transcript_offset' in params:
+        sections.append('transcript')
+    if 'comments_page' in params:
+        sections.append('comments')
+    return sections
+
+def extract_page(video_id, params, sections):
+    """Una pagina di trascrizione e/o commenti, leggendo solo i rami richiesti
+
+    La trascrizione si pagina per caratteri (transcript_offset,
+    transcript_limit), tagliando sul primo spazio dopo il limite; i commenti
+    per pagine (comments_page da 1, comments_per_page). Le sezioni non
+    richieste non vengono incluse.
+    """
+    page = {'success': True, 'video_id': video_id}
+
+    if 'transcript' in sections:
+        offset = _page_number(params, 'transcript_offset', 0, 0, 10**9)
+        limit = _page_number(params, 'transcript_limit', TRANSCRIPT_PAGE_CHARS, 1, 10**7)
+        info = get_video_info(video_id, parse_langs(params))
+        text = info['transcript']
+
+        end = text.find(' ', offset + limit) if offset + limit < len(text) else -1
+        end = len(text) if end == -1 else end
+        page.update({
+            'title': info['title'],
+            'transcript': text[offset:end],
+            'transcript_offset': offset,
+            'transcript_total': len(text),
+            'transcript_next_offset': end + 1 if end < len(text) else None,
+        })
+
+    if 'comments' in sections:
+        number = _page_number(params, 'comments_page', 1, 1, 10**6)
+        per_page = _page_number(params, 'comments_per_page', COMMENTS_PER_PAGE, 1, 1000)
+        comments = get_comments(video_id, comment_options(params))
+        items = comments['items']
+        first = (number - 1) * per_page
+        page_items = items[first:first + per_page]
+
+        if items:
+            text = ''.join(format_comment(first + i, record) for i, record in enumerate(page_items, 1))
         else:
-            return "Nessun commento disponibile"
+            text = comments['text'] if number == 1 else ''
+        page.update({
+            'comments': text,
+            'comment_items': page_items,
+            'comments_page': number,
+            'comments_total': len(items),
+            'comments_pages': max(1, -(-len(items) // per_page)),
+        })
 
+    return page
+
+def _preferred_encoding():
+    """Codifica da usare secondo Accept-Encoding: 'br', 'gzip' o None"""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+@app.after_request
+def compress_response(response):
+    """Comprime con brotli o gzip le risposte testuali abbastanza grandi"""
+    if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = _preferred_encoding()
+    body = response.get_data()
+    if encoding is None or len(body) < COMPRESS_MIN_SIZE:
+        return response
+
+    if encoding == 'br':
+        response.set_data(brotli.compress(body, quality=BROTLI_QUALITY))
+    else:
+        response.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+def cache_header(cache_status):
+    """Valore dell'header X-Cache: HIT, MISS, PARTIAL o STALE"""
+    if 'stale' in cache_status.values():
+        return 'STALE'
+    hits = [status != 'miss' for status in cache_status.values()]
+    if all(hits):
+        return 'HIT'
+    return 'PARTIAL' if any(hits) else 'MISS'
+
+# ============================================================================
+# STREAM DI AVANZAMENTO (SERVER-SENT EVENTS)
+# ============================================================================
+
+def _stream_info_leg(video_id, langs, emit):
+    """Ramo info per lo stream: invia il titolo appena disponibile, poi la trascrizione"""
+    info = fetch_raw_info(video_id)
+    title = info.get('title', 'Titolo non disponibile')
+    emit('metadata', {'video_id': video_id, 'title': title})
+
+    transcript, timed = extract_transcript(info, langs)
+    emit('transcript', {'transcript': transcript})
+    return {'title': title, 'transcript': transcript, 'segments': timed.to_index() if timed else None}
+
+def _stream_comments_leg(video_id, options, cancel, emit):
+    """Ramo commenti per lo stream: invia i commenti a blocchi man mano che arrivano"""
+    if options.get('mode') == 'refresh':
+        value = refresh_comments(video_id, options, cancel)
+        emit('comments', {'chunk': value['text'], 'items': value['items'], 'count': len(value['items'])})
+        return value
+
+    pipeline = CommentPipeline(video_id, options['limit'], options['min_length'], options['min_votes'], cancel)
+    buffer, items = io.StringIO(), []
+
+    for chunk, chunk_items in iter_comment_chunks(pipeline):
+        if chunk:
+            buffer.write(chunk)
+            items.extend(chunk_items)
+            emit('comments', {'chunk': chunk, 'items': chunk_items, 'count': len(items)})
+
+    text = finish_comments(buffer.getvalue(), pipeline.read)
+    if not items:
+        emit('comments', {'chunk': text, 'items': [], 'count': 0})
+    return {'text': text, 'items': items}
+
+def _cached_leg_events(video_id, name, value):
+    """Eventi di un ramo già pronto (in cache)"""
+    if name == 'info':
+        yield 'metadata', {'video_id': video_id, 'title': value['title']}
+        yield 'transcript', {'transcript': value['transcript']}
+    else:
+        yield 'comments', {'chunk': value['text'], 'items': value['items'], 'count': len(value['items'])}
+
+# Ramo che produce ciascun evento dello stream
+STREAM_EVENT_LEGS = {'metadata': 'info', 'transcript': 'info', 'comments': 'comments'}
+
+def _run_stream_leg(name, func, args, events, settle):
+    """Esegue un ramo dello stream e segnala la fine (o l'errore) sulla coda eventi
+
+    settle(name, result) salva il risultato in cache, se il ramo non è già
+    stato dato per fallito.
+    """
+    start = time.perf_counter()
+    try:
+        result = func(*args)
     except Exception as e:
-        return f"Errore estrazione commenti: {str(e)}"
+        count_error(name, type(e).__name__)
+        events.put(('_failed', {'leg': name, 'error': str(e)}))
+        return
+
+    settle(name, result)
+    events.put(('_finished', {'leg': name, 'ms': round((time.perf_counter() - start) * 1000, 1)}))
+
+def stream_extraction(video_id, langs=None, comment_opts=None, refresh=False):
+    """Genera gli eventi (nome, dati) dell'estrazione man mano che le fasi terminano
+
+    Eventi: 'metadata' (titolo), 'transcript', 'comments' (a blocchi),
+    'error' per un ramo fallito e infine 'done' con tempi ed errori. Come
+    run_extraction usa la cache e i timeout per ramo; i rami non vengono
+    però condivisi con altre richieste, perché ognuna riceve i propri eventi.
+    Un ramo scaduto resta fallito: i suoi eventi in ritardo vengono scartati
+    e il suo risultato non finisce in cache.
+    """
+    langs = langs or DEFAULT_LANGS
+    comment_opts = comment_opts or comment_options({})
+    cache = get_cache() if CACHE_ENABLED else None
+    events = queue.Queue()
+    cancel = threading.Event()
+    started = time.perf_counter()
+
+    expired, expired_lock = set(), threading.Lock()
+
+    def emit(name, data):
+        events.put((name, data))
+
+    def settle(name, result):
+        # Sotto lock: un ramo dato per scaduto non può più finire in cache
+        with expired_lock:
+            if name in expired or not _cacheable(result):
+                return
+            if cache is not None:
+                cache.set(legs[name][0], result, legs[name][1])
+        index_result(video_id, result)
+
+    # nome ramo -> (chiave cache, TTL, timeout, funzione, argomenti)
+    legs = {
+        'info': (info_cache_key(video_id, langs), INFO_TTL, INFO_TIMEOUT,
+                 _stream_info_leg, (video_id, langs, emit)),
+        'comments': (comments_cache_key(video_id, comment_opts), COMMENTS_TTL, COMMENTS_TIMEOUT,
+                     _stream_comments_leg, (video_id, comment_opts, cancel, emit)),
+    }
+
+    timings, errors, cache_status, deadlines = {}, {}, {}, {}
+    try:
+        for name, (key, ttl, timeout, func, args) in legs.items():
+            cached = cache.get(key) if cache is not None and not refresh else None
+            if cached is not None:
+                value, cache_status[name] = cached
+                timings[name] = 0.0
+                yield from _cached_leg_events(video_id, name, value)
+            else:
+                cache_status[name] = 'miss'
+                deadlines[name] = started + timeout
+                _extract_executor.submit(_run_stream_leg, name, func, args, events, settle)
+
+        while deadlines:
+            try:
+                name, data = events.get(timeout=max(0, min(deadlines.values()) - time.perf_counter()))
+            except queue.Empty:
+                now = time.perf_counter()
+                timed_out = [leg for leg, deadline in deadlines.items() if deadline <= now]
+                with expired_lock:
+                    expired.update(timed_out)
+                for leg in timed_out:
+                    del deadlines[leg]
+                    count_error(leg, 'Timeout')
+                    timings[leg] = round((now - started) * 1000, 1)
+                    errors[leg] = f"Timeout dopo {now - started:.1f}s"
+                    yield from _stream_leg_failed(video_id, leg, errors[leg])
+                # L'evento ferma solo il ramo commenti, che non dipende dalle info:
+                # se scade il ramo info i commenti continuano
+                if 'comments' in timed_out:
+                    cancel.set()
+                continue
+
+            if name == '_finished':
+                if deadlines.pop(data['leg'], None) is not None:
+                    timings[data['leg']] = data['ms']
+            elif name == '_failed':
+                if deadlines.pop(data['leg'], None) is not None:
+                    leg = data['leg']
+                    timings[leg] = round((time.perf_counter() - started) * 1000, 1)
+                    stale = stale_fallback(cache, legs[leg][0])
+                    if stale is not None:
+                        cache_status[leg] = 'stale'
+                        yield from _cached_leg_events(video_id, leg, stale[0])
+                    else:
+                        errors[leg] = data['error']
+                        yield from _stream_leg_failed(video_id, leg, data['error'])
+            elif STREAM_EVENT_LEGS.get(name) not in deadlines:
+                continue    # ramo già scaduto: gli eventi in ritardo vengono scartati
+            else:
+                yield name, data
+    finally:
+        # Fine stream o client disconnesso: il ramo commenti si ferma
+        cancel.set()
+
+    timings['total'] = round((time.perf_counter() - started) * 1000, 1)
+    result = {'errors': errors, 'timings': timings, 'cache': cache_status}
+    yield 'done', {
+        'video_id': video_id,
+        'partial': bool(errors),
+        'error': extraction_error(result),
+        **result,
+    }
+
+def _stream_leg_failed(video_id, leg, error):
+    """Eventi per un ramo fallito: l'errore e gli stessi testi di ripiego di /api/extract"""
+    yield 'error', {'leg': leg, 'error': error}
+    if leg == 'info':
+        yield 'metadata', {'video_id': video_id, 'title': 'Errore'}
+        yield 'transcript', {'transcript': f"Impossibile estrarre informazioni: {error}"}
+    else:
+        yield 'comments', {'chunk': f"Errore estrazione commenti: {error}", 'items': [], 'count': None}
+
+def lazy_events(events):
+    """Stream "leggero": trascrizione e commenti ridotti a lunghezza e conteggio
+
+    La pagina li carica poi a pagine da /api/extract solo quando servono.
+    """
+    for name, data in events:
+        if name == 'transcript':
+            yield name, {'length': len(data['transcript'])}
+        elif name == 'comments':
+            yield name, {'count': data['count']}
+        else:
+            yield name, data
+
+def sse_event(name, data):
+    """Serializza un evento nel formato Server-Sent Events"""
+    return f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# ============================================================================
+# JOB ASINCRONI
+# ============================================================================
+
+class JobQueue:
+    """Coda di job di estrazione persistente su SQLite
+
+    I job vengono letti direttamente dal database: chi invia un job sveglia
+    i worker locali, gli altri processi lo trovano al controllo successivo.
+    Un job viene preso in carico con un UPDATE condizionale, quindi più
+    processi possono condividere lo stesso file senza eseguirlo due volte.
+    I job rimasti "running" dopo un riavvio vengono ripresi quando diventano
+    più vecchi di JOB_STALE_AFTER.
+    """
+
+    STAGES = ('info', 'comments')
+
+    def __init__(self, path, workers=JOB_WORKERS):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            'id TEXT PRIMARY KEY, status TEXT NOT NULL, progress REAL NOT NULL DEFAULT 0, '
+            'stage TEXT, params TEXT NOT NULL, result TEXT, error TEXT, '
+            'created REAL NOT NULL, updated REAL NOT NULL)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)')
+        self._db.commit()
+
+    def start(self):
+        """Avvia i thread worker (una sola volta)"""
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'job-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """Smette di prendere job e attende quelli in corso: restituisce True se sono finiti
+
+        I job ancora in coda restano "queued" e vengono ripresi al riavvio.
+        """
+        self._stopping.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0, deadline - time.monotonic()))
+        return not any(thread.is_alive() for thread in self._threads)
+
+    def submit(self, params):
+        """Accoda un job e ne restituisce l'ID"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+
+        with self._lock:
+            self._db.execute(
+                'INSERT INTO jobs (id, status, stage, params, created, updated) VALUES (?, ?, ?, ?, ?, ?)',
+                (job_id, 'queued', 'queued', json.dumps(params), now, now)
+            )
+            self._db.commit()
+
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def get(self, job_id):
+        """Stato del job come dizionario, oppure None se non esiste"""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT id, status, progress, stage, result, error, created, updated FROM jobs WHERE id = ?',
+                (job_id,)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        job = {
+            'job_id': row[0],
+            'status': row[1],
+            'progress': row[2],
+            'stage': row[3],
+            'created': row[6],
+            'updated': row[7],
+        }
+        if row[4] is not None:
+            job['result'] = json.loads(row[4])
+        if row[5] is not None:
+            job['error'] = row[5]
+        return job
+
+    def stats(self):
+        """Numero di job per stato"""
+        with self._lock:
+            return dict(self._db.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+
+    def _update(self, job_id, **fields):
+        fields['updated'] = time.time()
+        columns = ', '.join(f'{name} = ?' for name in fields)
+        with self._lock:
+            self._db.execute(f'UPDATE jobs SET {columns} WHERE id = ?', (*fields.values(), job_id))
+            self._db.commit()
+
+    def _claim(self):
+        """Prende in carico il job in coda più vecchio: restituisce (id, parametri) o None"""
+        now = time.time()
+
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated < ?",
+                (now - JOB_RETENTION,)
+            )
+            candidates = self._db.execute(
+                "SELECT id, params FROM jobs WHERE status = 'queued' "
+                "OR (status = 'running' AND updated < ?) ORDER BY created LIMIT 5",
+                (now - JOB_STALE_AFTER,)
+            ).fetchall()
+
+            for job_id, params in candidates:
+                claimed = self._db.execute(
+                    "UPDATE jobs SET status = 'running', stage = 'starting', updated = ? "
+                    "WHERE id = ? AND (status = 'queued' OR (status = 'running' AND updated < ?))",
+                    (now, job_id, now - JOB_STALE_AFTER)
+                ).rowcount
+                if claimed:
+                    self._db.commit()
+                    return job_id, json.loads(params)
+
+            self._db.commit()
+            return None
+
+    def _work(self):
+        while not self._stopping.is_set():
+            claimed = self._claim()
+            if claimed is None:
+                with self._wakeup:
+                    self._wakeup.wait(JOB_POLL_INTERVAL)
+                continue
+
+            job_id, params = claimed
+            try:
+                self._run(job_id, params)
+            except Exception as e:
+                self._update(job_id, status='failed', stage='failed', error=f"Errore durante l'estrazione: {str(e)}")
+
+    def _run(self, job_id, params):
+        done = []
+
+        def on_progress(stage):
+            # Le callback arrivano dai thread del pool, anche dopo la fine del job
+            done.append(stage)
+            with self._lock:
+                self._db.execute(
+                    "UPDATE jobs SET stage = ?, progress = ?, updated = ? WHERE id = ? AND status = 'running'",
+                    (stage, round(len(done) / len(self.STAGES), 2), time.time(), job_id)
+                )
+                self._db.commit()
+
+        result = run_extraction(params['video_id'], langs=params.get('langs'), comment_opts=params.get('comments'),
+                                refresh=params.get('refresh', False), on_progress=on_progress)
+
+        error = extraction_error(result)
+        if error:
+            self._update(job_id, status='failed', stage='failed', progress=1.0, error=error)
+        else:
+            self._update(job_id, status='done', stage='done', progress=1.0,
+                         result=json.dumps({'success': True, **result}, ensure_ascii=False))
+
+_jobs = None
+_jobs_lock = threading.Lock()
+
+def get_job_queue():
+    """Restituisce la coda dei job, creandola al primo utilizzo
+
+    I worker partono solo con start_background(): qui la coda si limita ad
+    accettare job, che un processo server (anche un altro) poi esegue.
+    """
+    global _jobs
+    if _jobs is None:
+        with _jobs_lock:
+            if _jobs is None:
+                _jobs = JobQueue(JOBS_DB)
+    return _jobs
+
+# ============================================================================
+# PREFETCH DELLE WATCHLIST
+# ============================================================================
+
+class Prefetcher:
+    """Estrazione anticipata dei video nuovi di canali e playlist seguiti
+
+    Un thread controlla ogni PREFETCH_INTERVAL la watchlist con l'estrazione
+    "flat" di yt-dlp (solo gli ultimi PREFETCH_RECENT video) e accoda gli ID
+    mai visti; i worker li estraggono con run_extraction e le opzioni di
+    default, così le richieste degli utenti per quei video trovano la cache.
+
+    Il prefetch cede sempre il passo: aspetta se ci sono già estrazioni in
+    corso o se il limite verso YouTube ha pochi token (o è in backoff), e non
+    supera PREFETCH_PER_HOUR video all'ora. Come JobQueue usa SQLite con
+    aggiornamenti condizionali, quindi più processi non si ripetono il lavoro.
+    """
+
+    def __init__(self, path, workers=PREFETCH_WORKERS):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._pace_lock = threading.Lock()
+        self._next_start = 0.0
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS watchlist ('
+            'url TEXT PRIMARY KEY, added REAL NOT NULL, checked REAL NOT NULL DEFAULT 0, error TEXT)'
+        )
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS videos ('
+            'video_id TEXT PRIMARY KEY, source TEXT NOT NULL, status TEXT NOT NULL, '
+            'error TEXT, found REAL NOT NULL, updated REAL NOT NULL)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS videos_status ON videos (status, found)')
+        self._db.commit()
+
+    def start(self):
+        """Avvia il thread di controllo della watchlist e i worker (una sola volta)"""
+        if self._threads:
+            return
+        targets = [('prefetch-watch', self._watch)]
+        targets += [(f'prefetch-{i}', self._work) for i in range(self.workers)]
+        for name, target in targets:
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """Ferma i thread; un'estrazione in corso viene lasciata finire entro timeout"""
+        self._stopping.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0, deadline - time.monotonic()))
+        return not any(thread.is_alive() for thread in self._threads)
+
+    def add(self, url):
+        """Aggiunge un canale o una playlist alla watchlist (controllato subito)"""
+        with self._lock:
+            self._db.execute('INSERT OR IGNORE INTO watchlist (url, added) VALUES (?, ?)', (url, time.time()))
+            self._db.commit()
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def remove(self, url):
+        """Toglie un URL dalla watchlist: restituisce False se non c'era"""
+        with self._lock:
+            removed = self._db.execute('DELETE FROM watchlist WHERE url = ?', (url,)).rowcount
+            self._db.commit()
+        return bool(removed)
+
+    def watchlist(self):
+        """URL seguiti con l'ora dell'ultimo controllo e l'eventuale errore"""
+        with self._lock:
+            rows = self._db.execute('SELECT url, added, checked, error FROM watchlist ORDER BY added').fetchall()
+        return [{'url': url, 'added': added, 'checked': checked or None, 'error': error}
+                for url, added, checked, error in rows]
+
+    def stats(self):
+        """Voci della watchlist e video per stato"""
+        with self._lock:
+            videos = dict(self._db.execute('SELECT status, COUNT(*) FROM videos GROUP BY status').fetchall())
+            watched = self._db.execute('SELECT COUNT(*) FROM watchlist').fetchone()[0]
+        return {'sources': watched, 'videos': videos}
+
+    def _claim_source(self):
+        """Prende in carico un URL da ricontrollare: restituisce l'URL o None"""
+        now = time.time()
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT url FROM watchlist WHERE checked < ? ORDER BY checked LIMIT 5', (now - PREFETCH_INTERVAL,)
+            ).fetchall()
+            for (url,) in rows:
+                claimed = self._db.execute(
+                    'UPDATE watchlist SET checked = ? WHERE url = ? AND checked < ?',
+                    (now, url, now - PREFETCH_INTERVAL)
+                ).rowcount
+                self._db.commit()
+                if claimed:
+                    return url
+        return None
+
+    def _watch(self):
+        while not self._stopping.is_set():
+            url = self._claim_source()
+            if url is None:
+                with self._wakeup:
+                    self._wakeup.wait(PREFETCH_IDLE_WAIT)
+                continue
+
+            try:
+                video_ids = expand_playlist(url, PREFETCH_RECENT)
+                error = None
+            except Exception as e:
+                video_ids, error = [], f"Impossibile espandere la playlist: {str(e)}"
+
+            now = time.time()
+            with self._lock:
+                self._db.execute('UPDATE watchlist SET error = ? WHERE url = ?', (error, url))
+                before = self._db.total_changes
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO videos (video_id, source, status, found, updated) VALUES (?, ?, 'queued', ?, ?)",
+                    [(video_id, url, now, now) for video_id in video_ids]
+                )
+                added = self._db.total_changes - before
+                self._db.commit()
+            if added:
+                metrics.inc('analyzetube_prefetch_total', result='queued', amount=added)
+                with self._wakeup:
+                    self._wakeup.notify_all()
+
+    def _claim_video(self):
+        """Prende in carico il video in coda trovato per primo (il più recente della sua lista): ID o None"""
+        with self._lock:
+            now = time.time()
+            # Come per i job, un video "running" fermo da troppo tempo viene ripreso
+            pending = "(status = 'queued' OR (status = 'running' AND updated < ?))"
+            rows = self._db.execute(
+                f'SELECT video_id FROM videos WHERE {pending} ORDER BY found, rowid LIMIT 5', (now - JOB_STALE_AFTER,)
+            ).fetchall()
+            for (video_id,) in rows:
+                claimed = self._db.execute(
+                    f"UPDATE videos SET status = 'running', updated = ? WHERE video_id = ? AND {pending}",
+                    (now, video_id, now - JOB_STALE_AFTER)
+                ).rowcount
+                self._db.commit()
+                if claimed:
+                    return video_id
+        return None
+
+    def _busy(self):
+        """True se il prefetch deve cedere il passo alle richieste degli utenti"""
+        limiter = _youtube_limiter.stats()
+        return (_inflight.stats()['in_flight'] >= PREFETCH_BUSY_INFLIGHT
+                or limiter['state'] != 'closed' or limiter['backoff_remaining'] > 0
+                or limiter['tokens'] < limiter['burst'] * PREFETCH_MIN_TOKENS)
+
+    def _wait_turn(self):
+        """Attende che YouTube sia libero e che il budget orario lo consenta: False se in chiusura"""
+        while self._busy():
+            if self._stopping.wait(PREFETCH_IDLE_WAIT):
+                return False
+
+        with self._pace_lock:
+            start = max(time.monotonic(), self._next_start)
+            self._next_start = start + 3600 / PREFETCH_PER_HOUR
+        return not self._stopping.wait(max(0.0, start - time.monotonic()))
+
+    def _work(self):
+        while not self._stopping.is_set():
+            video_id = self._claim_video()
+            if video_id is None:
+                with self._wakeup:
+                    self._wakeup.wait(PREFETCH_IDLE_WAIT)
+                continue
+
+            if not self._wait_turn():
+                self._set_status(video_id, 'queued')    # ripreso al riavvio
+                return
+
+            try:
+                error = extraction_error(run_extraction(video_id))
+            except Exception as e:
+                error = str(e)
+            self._set_status(video_id, 'failed' if error else 'done', error)
+            metrics.inc('analyzetube_prefetch_total', result='failed' if error else 'done')
+
+    def _set_status(self, video_id, status, error=None):
+        with self._lock:
+            self._db.execute(
+                'UPDATE videos SET status = ?, error = ?, updated = ? WHERE video_id = ?',
+                (status, error, time.time(), video_id)
+            )
+            self._db.commit()
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+def get_prefetcher():
+    """Restituisce il prefetcher, creandolo al primo utilizzo (i thread partono con start_background)"""
+    global _prefetcher
+    if _prefetcher is None:
+        with _prefetcher_lock:
+            if _prefetcher is None:
+                _prefetcher = Prefetcher(PREFETCH_DB)
+    return _prefetcher
+
+# ============================================================================
+# SERVER E CHIUSURA ORDINATA
+# ============================================================================
+
+_draining = threading.Event()
+
+def drain(timeout=DRAIN_TIMEOUT):
+    """Chiusura ordinata: rifiuta nuove estrazioni e attende quelle in corso
+
+    Restituisce True se job ed estrazioni sono finiti entro il timeout.
+    """
+    _draining.set()
+    deadline = time.monotonic() + timeout
+
+    jobs_done = _jobs.stop(timeout) if _jobs is not None else True
+    if _prefetcher is not None:
+        _prefetcher.stop(max(0, deadline - time.monotonic()))
+    while _inflight.stats()['in_flight'] and time.monotonic() < deadline:
+        time.sleep(0.1)
+    drained = jobs_done and not _inflight.stats()['in_flight']
+
+    for executor in (_batch_executor, _extract_executor, _subtitle_executor):
+        executor.shutdown(wait=False, cancel_futures=True)
+    _search_executor.shutdown(wait=True)    # indicizzazioni già accodate: sono rapide
+    if _cpu_pool is not None:
+        _cpu_pool.shutdown(wait=False, cancel_futures=True)
+    return drained
+
+def start_background():
+    """Avvia i worker dei job e il prefetch delle watchlist (una volta per processo)"""
+    get_job_queue().start()
+    if PREFETCH_ENABLED:
+        get_prefetcher().start()
+
+def _stop_on_sigterm():
+    """SIGTERM si comporta come Ctrl+C, così il server esce dal ciclo e si passa al drain"""
+    def handler(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, handler)
+
+def serve_gunicorn(host, port, workers, threads):
+    """Più processi con gunicorn (worker gthread); ogni worker fa il drain quando esce"""
+    from gunicorn.app.base import BaseApplication
+
+    class AnalyzeTubeServer(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'{host}:{port}')
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('timeout', SERVE_TIMEOUT)
+            self.cfg.set('graceful_timeout', DRAIN_TIMEOUT)
+            self.cfg.set('post_worker_init', lambda worker: start_background())
+            self.cfg.set('worker_exit', lambda server, worker: drain())
+
+        def load(self):
+            return app
+
+    AnalyzeTubeServer().run()
+
+def _waitress_stop_accepting(server, timeout=5):
+    """Chiude i socket in ascolto di waitress dal suo ciclo: le connessioni già aperte restano servite"""
+    sockets = getattr(server, 'map', None) or server._map     # più socket (MultiSocketServer) o uno solo
+    listeners = [obj for obj in list(sockets.values()) if obj.accepting]
+    closed = threading.Event()
+
+    def close():
+        for listener in listeners:
+            listener.del_channel()
+            listener.socket.close()
+        closed.set()
+
+    # Il ciclo usa i socket da un altro thread: la chiusura la fa lui, tramite il trigger
+    listeners[0].trigger.pull_trigger(close)
+    closed.wait(timeout)
+
+def serve_waitress(host, port, workers, threads):
+    """Un processo multi-thread con waitress (anche su Windows)
+
+    Alla chiusura si smette di accettare connessioni, si attendono
+    estrazioni e richieste in corso (il ciclo di waitress continua a
+    inviarne le risposte) e solo alla fine si chiude il server.
+    """
+    from waitress import create_server
+
+    if workers > 1:
+        print("waitress usa un solo processo: --workers ignorato")
+    server = create_server(app, host=host, port=port, threads=threads)
+    loop = threading.Thread(target=server.run, name='waitress', daemon=True)
+    _stop_on_sigterm()
+    start_background()
+    loop.start()
+    try:
+        while loop.is_alive():
+            loop.join(0.5)      # a intervalli: Ctrl+C e SIGTERM arrivano solo al thread principale
+    except KeyboardInterrupt:
+        pass
+    finally:
+        _waitress_stop_accepting(server)
+        started = time.monotonic()
+        drain()
+        # Le richieste in corso che non sono estrazioni (es. stream) hanno il tempo che resta
+        server.task_dispatcher.shutdown(timeout=max(1, DRAIN_TIMEOUT - (time.monotonic() - started)))
+        server.close()
+
+def serve_werkzeug(host, port, workers, threads):
+    """Ripiego senza dipendenze: server di Werkzeug con un thread per richiesta"""
+    from werkzeug.serving import make_server
+
+    print("Server di Werkzeug: per più processi installa gunicorn (pip install gunicorn)")
+    server = make_server(host, port, app, threaded=True)
+    _stop_on_sigterm()
+    start_background()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        drain()
+
+SERVERS = {'gunicorn': serve_gunicorn, 'waitress': serve_waitress, 'werkzeug': serve_werkzeug}
+
+def pick_server(name):
+    """Il server richiesto, oppure ('auto') il primo disponibile tra gunicorn, waitress e Werkzeug"""
+    if name != 'auto':
+        return name
+    candidates = ['waitress'] if os.name == 'nt' else ['gunicorn', 'waitress']
+    for candidate in candidates:
+        try:
+            __import__(candidate)
+            return candidate
+        except ImportError:
+            continue
+    return 'werkzeug'
+
+# ============================================================================
+# PROMPT CON BUDGET DI TOKEN
+# ============================================================================
+
+PROMPT_TEMPLATE = """Analyze this YouTube video and verify if what is said in the video is confirmed by user comments and if it has verifiable real-world evidence on the web.
+
+VIDEO TITLE: {title}
+
+TRANSCRIPT:
+{transcript}
+
+COMMENTS:
+{comments}
+
+---
+
+Please provide a comprehensive analysis that answers:
+
+1. What is the main topic of the video?
+
+2. Do user comments confirm or contradict what is said in the video?
+
+3. Are there significant discrepancies between the video content and user reactions?
+
+4. What is the general sentiment of the comments?
+
+5. **WEB VERIFICATION**: Search the web to see if the story told in the video has real and verifiable evidence. If you find relevant information, provide:
+   - Confirmation or refutation of the facts presented in the video
+   - Reliable sources that support or contradict the narrative
+   - Direct links to the sources found
+
+Limit your response to 300-400 words, including links to sources.
+
+**IMPORTANT**: Please respond in your default chat language settings (not necessarily in English)."""
+
+MAP_PROMPT_TEMPLATE = """This is part {part} of {parts} of the transcript of the YouTube video "{title}".
+
+Summarize this part in at most 200 words. Keep every claim, fact, name, date and figure that is stated, so that they can be verified later. Do not add anything that is not in the text.
+
+TRANSCRIPT (PART {part}/{parts}):
+{transcript}"""
+
+REDUCE_TRANSCRIPT_PLACEHOLDER = "[Paste here, in order, the {parts} summaries produced for the transcript parts]"
+NO_TRANSCRIPT = 'No transcript available'
+NO_COMMENTS = 'No comments available'
+
+_WORD_RE = re.compile(r'\w{5,}')
+
+def estimate_tokens(text):
+    """Stima veloce dei token: ~4 caratteri per token, ma almeno ~1.3 token per parola"""
+    return max((len(text) + 3) // 4, text.count(' ') * 4 // 3)
+
+def truncate_tokens(text, tokens):
+    """Inizio del testo la cui stima non supera tokens token, tagliato a fine parola se possibile"""
+    if estimate_tokens(text) <= tokens:
+        return text
+    tokens = max(0, tokens)
+    head = text[:tokens * 4]
+    if ' ' in head and len(head) < len(text) and not text[len(head)].isspace():
+        head = head.rsplit(' ', 1)[0]     # niente mezza parola in fondo
+    # Al massimo tokens * 3 / 4 spazi, perché la stima per parole resti nel limite
+    return ' '.join(head.split(' ')[:tokens * 3 // 4 + 1])
+
+def split_tokens(text, tokens):
+    """Divide il testo in pezzi consecutivi di al massimo tokens token (stimati)
+
+    I tagli cadono a fine parola; una "parola" più lunga del limite (per
+    esempio testo senza spazi) viene spezzata dove capita.
+    """
+    text = text.strip()
+    while text:
+        piece = truncate_tokens(text, max(1, tokens))
+        yield piece
+        text = text[len(piece):].lstrip()
+
+def _format_timestamp(ms):
+    seconds = int(ms // 1000)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+def transcript_blocks(transcript, text, block_tokens=PROMPT_BLOCK_TOKENS):
+    """Divide la trascrizione in blocchi consecutivi di circa block_tokens: (inizio ms o None, testo, token)
+
+    Con un Transcript i blocchi seguono i segmenti e hanno un tempo di
+    inizio; con il solo testo si divide per parole. Nessun blocco supera
+    block_tokens: un segmento più lungo viene diviso in più blocchi con lo
+    stesso tempo di inizio.
+    """
+    blocks = []
+    if transcript:
+        parts, tokens, start = [], 0, None
+        for segment in transcript:
+            segment_tokens = estimate_tokens(segment.text) + 1
+            if parts and (tokens + segment_tokens > block_tokens or segment_tokens > block_tokens):
+                block = ' '.join(parts)
+                blocks.append((start, block, estimate_tokens(block)))
+                parts, tokens, start = [], 0, None
+            if segment_tokens > block_tokens:
+                blocks.extend((segment.start, piece, estimate_tokens(piece))
+                              for piece in split_tokens(segment.text, block_tokens))
+                continue
+            if start is None:
+                start = segment.start
+            parts.append(segment.text)
+            tokens += segment_tokens
+        if parts:
+            block = ' '.join(parts)
+            blocks.append((start, block, estimate_tokens(block)))
+        return blocks
+
+    return [(None, block, estimate_tokens(block)) for block in split_tokens(' '.join(text.split()), block_tokens)]
+
+def _render_blocks(blocks, indexes):
+    """Testo dei blocchi scelti, con il tempo di inizio e '[...]' dove ci sono salti"""
+    lines, previous = [], None
+    for i in indexes:
+        if previous is not None and i != previous + 1:
+            lines.append('[...]')
+        start, text, _ = blocks[i]
+        lines.append(f"[{_format_timestamp(start)}] {text}" if start is not None else text)
+        previous = i
+    return '\n'.join(lines)
+
+def select_transcript(blocks, budget, keywords=frozenset()):
+    """Sceglie i blocchi della trascrizione entro budget token: (testo, token, troncata)
+
+    Se tutto non ci sta, si divide la trascrizione in tante finestre quanti
+    blocchi entrano nel budget e da ogni finestra si prende il blocco più
+    rilevante (più parole in comune con titolo e commenti più votati): la
+    copertura resta uniforme lungo tutto il video. Il testo restituito non
+    supera mai budget, anche quando non ci sta neanche un blocco intero.
+    """
+    total = sum(tokens for _, _, tokens in blocks)
+    if total + 8 * len(blocks) <= budget:
+        text = truncate_tokens(_render_blocks(blocks, range(len(blocks))), budget)
+        return text, estimate_tokens(text), False
+
+    def salience(block):
+        words = _WORD_RE.findall(block[1].lower())
+        return sum(word in keywords for word in words) / (len(words) or 1)
+
+    # Ogni blocco costa qualche token in più per il tempo "[mm:ss]" e il "[...]"
+    average = total / len(blocks)
+    windows = max(1, int(budget // (average + 8)))
+    stride = len(blocks) / windows
+
+    chosen, used = [], 0
+    for k in range(windows):
+        window = range(int(k * stride), max(int((k + 1) * stride), int(k * stride) + 1))
+        best = max(window, key=lambda i: salience(blocks[i]))
+        if used + blocks[best][2] + 8 > budget:
+            continue
+        chosen.append(best)
+        used += blocks[best][2] + 8
+
+    # Budget più piccolo di un blocco: si taglia il primo
+    text = truncate_tokens(_render_blocks(blocks, sorted(chosen) or [0]), budget)
+    return text, estimate_tokens(text), True
+
+def select_comments(items, budget):
+    """I commenti più votati che entrano in budget token: (testo, token, quanti inclusi)"""
+    buffer, used, count = io.StringIO(), 0, 0
+    for record in sorted(items, key=lambda record: record['votes'], reverse=True):
+        text = format_comment(count + 1, record)
+        # +1: la stima del testo unito può superare di poco la somma delle stime
+        tokens = estimate_tokens(text) + 1
+        if used + tokens > budget:
+            continue
+        buffer.write(text)
+        used += tokens
+        count += 1
+    text = buffer.getvalue()
+    return text, estimate_tokens(text), count
+
+def prompt_keywords(title, items, top=20):
+    """Parole significative di titolo e commenti più votati, per pesare i blocchi della trascrizione"""
+    texts = [title] + [record['text'] for record in sorted(items, key=lambda r: r['votes'], reverse=True)[:top]]
+    return frozenset(_WORD_RE.findall(' '.join(texts).lower()))
+
+def build_prompt(title, transcript_text, transcript, items, budget=PROMPT_TOKEN_BUDGET):
+    """Prompt completo entro budget token, con selezione estrattiva di trascrizione e commenti
+
+    Ai commenti va almeno la quota non riservata alla trascrizione (di più
+    se la trascrizione è corta); i token che avanzano vanno alla trascrizione.
+    Il prompt non supera mai budget secondo estimate_tokens.
+    """
+    # +2: arrotondamenti della stima quando le parti vengono unite al modello
+    template = PROMPT_TEMPLATE.format(title=title, transcript=NO_TRANSCRIPT, comments=NO_COMMENTS)
+    overhead = estimate_tokens(template) + 2
+    available = budget - overhead
+    if available <= 0:
+        raise ValueError(f"Budget troppo piccolo: il solo modello di prompt richiede {overhead} token")
+
+    blocks = transcript_blocks(transcript, transcript_text)
+    transcript_total = sum(tokens for _, _, tokens in blocks)
+
+    comments_budget = max(int(available * (1 - PROMPT_TRANSCRIPT_SHARE)), available - transcript_total)
+    comments_text, comments_tokens, included = select_comments(items, comments_budget)
+    transcript_part, transcript_tokens, truncated = select_transcript(
+        blocks, available - comments_tokens, prompt_keywords(title, items)
+    )
+
+    prompt = PROMPT_TEMPLATE.format(
+        title=title,
+        transcript=transcript_part or NO_TRANSCRIPT,
+        comments=comments_text or NO_COMMENTS,
+    )
+    return {
+        'mode': 'budget',
+        'prompt': prompt,
+        'tokens': {
+            'budget': budget,
+            'total': estimate_tokens(prompt),
+            'overhead': overhead,
+            'transcript': transcript_tokens,
+            'comments': comments_tokens,
+        },
+        'transcript_truncated': truncated,
+        'comments_included': included,
+        'comments_total': len(items),
+    }
+
+def build_map_reduce_prompts(title, transcript_text, transcript, items, budget=PROMPT_TOKEN_BUDGET):
+    """Prompt "map-reduce" per video lunghi
+
+    La trascrizione intera viene divisa in parti consecutive, ognuna in un
+    prompt "map" entro budget token che ne chiede un riassunto; il prompt
+    "reduce" contiene i commenti e lo spazio per incollare i riassunti. Ogni
+    prompt "map" e il prompt "reduce" (senza i riassunti) restano entro budget.
+    """
+    overhead = estimate_tokens(MAP_PROMPT_TEMPLATE.format(part=9999, parts=9999, title=title, transcript='')) + 2
+    available = budget - overhead
+    if available <= 5:
+        raise ValueError(f"Budget troppo piccolo: il solo modello di prompt richiede {overhead} token")
+
+    # Ogni blocco costa qualche token in più per il tempo "[mm:ss]" e l'a capo
+    blocks = transcript_blocks(transcript, transcript_text, min(PROMPT_BLOCK_TOKENS, available - 5))
+    chunks, current, used = [], [], 0
+    for block in blocks:
+        if current and used + block[2] + 5 > available:
+            chunks.append(current)
+            current, used = [], 0
+        current.append(block)
+        used += block[2] + 5
+    if current:
+        chunks.append(current)
+
+    map_prompts = []
+    for part, chunk in enumerate(chunks, 1):
+        prompt = MAP_PROMPT_TEMPLATE.format(
+            part=part, parts=len(chunks), title=title,
+            transcript=truncate_tokens(_render_blocks(chunk, range(len(chunk))), available),
+        )
+        map_prompts.append({
+            'prompt': prompt,
+            'tokens': estimate_tokens(prompt),
+            'start_ms': chunk[0][0],
+        })
+
+    # Nel prompt finale i riassunti (~300 token l'uno) prendono il posto della trascrizione
+    placeholder = REDUCE_TRANSCRIPT_PLACEHOLDER.format(parts=len(chunks))
+    reduce_template = PROMPT_TEMPLATE.format(title=title, transcript=placeholder, comments=NO_COMMENTS)
+    reduce_overhead = estimate_tokens(reduce_template) + 2
+    comments_budget = max(0, budget - reduce_overhead - 300 * len(chunks))
+    comments_text, comments_tokens, included = select_comments(items, comments_budget)
+    reduce_prompt = PROMPT_TEMPLATE.format(
+        title=title, transcript=placeholder, comments=comments_text or NO_COMMENTS
+    )
+
+    return {
+        'mode': 'map_reduce',
+        'map_prompts': map_prompts,
+        'reduce_prompt': reduce_prompt,
+        'tokens': {
+            'budget': budget,
+            'map_total': sum(p['tokens'] for p in map_prompts),
+            'reduce': estimate_tokens(reduce_prompt),
+            'comments': comments_tokens,
+        },
+        'comments_included': included,
+        'comments_total': len(items),
+    }
+
+def prompt_for_result(mode, title, transcript_text, segments, items, budget=PROMPT_TOKEN_BUDGET):
+    """Prompt ('budget' o 'map_reduce') dai campi di run_extraction, indice dei segmenti compreso
+
+    La Transcript viene ricostruita qui, così in modalità process il lavoro
+    si fa tutto nel pool e al processo principale torna solo il prompt.
+    """
+    transcript = Transcript.from_index(transcript_text, segments) if segments else None
+    builder = build_map_reduce_prompts if mode == 'map_reduce' else build_prompt
+    return builder(title, transcript_text, transcript, items, budget)
+
+# ============================================================================
+# ESPORTAZIONE BINARIA
+# ============================================================================
+
+def default_export_format():
+    """'arrow' se pyarrow è installato, altrimenti 'packed'"""
+    return 'arrow' if HAVE_PYARROW else 'packed'
+
+def export_record(video_id, info, comments):
+    """Record di un video: metadati, segmenti della trascrizione con i tempi e commenti tipizzati
+
+    I segmenti sono per colonne (start_ms, duration_ms, text); senza
+    trascrizione con i tempi le colonne sono vuote.
+    """
+    transcript = Transcript()
+    if info and info.get('segments'):
+        transcript = Transcript.from_index(info['transcript'], info['segments'])
+    return {
+        'video_id': video_id,
+        'title': info['title'] if info else None,
+        'segments': {
+            'start_ms': transcript.starts.tolist(),
+            'duration_ms': transcript.durations.tolist(),
+            'text': [segment.text for segment in transcript],
+        },
+        'comments': comments['items'] if comments else [],
+    }
+
+def iter_export_records(video_ids, langs=None, comment_opts=None, extract=False):
+    """Record dei video uno alla volta, dalla cache (anche scaduta): (ID, record o None se assente)
+
+    Con extract=True i rami mancanti vengono estratti come per /api/extract.
+    """
+    langs = langs or DEFAULT_LANGS
+    comment_opts = comment_opts or comment_options({})
+    cache = get_cache() if CACHE_ENABLED else None
+
+    for video_id in video_ids:
+        info = cache.peek(info_cache_key(video_id, langs)) if cache is not None else None
+        comments = cache.peek(comments_cache_key(video_id, comment_opts)) if cache is not None else None
+        if extract and info is None:
+            info = _export_leg(get_video_info, video_id, langs)
+        if extract and comments is None:
+            comments = _export_leg(get_comments, video_id, comment_opts)
+
+        if info is None and comments is None:
+            yield video_id, None
+        else:
+            yield video_id, export_record(video_id, info, comments)
+
+def _export_leg(func, video_id, options):
+    try:
+        return func(video_id, options)
+    except Exception as e:
+        count_error('export', type(e).__name__)
+        return None
+
+def cached_video_ids():
+    """ID dei video con titolo e trascrizione in cache, senza ripetizioni"""
+    if not CACHE_ENABLED:
+        return
+    seen = set()
+    for key in get_cache().iter_keys(f'v{CACHE_VERSION}:info:'):
+        video_id = key.split(':')[2]
+        if video_id not in seen:
+            seen.add(video_id)
+            yield video_id
+
+class ExportSink(io.RawIOBase):
+    """File in sola scrittura che accumula i byte finché non vengono ritirati (per lo streaming HTTP)"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        """I byte scritti dall'ultima chiamata"""
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+class PackedWriter:
+    """Formato 'packed': un record per video con prefisso di lunghezza, più un indice finale
+
+    Struttura: EXPORT_MAGIC e il codec (b'm' msgpack, b'j' JSON); per ogni
+    video 4 byte di lunghezza (big endian) e il record; in coda gli offset
+    dei record (8 byte ciascuno), il loro numero, la posizione dell'indice e
+    di nuovo EXPORT_MAGIC. Con mmap si arriva a un record qualunque senza
+    leggere gli altri (vedi iter_packed).
+    """
+
+    def __init__(self, out):
+        self.out = out
+        self.codec = b'm' if msgpack is not None else b'j'
+        self.offsets = []
+        out.write(EXPORT_MAGIC + self.codec)
+
+    def add(self, record):
+        if self.codec == b'm':
+            payload = msgpack.packb(record, use_bin_type=True)
+        else:
+            payload = json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self.offsets.append(self.out.tell())
+        self.out.write(struct.pack('>I', len(payload)))
+        self.out.write(payload)
+
+    def close(self):
+        index = self.out.tell()
+        self.out.write(struct.pack(f'>{len(self.offsets)}Q', *self.offsets))
+        self.out.write(struct.pack('>QQ', len(self.offsets), index) + EXPORT_MAGIC)
+
+def iter_packed(path):
+    """Legge un file 'packed' con mmap, un record alla volta"""
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if data[:len(EXPORT_MAGIC)] != EXPORT_MAGIC or data[-len(EXPORT_MAGIC):] != EXPORT_MAGIC:
+            raise ValueError(f"{path} non è un file esportato da AnalyzeTube")
+        codec = data[len(EXPORT_MAGIC):len(EXPORT_MAGIC) + 1]
+        count, index = struct.unpack_from('>QQ', data, len(data) - len(EXPORT_MAGIC) - 16)
+
+        for offset in struct.unpack_from(f'>{count}Q', data, index):
+            size, = struct.unpack_from('>I', data, offset)
+            payload = data[offset + 4:offset + 4 + size]
+            yield msgpack.unpackb(payload, raw=False) if codec == b'm' else json.loads(payload)
+
+def arrow_schema():
+    """Schema Arrow: una riga per video ('video'), per segmento ('segment') e per commento ('comment')"""
+    pa = pyarrow
+    return pa.schema([
+        ('video_id', pa.string()),
+        ('kind', pa.string()),
+        ('title', pa.string()),
+        ('start_ms', pa.int64()),
+        ('duration_ms', pa.int64()),
+        ('text', pa.string()),
+        ('comment_id', pa.string()),
+        ('author', pa.string()),
+        ('votes', pa.int64()),
+        ('time', pa.string()),
+        ('reply', pa.bool_()),
+    ])
+
+class ArrowWriter:
+    """Formato 'arrow': file IPC di Arrow con un record batch per video
+
+    Si apre con pyarrow.ipc.open_file(pyarrow.memory_map(path)) e si legge
+    senza copie; le colonne che non riguardano il tipo di riga sono nulle.
+    """
+
+    def __init__(self, out):
+        self.schema = arrow_schema()
+        self._writer = pyarrow_ipc.new_file(out, self.schema)
+
+    def add(self, record):
+        video_id, segments, comments = record['video_id'], record['segments'], record['comments']
+        rows = 1 + len(segments['start_ms']) + len(comments)
+        nulls = [None] * len(segments['start_ms'])
+        columns = {
+            'video_id': [video_id] * rows,
+            'kind': ['video'] + ['segment'] * len(nulls) + ['comment'] * len(comments),
+            'title': [record['title']] + [None] * (rows - 1),
+            'start_ms': [None] + segments['start_ms'] + [None] * len(comments),
+            'duration_ms': [None] + segments['duration_ms'] + [None] * len(comments),
+            'text': [None] + segments['text'] + [c['text'] for c in comments],
+        }
+        for name, field in (('comment_id', 'id'), ('author', 'author'), ('votes', 'votes'),
+                            ('time', 'time'), ('reply', 'reply')):
+            columns[name] = [None] + nulls + [c.get(field) for c in comments]
+        self._writer.write_batch(pyarrow.RecordBatch.from_pydict(columns, schema=self.schema))
+
+    def close(self):
+        self._writer.close()
+
+EXPORT_WRITERS = {'arrow': ArrowWriter, 'packed': PackedWriter}
+
+def export_to(out, records, export_format):
+    """Scrive i record in out nel formato indicato: restituisce (esportati, mancanti)
+
+    records viene consumato un video alla volta, quindi la memoria non
+    cresce con il numero di video.
+    """
+    writer = EXPORT_WRITERS[export_format](out)
+    exported, missing = 0, 0
+    for _, record in records:
+        if record is None:
+            missing += 1
+            continue
+        writer.add(record)
+        exported += 1
+    writer.close()
+    return exported, missing
+
+def run_dump(args):
+    """Comando dump: esporta in un file i video indicati (o tutti quelli in cache)"""
+    export_format = args.format or default_export_format()
+    if export_format == 'arrow' and not HAVE_PYARROW:
+        sys.exit("Il formato arrow richiede pyarrow (pip install pyarrow)")
+
+    def video_ids():
+        seen = set()
+        inputs = list(args.ids)
+        if args.from_file:
+            with open(args.from_file, encoding='utf-8') as f:
+                inputs = chain(inputs, (line.strip() for line in f if line.strip()))
+        for item in chain(inputs, cached_video_ids() if args.all else ()):
+            video_id = extract_video_id(item) or item
+            if video_id not in seen:
+                seen.add(video_id)
+                yield video_id
+
+    # File temporaneo rinominato alla fine: un dump interrotto non lascia un file a metà
+    temporary = args.output + '.tmp'
+    with open(temporary, 'wb') as out:
+        exported, missing = export_to(out, iter_export_records(video_ids(), extract=args.extract), export_format)
+    os.replace(temporary, args.output)
+    print(f"{exported} video esportati in {args.output} ({export_format}), {missing} non in cache")
+
+# ============================================================================
+# RISORSE STATICHE
+# ============================================================================
+
+class StaticAsset:
+    """Risorsa generata all'avvio: hash del contenuto e varianti già compresse"""
+
+    def __init__(self, text, mimetype):
+        self.body = text.encode('utf-8')
+        self.mimetype = mimetype
+        self.digest = hashlib.sha256(self.body).hexdigest()[:ASSET_HASH_LENGTH]
+        self.variants = {None: self.body, 'gzip': gzip.compress(self.body, compresslevel=ASSET_GZIP_LEVEL, mtime=0)}
+        if brotli is not None:
+            self.variants['br'] = brotli.compress(self.body, quality=ASSET_BROTLI_QUALITY)
+
+    def stats(self):
+        return {'hash': self.digest, 'sizes': {encoding or 'identity': len(body) for encoding, body in self.variants.items()}}
+
+def build_assets():
+    """Pagina HTML e risorse CSS/JS, con l'hash del contenuto nel nome dei file"""
+    css = StaticAsset(PAGE_CSS, 'text/css')
+    js = StaticAsset(PAGE_JS, 'application/javascript')
+    assets = {f'app.{css.digest}.css': css, f'app.{js.digest}.js': js}
+
+    page = HTML_TEMPLATE.replace('__CSS_URL__', f'/assets/app.{css.digest}.css')
+    page = page.replace('__JS_URL__', f'/assets/app.{js.digest}.js')
+    return StaticAsset(page, 'text/html'), assets
+
+INDEX_PAGE, STATIC_ASSETS = build_assets()
+
+def asset_response(asset, cache_control):
+    """Variante già compressa adatta al client, con ETag: 304 se il client ha già questa versione"""
+    encoding = _preferred_encoding()
+    if encoding not in asset.variants:
+        encoding = None
+
+    response = Response(asset.variants[encoding], mimetype=asset.mimetype)
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.set_etag(f'{asset.digest}-{encoding or "identity"}')
+    response.headers['Cache-Control'] = cache_control
+    return response.make_conditional(request)
 
 # ============================================================================
 # ROUTES FLASK
 # ============================================================================
 
+@app.before_request
+def start_request_timing():
+    """Apre la raccolta delle fasi della richiesta (header Server-Timing)"""
+    g.started = time.perf_counter()
+    _server_timing.set([])
+
+@app.after_request
+def record_request_metrics(response):
+    """Durata e stato della richiesta nelle metriche, fasi nell'header Server-Timing"""
+    elapsed = time.perf_counter() - g.get('started', time.perf_counter())
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    metrics.observe('analyzetube_http_request_seconds', elapsed, endpoint=endpoint)
+    metrics.inc('analyzetube_http_requests_total', endpoint=endpoint, method=request.method,
+                status=response.status_code)
+
+    stages = _server_timing.get()
+    if stages is not None:
+        response.headers['Server-Timing'] = server_timing_header(stages, elapsed)
+    return response
+
+@app.before_request
+def reject_while_draining():
+    """Durante la chiusura rifiuta le nuove richieste (tranne /healthz)"""
+    if _draining.is_set() and request.path != '/healthz':
+        return jsonify({'error': 'Server in chiusura, riprova tra poco'}), 503
+    return None
+
+@app.route('/healthz')
+def healthz():
+    """Stato del processo per il bilanciatore: 503 durante la chiusura"""
+    status = 'draining' if _draining.is_set() else 'ok'
+    payload = {'status': status, 'pid': os.getpid(), 'in_flight': _inflight.stats()['in_flight']}
+    return jsonify(payload), 503 if _draining.is_set() else 200
+
 @app.route('/')
 def index():
-    """Serve la pagina HTML"""
-    return HTML_TEMPLATE
-
-@app.route('/api/extract', methods=['POST'])
+    """Serve la pagina HTML, sempre rivalidata: punta alle risorse della versione corrente"""
+    return asset_response(INDEX_PAGE, 'no-cache')
+
+@app.route('/assets/<name>')
+def static_asset(name):
+    """CSS e JS della pagina, in cache a lungo: il nome cambia con il contenuto"""
+    asset = STATIC_ASSETS.get(name)
+    if asset is None:
+        return jsonify({'error': 'Risorsa non trovata'}), 404
+    return asset_response(asset, f'public, max-age={ASSET_MAX_AGE}, immutable')
+
+def conditional_json(video_id, payload):
+    """Risposta JSON con ETag; per le GET con If-None-Match corrispondente diventa un 304"""
+    with timed('serialize'):
+        response = jsonify(payload)
+        etag = content_etag(video_id, payload)
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+@app.route('/api/extract', methods=['GET', 'POST'])
 def extract_video_data():
-    """API per estrarre trascrizione e commenti"""
-    data = request.get_json()
+    """API per estrarre trascrizione e commenti
+
+    In GET i parametri sono nella query string e la risposta supporta
+    If-None-Match. Con transcript_offset e/o comments_page restituisce solo
+    la pagina richiesta delle rispettive sezioni; con fields (es.
+    'title,comments') estrae solo i campi indicati.
+    """
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Il corpo JSON deve essere un oggetto'}), 400
+        data = {**request.args.to_dict(), **data}
+    else:
+        data = request.args
+    refresh = parse_flag(data.get('refresh'))
     video_url = data.get('url', '')
 
     video_id = extract_video_id(video_url)
     if not video_id:
         return jsonify({'error': 'URL YouTube non valido'}), 400
 
-    try:
-        video_info = extract_video_info(video_id)
-        comments = extract_comments(video_id)
+    sections = paged_sections(data)
+    if sections:
+        try:
+            return conditional_json(video_id, extract_page(video_id, data, sections))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            return jsonify({'error': f'Errore durante l\'estrazione: {str(e)}'}), 502
 
-        return jsonify({
-            'success': True,
-            'title': video_info['title'],
-            'transcript': video_info['transcript'],
-            'comments': comments,
-            'video_id': video_id
-        })
+    try:
+        result = run_extraction(video_id, langs=parse_langs(data), comment_opts=comment_options(data),
+                                refresh=refresh, fields=parse_fields(data))
+
+        # Entrambi i rami falliti: nessun dato parziale da mostrare
+        error = extraction_error(result)
+        if error:
+            return jsonify({
+                'error': error,
+                'errors': result['errors'],
+                'timings': result['timings'],
+            }), 502
+
+        response = conditional_json(video_id, {'success': True, **result})
+        response.headers['X-Cache'] = cache_header(result['cache'])
+        response.headers['X-Cache-Detail'] = ', '.join(f"{name}={status}" for name, status in result['cache'].items())
+        return response
 
     except Exception as e:
         return jsonify({
             'error': f'Errore durante l\'estrazione: {str(e)}'
         }), 500
 
+@app.route('/api/extract/batch', methods=['POST'])
+def extract_batch():
+    """API batch: estrae più video (o playlist) e restituisce NDJSON man mano"""
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Il corpo JSON deve essere un oggetto'}), 400
+    items = data.get('urls') or data.get('ids') or []
+    if isinstance(items, str):
+        items = [items]
+
+    if not items:
+        return jsonify({'error': 'Nessun URL fornito'}), 400
+
+    videos, failures, truncated = resolve_batch_inputs(items)
+
+    return Response(
+        stream_with_context(stream_batch(videos, failures, truncated, langs=parse_langs(data),
+                                         comment_opts=comment_options(data), refresh=parse_flag(data.get('refresh')))),
+        mimetype='application/x-ndjson'
+    )
+
+@app.route('/api/extract/stream')
+def extract_stream():
+    """API di streaming (SSE): invia titolo, trascrizione e commenti appena pronti"""
+    video_id = extract_video_id(request.args.get('url', ''))
+    if not video_id:
+        return jsonify({'error': 'URL YouTube non valido'}), 400
+
+    events = stream_extraction(video_id, langs=parse_langs(request.args), comment_opts=comment_options(request.args),
+                               refresh=parse_flag(request.args.get('refresh')))
+    if parse_flag(request.args.get('lazy')):
+        events = lazy_events(events)
+
+    return Response(
+        stream_with_context(sse_event(name, data) for name, data in events),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/comments')
+def comments_stream():
+    """API commenti in streaming: testo o NDJSON scritti man mano, a memoria costante
+
+    Parametri: url, comments_limit, min_length, min_votes, comments_mode,
+    comments_latest, format (text | ndjson). In modalità refresh i commenti
+    arrivano dall'archivio locale, già completi.
+    """
+    video_id = extract_video_id(request.args.get('url', ''))
+    if not video_id:
+        return jsonify({'error': 'URL YouTube non valido'}), 400
+
+    options = comment_options(request.args)
+    if options['mode'] == 'refresh':
+        records = refresh_comments(video_id, options)['items']
+    else:
+        records = CommentPipeline(video_id, options['limit'], options['min_length'], options['min_votes'])
+
+    if request.args.get('format') == 'ndjson':
+        lines = (json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+        return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+
+    chunks = (chunk for chunk, _ in iter_comment_chunks(records))
+    return Response(stream_with_context(chunks), mimetype='text/plain')
+
+@app.route('/api/transcript')
+def transcript_segments():
+    """API trascrizione con tempi
+
+    Parametri: url, langs e in alternativa
+      - start/end (secondi): segmenti nell'intervallo (default: tutti)
+      - at (secondi): segmento pronunciato in quell'istante
+      - char_start/char_end: intervallo di tempo di un tratto del testo
+    """
+    video_id = extract_video_id(request.args.get('url', ''))
+    if not video_id:
+        return jsonify({'error': 'URL YouTube non valido'}), 400
+
+    try:
+        info = get_video_info(video_id, parse_langs(request.args))
+    except Exception as e:
+        return jsonify({'error': f"Impossibile estrarre informazioni: {str(e)}"}), 502
+
+    if not info.get('segments'):
+        return jsonify({'error': info['transcript'], 'video_id': video_id}), 404
+
+    transcript = Transcript.from_index(info['transcript'], info['segments'])
+    args = request.args
+
+    try:
+        if 'at' in args:
+            index = transcript.index_at(float(args['at']) * 1000)
+            return jsonify({
+                'video_id': video_id,
+                'segment': transcript[index].to_dict() if index is not None else None,
+            })
+
+        if 'char_start' in args:
+            char_start = int(args['char_start'])
+            time_range = transcript.time_range(char_start, int(args.get('char_end', char_start + 1)))
+            return jsonify({'video_id': video_id, 'start_ms': time_range[0], 'end_ms': time_range[1]})
+
+        start = float(args.get('start', 0)) * 1000
+        end = float(args['end']) * 1000 if 'end' in args else float('inf')
+    except ValueError:
+        return jsonify({'error': 'Parametri non validi'}), 400
+
+    segments = transcript.segments_between(start, end) if (start or 'end' in args) else list(transcript)
+    return jsonify({
+        'video_id': video_id,
+        'title': info['title'],
+        'segment_count': len(transcript),
+        'segments': [segment.to_dict() for segment in segments],
+    })
+
+@app.route('/api/search')
+def search_extracted():
+    """Ricerca full-text nei video già estratti, senza rieseguire estrazioni
+
+    Parametri: q (parole o "frasi" tra virgolette, tutte richieste), kind
+    (transcript | comment), url (limita a un video), limit, offset. Ogni
+    risultato ha ID e titolo del video, estratto e, per la trascrizione,
+    tempo di inizio e link al punto esatto.
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Parametro q mancante'}), 400
+    if not SEARCH_ENABLED:
+        return jsonify({'error': 'Indice di ricerca disabilitato'}), 503
+
+    kind = request.args.get('kind')
+    if kind not in (None, 'transcript', 'comment'):
+        return jsonify({'error': 'kind deve essere transcript o comment'}), 400
+    video_id = None
+    if request.args.get('url'):
+        video_id = extract_video_id(request.args['url'])
+        if not video_id:
+            return jsonify({'error': 'URL YouTube non valido'}), 400
+
+    try:
+        limit = _page_number(request.args, 'limit', SEARCH_DEFAULT_LIMIT, 1, SEARCH_MAX_LIMIT)
+        offset = _page_number(request.args, 'offset', 0, 0, 10**6)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    index = get_search_index()
+    with timed('search'):
+        hits = index.search(query, kind, video_id, limit, offset)
+    return jsonify({'query': query, 'engine': index.engine, 'offset': offset, 'count': len(hits), 'results': hits})
+
+@app.route('/api/prompt', methods=['POST'])
+def build_prompt_api():
+    """API prompt: prompt per ChatGPT entro un budget di token, con i conteggi
+
+    Parametri JSON: url, token_budget, mode ('budget' o 'map_reduce'),
+    più langs e le opzioni dei commenti come per /api/extract.
+    """
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Il corpo JSON deve essere un oggetto'}), 400
+    video_id = extract_video_id(data.get('url', ''))
+    if not video_id:
+        return jsonify({'error': 'URL YouTube non valido'}), 400
+
+    try:
+        budget = int(data.get('token_budget', PROMPT_TOKEN_BUDGET))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'token_budget non valido'}), 400
+    budget = max(PROMPT_MIN_BUDGET, min(budget, PROMPT_MAX_BUDGET))
+
+    result = run_extraction(video_id, langs=parse_langs(data), comment_opts=comment_options(data), segments=True)
+    error = extraction_error(result)
+    if error:
+        return jsonify({'error': error}), 502
+
+    try:
+        with timed('prompt'):
+            prompt = run_cpu('prompt', prompt_for_result, data.get('mode'), result['title'], result['transcript'],
+                             result['segments'], result['comment_items'], budget)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({'video_id': video_id, **prompt})
+
+@app.route('/api/export')
+def export_videos():
+    """Esportazione binaria di più video, scritta man mano (un video alla volta)
+
+    Parametri: ids (ID o URL separati da virgole), format (arrow | packed),
+    extract=1 per estrarre i video non in cache, più langs e le opzioni dei
+    commenti come /api/extract. I video assenti vengono saltati.
+    """
+    items = [item.strip() for item in request.args.get('ids', '').split(',') if item.strip()]
+    if not items:
+        return jsonify({'error': 'Parametro ids mancante'}), 400
+    if len(items) > EXPORT_MAX_IDS:
+        return jsonify({'error': f'Al massimo {EXPORT_MAX_IDS} video per richiesta'}), 400
+
+    video_ids = []
+    for item in items:
+        video_id = extract_video_id(item)
+        if not video_id:
+            return jsonify({'error': f'URL YouTube non valido: {item}'}), 400
+        if video_id not in video_ids:
+            video_ids.append(video_id)
+
+    export_format = request.args.get('format') or default_export_format()
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"Formato non valido: usa {' o '.join(EXPORT_FORMATS)}"}), 400
+    if export_format == 'arrow' and not HAVE_PYARROW:
+        return jsonify({'error': 'Il formato arrow richiede pyarrow sul server'}), 400
+
+    records = iter_export_records(video_ids, parse_langs(request.args), comment_options(request.args),
+                                  extract=parse_flag(request.args.get('extract')))
+
+    def generate():
+        sink = ExportSink()
+        writer = EXPORT_WRITERS[export_format](sink)
+        for _, record in records:
+            if record is not None:
+                writer.add(record)
+                yield sink.drain()
+        writer.close()
+        yield sink.drain()
+
+    mimetype = 'application/vnd.apache.arrow.file' if export_format == 'arrow' else 'application/octet-stream'
+    response = Response(generate(), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=analyzetube.{export_format}'
+    return response
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Metriche del processo nel formato testuale di Prometheus"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/stats')
+def stats():
+    """Statistiche di cache, coalescenza, job, limite verso YouTube e riutilizzo delle risorse"""
+    return jsonify({
+        'cache': get_cache().stats() if CACHE_ENABLED else None,
+        'coalescing': _inflight.stats(),
+        'youtube': _youtube_limiter.stats(),
+        'jobs': _jobs.stats() if _jobs is not None else None,
+        'resources': resource_stats(),
+        'comment_store': get_comment_store().stats() if COMMENT_STORE_ENABLED else None,
+        'search': get_search_index().stats() if SEARCH_ENABLED else None,
+        'prefetch': _prefetcher.stats() if _prefetcher is not None else None,
+        'assets': {name: asset.stats() for name, asset in [('index', INDEX_PAGE), *STATIC_ASSETS.items()]},
+    })
+
+@app.route('/api/watchlist', methods=['GET', 'POST', 'DELETE'])
+def watchlist():
+    """Watchlist del prefetch: GET elenca, POST {"url": ...} aggiunge, DELETE ?url=... toglie"""
+    if not PREFETCH_ENABLED:
+        return jsonify({'error': 'Prefetch disabilitato'}), 503
+    prefetcher = get_prefetcher()
+
+    if request.method == 'GET':
+        return jsonify({'watchlist': prefetcher.watchlist(), **prefetcher.stats()})
+
+    data = (request.get_json(silent=True) or {}) if request.method == 'POST' else request.args
+    url = str(data.get('url', '')).strip()
+    if request.method == 'DELETE':
+        if not prefetcher.remove(url):
+            return jsonify({'error': 'URL non presente nella watchlist'}), 404
+        return jsonify({'success': True, 'url': url})
+
+    if not is_collection_url(url):
+        return jsonify({'error': "Serve l'URL di un canale o di una playlist YouTube"}), 400
+    prefetcher.add(url)
+    return jsonify({'success': True, 'url': url}), 201
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """API asincrona: accoda l'estrazione e restituisce subito l'ID del job"""
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Il corpo JSON deve essere un oggetto'}), 400
+    video_id = extract_video_id(data.get('url', ''))
+    if not video_id:
+        return jsonify({'error': 'URL YouTube non valido'}), 400
+
+    job_id = get_job_queue().submit({
+        'video_id': video_id,
+        'langs': parse_langs(data),
+        'comments': comment_options(data),
+        'refresh': parse_flag(data.get('refresh')),
+    })
+
+    return jsonify({
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': f'/api/jobs/{job_id}',
+    }), 202
+
+@app.route('/api/jobs/<job_id>')
+def job_status(job_id):
+    """Stato, avanzamento e (a job concluso) risultato di un job"""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job non trovato'}), 404
+    return jsonify(job)
+
+# ============================================================================
+# BENCHMARK OFFLINE
+# ============================================================================
+
+# Chiavi del dizionario info di yt-dlp che servono all'estrazione (il resto è ingombro)
+FIXTURE_INFO_KEYS = ('id', 'title', 'duration', 'subtitles', 'automatic_captions')
+
+def record_fixture(video_id, directory=FIXTURES_DIR, comments=BENCH_SYNTHETIC_COMMENTS):
+    """Registra da YouTube info, tracce di sottotitoli candidate e commenti di un video"""
+    info = fetch_raw_info(video_id)
+    tracks = {}
+    for lang, automatic, ext, url in rank_subtitle_tracks(info, DEFAULT_LANGS)[:SUBTITLE_PARALLEL]:
+        tracks[url] = get_http_session().get(url, timeout=10).text
+
+    fixture = {
+        'video_id': video_id,
+        'info': {key: info.get(key) for key in FIXTURE_INFO_KEYS},
+        'tracks': tracks,
+        'comments': list(iter_raw_comments(video_id, comments)),
+    }
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{video_id}.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(fixture, f, ensure_ascii=False)
+    return path
+
+def synthetic_fixture(minutes, comments=BENCH_SYNTHETIC_COMMENTS):
+    """Video finto di minutes minuti: trascrizione json3 parola per parola e commenti casuali"""
+    rng = random.Random(minutes)
+    video_id = f'synth{minutes:06d}'[-11:]
+    words = ('the', 'video', 'shows', 'that', 'this', 'claim', 'is', 'true', 'according', 'to', 'data',
+             'research', 'people', 'really', 'think', 'about', 'it', 'and', 'we', 'see')
+
+    events = []
+    for start in range(0, minutes * 60 * 1000, 2500):
+        segs = [{'utf8': (' ' if i else '') + rng.choice(words), 'tOffsetMs': i * 300} for i in range(8)]
+        events.append({'tStartMs': start, 'dDurationMs': 2500, 'segs': segs})
+        events.append({'tStartMs': start + 2400, 'dDurationMs': 100, 'segs': [{'utf8': '\n'}]})
+
+    url = f'https://www.youtube.com/api/timedtext?v={video_id}&lang=en&fmt=json3'
+    captions = {lang: [{'ext': 'json3', 'url': url.replace('lang=en', f'lang={lang}')}] for lang in ('en', 'de', 'fr')}
+    return {
+        'video_id': video_id,
+        'info': {'id': video_id, 'title': f'Video sintetico di {minutes} minuti', 'duration': minutes * 60,
+                 'subtitles': {}, 'automatic_captions': captions},
+        'tracks': {url: json.dumps({'events': events})},
+        'comments': [
+            # Come su YouTube, l'ID di una risposta è 'commento.risposta'
+            {'cid': f'c{i - 1}.r{i}' if reply else f'c{i}', 'author': f'@utente{rng.randint(1, 999)}',
+             'time': '2 days ago', 'text': ' '.join(rng.choice(words) for _ in range(rng.randint(2, 60))),
+             'votes': str(rng.choice((0, 3, 12, 250, '1.2K'))), 'reply': reply}
+            for i, reply in ((i, rng.random() < 0.2) for i in range(comments))
+        ],
+    }
+
+def load_fixtures(directory=FIXTURES_DIR):
+    """Fixture registrate nella cartella (lista vuota se non ce ne sono)"""
+    if not os.path.isdir(directory):
+        return []
+    fixtures = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.json'):
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                fixtures.append(json.load(f))
+    return fixtures
+
+def _stub_endpoint(token):
+    """Endpoint di continuazione dell'API dei commenti, come nella pagina di YouTube"""
+    return {'commandMetadata': {'webCommandMetadata': {'apiUrl': '/youtubei/v1/next'}},
+            'continuationCommand': {'token': token}}
+
+def stub_watch_page(video_id):
+    """Pagina del video ridotta a ciò che legge youtube-comment-downloader: ytcfg e menu di ordinamento"""
+    ytcfg = {'INNERTUBE_API_KEY': 'bench', 'INNERTUBE_CONTEXT': {'client': {'hl': 'en', 'clientName': 'WEB'}}}
+    data = {'contents': {
+        'itemSectionRenderer': {'contents': [{'continuationItemRenderer': {'trigger': 'CONTINUATION_TRIGGER_ON_ITEM_SHOWN'}}]},
+        'sortFilterSubMenuRenderer': {'subMenuItems': [
+            {'serviceEndpoint': _stub_endpoint(f'{video_id}:0')} for _ in ('popular', 'recent')
+        ]},
+    }}
+    return (f'<html><script>ytcfg.set({json.dumps(ytcfg)});</script>'
+            f'<script>var ytInitialData = {json.dumps(data)};</script></html>')
+
+def stub_comments_page(comments, token):
+    """Risposta di /youtubei/v1/next per il token 'video:inizio': una pagina di commenti e la continuazione"""
+    video_id, _, start = token.rpartition(':')
+    start = int(start or 0)
+    page = comments.get(video_id, [])[start:start + BENCH_COMMENTS_PAGE]
+    following = []
+    if start + BENCH_COMMENTS_PAGE < len(comments.get(video_id, [])):
+        following.append({'continuationItemRenderer': {
+            'continuationEndpoint': _stub_endpoint(f'{video_id}:{start + BENCH_COMMENTS_PAGE}')}})
+
+    mutations = [{'payload': {'commentEntityPayload': {
+        'properties': {'commentId': c['cid'], 'content': {'content': c['text']}, 'publishedTime': c['time'],
+                       'toolbarStateKey': f"toolbar-{c['cid']}"},
+        'author': {'displayName': c['author'], 'channelId': '', 'avatarThumbnailUrl': ''},
+        'toolbar': {'likeCountNotliked': str(c.get('votes', '0')), 'replyCount': '0'},
+    }}} for c in page]
+    mutations += [{'payload': {'engagementToolbarStateEntityPayload': {'key': f"toolbar-{c['cid']}"}}} for c in page]
+    return {
+        'onResponseReceivedEndpoints': [{'appendContinuationItemsAction': {
+            'targetId': 'comments-section', 'continuationItems': following}}],
+        'frameworkUpdates': {'entityBatchUpdate': {'mutations': mutations}},
+    }
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Finto YouTube: pagina del video e pagine dei commenti, tracce e dizionari info; il resto è 404"""
+
+    protocol_version = 'HTTP/1.1'   # keep-alive, come YouTube: i pool di connessioni si misurano davvero
+
+    def do_GET(self):
+        path, _, query = self.path.partition('?')
+        server = self.server
+        if path == '/watch':
+            video_id = parse_qs(query).get('v', [''])[0]
+            page = stub_watch_page(video_id) if video_id in server.comments else None
+            self._reply(page and page.encode(), 'text/html', server.page_latency)
+        elif path.startswith('/bench/info/'):
+            self._reply(server.infos.get(path.rsplit('/', 1)[1]), 'application/json', server.info_latency)
+        else:
+            self._reply(server.tracks.get(self.path), 'application/json', server.latency)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+        page = None
+        if self.path.startswith('/youtubei/v1/next'):
+            page = json.dumps(stub_comments_page(self.server.comments, body.get('continuation', ''))).encode()
+        self._reply(page, 'application/json', self.server.page_latency)
+
+    def _reply(self, body, content_type, latency):
+        time.sleep(latency)
+        if body is not None and random.random() < self.server.error_rate:
+            body, status = b'', 503     # errore iniettato: lo vedono retry e limitatore
+        else:
+            status = 404 if body is None else 200
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body or b'')))
+        self.end_headers()
+        self.wfile.write(body or b'')
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub_server(fixtures, latency, info_latency, page_latency, error_rate=0.0):
+    """Avvia il finto YouTube locale con le fixture; base_url è il suo indirizzo
+
+    error_rate è la quota di risposte sostituite da un 503.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StubHandler)
+    server.daemon_threads = True
+    server.latency, server.info_latency, server.page_latency = latency, info_latency, page_latency
+    server.error_rate = error_rate
+    server.base_url = f'http://127.0.0.1:{server.server_port}'
+    server.infos = {fixture['video_id']: json.dumps(fixture['info']).encode() for fixture in fixtures}
+    server.comments = {fixture['video_id']: fixture['comments'] for fixture in fixtures}
+    server.tracks = {}
+    for fixture in fixtures:
+        for url, body in fixture['tracks'].items():
+            # Le tracce si servono all'URL originale: l'host lo sostituisce StubAdapter
+            parsed = urlparse(url)
+            server.tracks[parsed.path + (f'?{parsed.query}' if parsed.query else '')] = body.encode()
+
+    threading.Thread(target=server.serve_forever, name='bench-stub', daemon=True).start()
+    return server
+
+class StubAdapter(ThrottledAdapter):
+    """ThrottledAdapter che manda al server locale del benchmark le richieste HTTPS, qualunque sia l'host"""
+
+    def __init__(self, base_url, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url
+
+    def send(self, request, **kwargs):
+        request.url = self.base_url + request.path_url
+        return super().send(request, **kwargs)
+
+def stub_session(session, base_url):
+    """Sessione configurata da _tune_session, con le richieste HTTPS dirottate su base_url"""
+    tuned = session.get_adapter('https://')
+    session.mount('https://', StubAdapter(base_url, pool_connections=HTTP_POOL_CONNECTIONS,
+                                          pool_maxsize=HTTP_POOL_SIZE, max_retries=tuned.max_retries))
+    return session
+
+def bench_extractor(base_url):
+    """Estrattore yt-dlp per gli URL dei video YouTube che scarica il dizionario info dal server locale"""
+    InfoExtractor = importlib.import_module('yt_dlp.extractor.common').InfoExtractor
+
+    class BenchIE(InfoExtractor):
+        IE_NAME = 'analyzetube:bench'
+        _VALID_URL = r'https?://www\.youtube\.com/watch\?v=(?P<id>[\w-]+)'
+
+        def _real_extract(self, url):
+            video_id = self._match_id(url)
+            info = self._download_json(f'{base_url}/bench/info/{video_id}', video_id)
+            # Con process=True yt-dlp vuole almeno un formato
+            info.setdefault('formats', [{'format_id': 'bench', 'url': f'{base_url}/bench/media', 'ext': 'mp4'}])
+            return info
+
+    return BenchIE
+
+@contextmanager
+def replay_fixtures(server):
+    """Manda yt-dlp, il downloader dei commenti e la sessione HTTP al server locale, senza cache
+
+    Le richieste passano dai client veri (pool di risorse, ThrottledAdapter,
+    retry, limitatore): cambia solo la destinazione. Il limitatore resta
+    attivo ma senza tetto, così le sue statistiche sono quelle del carico.
+    """
+    global _ydl_pools, _ydl_extractors, _http_session, _comment_downloaders, _youtube_limiter
+    global CACHE_ENABLED, COMMENT_STORE_ENABLED, SEARCH_ENABLED, PREFETCH_ENABLED
+    saved = (_ydl_pools, _ydl_extractors, _http_session, _comment_downloaders, _youtube_limiter,
+             CACHE_ENABLED, COMMENT_STORE_ENABLED, SEARCH_ENABLED, PREFETCH_ENABLED)
+
+    def new_downloader():
+        downloader = _new_comment_downloader()
+        stub_session(downloader.session, server.base_url)
+        return downloader
+
+    with _resources_lock:
+        _ydl_pools, _ydl_extractors = {}, (bench_extractor(server.base_url),)
+        _http_session = stub_session(_tune_session(requests.Session()), server.base_url)
+    _comment_downloaders = ResourcePool(new_downloader, COMMENT_DOWNLOADER_POOL_SIZE)
+    _youtube_limiter = OutboundLimiter(rate=1e9, burst=1e9)
+    CACHE_ENABLED = COMMENT_STORE_ENABLED = SEARCH_ENABLED = PREFETCH_ENABLED = False
+    try:
+        yield
+    finally:
+        with _resources_lock:
+            (_ydl_pools, _ydl_extractors, _http_session, _comment_downloaders, _youtube_limiter,
+             CACHE_ENABLED, COMMENT_STORE_ENABLED, SEARCH_ENABLED, PREFETCH_ENABLED) = saved
+
+def latency_summary(values):
+    """p50/p95/p99, media, minimo e massimo (ms) di una lista di durate in secondi"""
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))] * 1000
+
+    return {
+        'p50': round(percentile(50), 2),
+        'p95': round(percentile(95), 2),
+        'p99': round(percentile(99), 2),
+        'mean': round(sum(ordered) / len(ordered) * 1000, 2),
+        'min': round(ordered[0] * 1000, 2),
+        'max': round(ordered[-1] * 1000, 2),
+    }
+
+def run_load(base_url, video_ids, total, concurrency):
+    """total richieste POST /api/extract con concurrency client in parallelo"""
+    session = requests.Session()
+    session.mount('http://', HTTPAdapter(pool_maxsize=concurrency))
+    statuses = {}
+
+    def one(i):
+        start = time.perf_counter()
+        response = session.post(f'{base_url}/api/extract', json={'url': video_ids[i % len(video_ids)]})
+        partial = response.ok and bool(response.json().get('partial'))
+        return time.perf_counter() - start, response.status_code, partial
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    wall = time.perf_counter() - started
+
+    for _, status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'requests': total,
+        'concurrency': concurrency,
+        'statuses': statuses,
+        'partial': sum(partial for _, _, partial in results),   # 200 con un ramo fallito
+        'throughput_rps': round(total / wall, 2),
+        'latency_ms': latency_summary([elapsed for elapsed, _, _ in results]),
+    }
+
+def _repeat(func, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return latency_summary(durations)
+
+def micro_benchmarks(fixtures, repeat):
+    """Tempi di parsing dei sottotitoli e formattazione dei commenti per ogni fixture"""
+    results = {}
+    for fixture in fixtures:
+        video_id = fixture['video_id']
+        for body in fixture['tracks'].values():
+            data = body.encode()
+            chunks = [data[i:i + SUBTITLE_CHUNK] for i in range(0, len(data), SUBTITLE_CHUNK)]
+            results[f'subtitle_parse:{video_id}:{len(data) // 1024}KB'] = _repeat(
+                lambda: parse_subtitles(chunks), repeat)
+        if fixture['comments']:
+            results[f'comment_format:{video_id}:{len(fixture["comments"])}'] = _repeat(
+                lambda: ''.join(format_comment(i, comment_record(c)) for i, c in enumerate(fixture['comments'], 1)),
+                repeat)
+    return results
+
+def compare_results(previous, current):
+    """Righe di confronto con un'esecuzione precedente (throughput e percentili)"""
+    lines = []
+    before, after = previous.get('load', {}), current['load']
+    pairs = [('throughput_rps', before.get('throughput_rps'), after['throughput_rps'])]
+    pairs += [(f'latency {p}', before.get('latency_ms', {}).get(p), after['latency_ms'].get(p))
+              for p in ('p50', 'p95', 'p99')]
+    for name, old, new in pairs:
+        if old:
+            lines.append(f'{name}: {old} -> {new} ({(new - old) / old * 100:+.1f}%)')
+    return lines
+
+def run_benchmark(args):
+    """Sottocomando bench: registra fixture oppure misura l'estrazione su quelle disponibili"""
+    if args.record:
+        for url in args.record:
+            print(f"Registrata: {record_fixture(extract_video_id(url) or url, args.fixtures)}")
+        return
+
+    fixtures = load_fixtures(args.fixtures)
+    if args.synthetic or not fixtures:
+        fixtures += [synthetic_fixture(minutes) for minutes in args.synthetic or BENCH_SYNTHETIC_MINUTES]
+    video_ids = [fixture['video_id'] for fixture in fixtures]
+
+    stub = start_stub_server(fixtures, args.latency, args.info_latency, args.page_latency, args.error_rate)
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args):
+            pass
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, name='bench-app', daemon=True).start()
+
+    try:
+        with replay_fixtures(stub):
+            results = {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': sys.version.split()[0],
+                'params': {key: value for key, value in vars(args).items()
+                           if key in ('requests', 'concurrency', 'latency', 'info_latency', 'page_latency',
+                                      'error_rate', 'repeat')},
+                'fixtures': video_ids,
+                'load': run_load(f'http://127.0.0.1:{server.server_port}', video_ids, args.requests, args.concurrency),
+                'micro': micro_benchmarks(fixtures, args.repeat),
+                'youtube': _youtube_limiter.stats(),
+                'resources': resource_stats(),
+            }
+    finally:
+        server.shutdown()
+        stub.shutdown()
+
+    output = args.output or os.path.join(BENCH_DIR, f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+    load = results['load']
+    print(f"{load['requests']} richieste, {load['concurrency']} in parallelo: {load['throughput_rps']} req/s, "
+          f"p50 {load['latency_ms']['p50']} ms, p95 {load['latency_ms']['p95']} ms, p99 {load['latency_ms']['p99']} ms")
+    print(f"  parziali: {load['partial']}, limitatore: {results['youtube']['allowed']} richieste, "
+          f"{results['youtube']['throttled']} errori")
+    for name, summary in results['micro'].items():
+        print(f"  {name}: p50 {summary['p50']} ms")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            for line in compare_results(json.load(f), results):
+                print(f"  {line}")
+    print(f"Risultati salvati in {output}")
+
 # ============================================================================
 # MAIN
 # ============================================================================
 
-if __name__ == '__main__':
+def build_parser():
+    parser = argparse.ArgumentParser(description='AnalyzeTube - Versione Unica')
+    commands = parser.add_subparsers(dest='command', metavar='{bench,dump}')
+
+    bench = commands.add_parser('bench', help='benchmark offline su risposte registrate o sintetiche')
+    bench.add_argument('--record', nargs='+', metavar='URL', help='registra le fixture di questi video ed esci')
+    bench.add_argument('--fixtures', default=FIXTURES_DIR, help='cartella delle fixture registrate')
+    bench.add_argument('--synthetic', type=int, nargs='*', metavar='MINUTI',
+                       help='aggiunge video sintetici di queste durate (default se non ci sono fixture)')
+    bench.add_argument('--requests', type=int, default=200, help='richieste a /api/extract')
+    bench.add_argument('--concurrency', type=int, default=16, help='client in parallelo')
+    bench.add_argument('--latency', type=float, default=0.05, help='latenza (s) del finto YouTube per le tracce')
+    bench.add_argument('--info-latency', type=float, default=0.3, help='latenza (s) del dizionario info per yt-dlp')
+    bench.add_argument('--page-latency', type=float, default=0.1, help='latenza (s) per pagina di commenti')
+    bench.add_argument('--error-rate', type=float, default=0.0,
+                       help='quota di risposte 503 del finto YouTube (per misurare retry e backoff)')
+    bench.add_argument('--repeat', type=int, default=20, help='ripetizioni dei micro-benchmark')
+    bench.add_argument('--output', help='file JSON dei risultati (default in .analyzetube/bench/)')
+    bench.add_argument('--compare', metavar='FILE', help='confronta con i risultati di un\'esecuzione precedente')
+
+    dump = commands.add_parser('dump', help='esporta i video in cache in un file binario (arrow o packed)')
+    dump.add_argument('ids', nargs='*', metavar='ID', help='ID o URL dei video')
+    dump.add_argument('--from', dest='from_file', metavar='FILE', help='file con un ID o URL per riga')
+    dump.add_argument('--all', action='store_true', help='tutti i video in cache')
+    dump.add_argument('--format', choices=EXPORT_FORMATS, help='default: arrow se pyarrow è installato, altrimenti packed')
+    dump.add_argument('--extract', action='store_true', help='estrae i video non in cache')
+    dump.add_argument('--output', '-o', required=True, help='file di destinazione')
+
+    parser.add_argument('--bind', default=SERVE_HOST, help=f'indirizzo di ascolto (default {SERVE_HOST})')
+    parser.add_argument('--port', type=int, default=SERVE_PORT, help=f'porta (default {SERVE_PORT})')
+    parser.add_argument('--workers', type=int, default=SERVE_WORKERS, help='processi worker (solo gunicorn)')
+    parser.add_argument('--threads', type=int, default=SERVE_THREADS, help='thread per processo')
+    parser.add_argument('--server', choices=['auto', *SERVERS], default='auto',
+                        help='server WSGI (default: gunicorn, poi waitress, poi Werkzeug)')
+    parser.add_argument('--debug', action='store_true', help='server di sviluppo Flask con reloader')
+    parser.add_argument('--preload', action='store_true',
+                        help='importa yt-dlp e youtube-comment-downloader prima di avviare i worker')
+    parser.add_argument('--import-report', action='store_true', help='mostra i tempi di import ed esci')
+    parser.add_argument('--cpu-mode', action='append', default=[], metavar='MODO',
+                        help='fasi CPU in thread o processi: thread, process o fase=modo '
+                             f'(fasi: {", ".join(CPU_STAGES)}; ripetibile)')
+    parser.add_argument('--cpu-workers', type=int, default=CPU_WORKERS, help='processi del pool per le fasi CPU')
+    parser.add_argument('--watch', action='append', default=[], metavar='URL',
+                        help='aggiunge un canale o una playlist alla watchlist del prefetch (ripetibile)')
+    return parser
+
+def serve(args):
+    server = 'flask debug' if args.debug else pick_server(args.server)
+
     print("=" * 60)
     print("AnalyzeTube - Versione Unica")
     print("=" * 60)
-    print("\nServer avviato su: http://localhost:5002")
+    print(f"\nServer avviato su: http://localhost:{args.port} ({server})")
+    offloaded = [stage for stage in CPU_STAGES if cpu_mode(stage) == 'process']
+    if offloaded:
+        print(f"Fasi CPU in {CPU_WORKERS} processi: {', '.join(offloaded)}")
     print("\nDipendenze richieste:")
     print("   - yt-dlp")
     print("   - youtube-comment-downloader")
@@ -670,4 +5524,40 @@ if __name__ == '__main__':
     print("\nPer installare: pip install flask yt-dlp youtube-comment-downloader requests")
     print("\n" + "=" * 60 + "\n")
 
-    app.run(host="0.0.0.0", port=5002, debug=True)
+    for url in args.watch:
+        if not is_collection_url(url):
+            print(f"--watch {url}: non è l'URL di un canale o di una playlist YouTube")
+        elif PREFETCH_ENABLED:
+            # Solo il database: i thread del prefetch partono nei worker
+            Prefetcher(PREFETCH_DB).add(url)
+
+    if args.preload:
+        # Nel processo padre: i worker gunicorn ereditano i moduli già caricati
+        timings = warm_up()
+        print("Moduli precaricati: " + ', '.join(f"{name} {ms:.0f} ms" for name, ms in timings.items()) + "\n")
+
+    if args.debug:
+        # Con il reloader i worker servono solo nel processo figlio che serve le richieste
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            start_background()
+        app.run(host=args.bind, port=args.port, debug=True)
+    else:
+        SERVERS[server](args.bind, args.port, max(1, args.workers), max(1, args.threads))
+
+if __name__ == '__main__':
+    parser = build_parser()
+    args = parser.parse_args()
+    try:
+        CPU_MODES = parse_cpu_modes(args.cpu_mode)
+    except ValueError as e:
+        parser.error(str(e))
+    CPU_WORKERS = max(1, args.cpu_workers)
+
+    if args.import_report:
+        print('\n'.join(import_report()))
+    elif args.command == 'bench':
+        run_benchmark(args)
+    elif args.command == 'dump':
+        run_dump(args)
+    else:
+        serve(args)
@@ -0,0 +1,108 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# analyzetube.py è un modulo singolo nella radice del repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analyzetube as at
+
+# Database e singleton creati al primo utilizzo: ogni test ha i propri
+DATABASES = ('CACHE_DB', 'COMMENT_STORE_DB', 'SEARCH_DB', 'JOBS_DB', 'PREFETCH_DB')
+SINGLETONS = ('_cache', '_comment_store', '_search_index', '_jobs', '_prefetcher')
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Percorso di un database SQLite in una cartella temporanea"""
+    return str(tmp_path / 'data' / 'test.sqlite3')
+
+@pytest.fixture(autouse=True)
+def isolated(tmp_path, monkeypatch):
+    """Database in una cartella temporanea e singleton azzerati, per ogni test"""
+    for name in DATABASES:
+        monkeypatch.setattr(at, name, str(tmp_path / 'data' / f'{name.lower()}.sqlite3'))
+    for name in SINGLETONS:
+        monkeypatch.setattr(at, name, None)
+    yield
+    # Le indicizzazioni accodate devono finire prima che i percorsi tornino quelli veri
+    at._search_executor.submit(lambda: None).result()
+
+class FakeYouTube:
+    """Sostituti di yt-dlp e del downloader dei commenti, con ritardo e conteggio delle chiamate
+
+    Un ramo lento si sblocca (con un'eccezione) quando il test termina, così
+    nessun thread resta appeso e nulla finisce in cache dopo il test.
+    """
+
+    def __init__(self):
+        self.delay = {'info': 0.0, 'comments': 0.0}
+        self.calls = {'info': 0, 'title': 0, 'comments': 0}
+        self.comments = [
+            {'id': str(i), 'author': f'Utente {i}', 'text': f'Commento numero {i}', 'votes': 10 - i,
+             'time': '1 giorno fa', 'reply': False}
+            for i in range(5)
+        ]
+        self.released = threading.Event()
+        self._lock = threading.Lock()
+
+    def _call(self, leg, delay_leg=None):
+        with self._lock:
+            self.calls[leg] += 1
+        if self.released.wait(self.delay[delay_leg or leg]):
+            raise RuntimeError('Test terminato')
+
+    def fetch_video_info(self, video_id, langs=None):
+        self._call('info')
+        return {'title': f'Video {video_id}', 'transcript': f'Trascrizione di {video_id}', 'segments': None}
+
+    def fetch_title(self, video_id):
+        self._call('title', 'info')
+        return {'title': f'Video {video_id}'}
+
+    def fetch_comments(self, video_id, options=None, cancel=None):
+        self._call('comments')
+        items = list(self.comments)
+        return {'text': at.format_comments(items), 'items': items}
+
+    def fetch_raw_info(self, video_id):
+        self._call('info')
+        return {'id': video_id, 'title': f'Video {video_id}'}
+
+    def iter_raw_comments(self, video_id, limit=None, cancel=None, sort_by=None):
+        self._call('comments')
+        for record in self.comments[:limit]:
+            yield {'cid': record['id'], 'author': record['author'], 'text': record['text'],
+                   'votes': str(record['votes']), 'time': record['time'], 'reply': record['reply']}
+
+    def release(self):
+        self.released.set()
+        deadline = time.monotonic() + 5
+        while at._inflight.stats()['in_flight'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+@pytest.fixture
+def youtube(monkeypatch):
+    """YouTube finto per i rami di estrazione"""
+    fake = FakeYouTube()
+    for name in ('fetch_video_info', 'fetch_title', 'fetch_comments', 'fetch_raw_info', 'iter_raw_comments'):
+        monkeypatch.setattr(at, name, getattr(fake, name))
+    yield fake
+    fake.release()
+
+@pytest.fixture
+def stub():
+    """Server di prova del benchmark con un video sintetico di un minuto e 45 commenti"""
+    fixture = at.synthetic_fixture(1, comments=45)
+    server = at.start_stub_server([fixture], 0, 0, 0)
+    server.fixture = fixture
+    yield server
+    server.shutdown()
+
+@pytest.fixture
+def client():
+    """Client di test dell'app Flask"""
+    at.app.config['TESTING'] = True
+    return at.app.test_client()
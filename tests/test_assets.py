@@ -0,0 +1,62 @@
+import gzip
+
+import pytest
+
+import analyzetube as at
+
+def asset_urls(page):
+    return [f'/assets/{name}' for name in at.STATIC_ASSETS if f'/assets/{name}'.encode() in page]
+
+def test_asset_name_follows_content():
+    first, second = at.StaticAsset('body {}', 'text/css'), at.StaticAsset('body { color: red }', 'text/css')
+    assert first.digest == at.StaticAsset('body {}', 'text/css').digest
+    assert first.digest != second.digest and len(first.digest) == at.ASSET_HASH_LENGTH
+    assert gzip.decompress(first.variants['gzip']) == first.body
+
+def test_build_assets_links_hashed_urls():
+    page, assets = at.build_assets()
+    assert sorted(name.rsplit('.', 1)[1] for name in assets) == ['css', 'js']
+    for name, asset in assets.items():
+        assert name == f'app.{asset.digest}.{name.rsplit(".", 1)[1]}'
+        assert f'/assets/{name}'.encode() in page.body
+    assert b'__CSS_URL__' not in page.body and b'__JS_URL__' not in page.body
+
+def test_index_is_revalidated_and_references_assets(client):
+    response = client.get('/')
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert len(asset_urls(response.data)) == 2
+    assert client.get('/', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+def test_asset_is_immutable(client):
+    name, asset = next(iter(at.STATIC_ASSETS.items()))
+    response = client.get(f'/assets/{name}')
+    assert response.status_code == 200 and response.data == asset.body
+    assert response.mimetype == asset.mimetype
+    assert response.headers['Cache-Control'] == f'public, max-age={at.ASSET_MAX_AGE}, immutable'
+    assert 'Content-Encoding' not in response.headers
+
+def test_unknown_hash_is_404(client):
+    name = next(iter(at.STATIC_ASSETS))
+    stale = name.replace(name.split('.')[1], '0' * at.ASSET_HASH_LENGTH)
+    assert client.get(f'/assets/{stale}').status_code == 404
+
+def test_gzip_variant(client):
+    name, asset = next(iter(at.STATIC_ASSETS.items()))
+    response = client.get(f'/assets/{name}', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip' and 'Accept-Encoding' in response.headers['Vary']
+    assert gzip.decompress(response.data) == asset.body
+    assert response.headers['ETag'] == f'"{asset.digest}-gzip"'
+
+
+@pytest.mark.skipif(at.brotli is None, reason='brotli non installato')
+def test_brotli_variant(client):
+    name, asset = next(iter(at.STATIC_ASSETS.items()))
+    response = client.get(f'/assets/{name}', headers={'Accept-Encoding': 'gzip, br'})
+    assert response.headers['Content-Encoding'] == 'br'
+    assert at.brotli.decompress(response.data) == asset.body
+
+def test_without_brotli_falls_back_to_gzip(client, monkeypatch):
+    monkeypatch.setattr(at, 'brotli', None)
+    name = next(iter(at.STATIC_ASSETS))
+    response = client.get(f'/assets/{name}', headers={'Accept-Encoding': 'br, gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
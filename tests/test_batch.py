@@ -0,0 +1,51 @@
+import json
+import threading
+
+import analyzetube as at
+
+def ndjson(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+def test_batch_streams_one_line_per_video(client, youtube):
+    response = client.post('/api/extract/batch', json={'urls': [
+        'dQw4w9WgXcQ', 'https://youtu.be/dQw4w9WgXcQ', 'https://www.youtube.com/watch?v=aaaaaaaaaaa',
+        'https://example.com/x',
+    ]})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+
+    lines = ndjson(response)
+    assert lines[0] == {'input': 'https://example.com/x', 'error': 'URL YouTube non valido'}
+    assert sorted(line['video_id'] for line in lines[1:-1]) == ['aaaaaaaaaaa', 'dQw4w9WgXcQ']   # duplicati tolti
+    assert all(line['title'] == f"Video {line['video_id']}" for line in lines[1:-1])
+    assert lines[-1] == {'summary': {'videos': 2, 'completed': 2, 'errors': 1, 'truncated': False}}
+
+def test_batch_concurrency_is_bounded(client, youtube, monkeypatch):
+    running, peak, lock = [0], [0], threading.Lock()
+    fetch = youtube.fetch_video_info
+
+    def counted(video_id, langs=None):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        try:
+            return fetch(video_id, langs)
+        finally:
+            with lock:
+                running[0] -= 1
+    monkeypatch.setattr(at, 'fetch_video_info', counted)
+    youtube.delay['info'] = 0.05
+
+    ids = [f'video{i:06d}' for i in range(8)]
+    lines = ndjson(client.post('/api/extract/batch', json={'ids': ids}))
+    assert lines[-1]['summary']['completed'] == 8
+    assert peak[0] <= at.BATCH_WORKERS
+
+def test_batch_truncates(client, youtube, monkeypatch):
+    monkeypatch.setattr(at, 'BATCH_MAX_ITEMS', 2)
+    lines = ndjson(client.post('/api/extract/batch', json={'ids': ['aaaaaaaaaaa', 'bbbbbbbbbbb', 'ccccccccccc']}))
+    assert lines[-1]['summary'] == {'videos': 2, 'completed': 2, 'errors': 0, 'truncated': True}
+
+def test_batch_rejects_empty_and_non_object_bodies(client):
+    assert client.post('/api/extract/batch', json={'urls': []}).status_code == 400
+    assert client.post('/api/extract/batch', json=['dQw4w9WgXcQ']).status_code == 400
@@ -0,0 +1,44 @@
+import analyzetube as at
+
+def test_comment_downloader_against_stub(stub, monkeypatch):
+    downloader = at._new_comment_downloader()
+    at.stub_session(downloader.session, stub.base_url)
+    monkeypatch.setattr(at, '_comment_downloaders', at.ResourcePool(lambda: downloader, 1))
+    monkeypatch.setattr(at, 'COMMENT_STORE_ENABLED', False)
+    limiter = at.OutboundLimiter(rate=1e6, burst=1e6)
+    monkeypatch.setattr(at, '_youtube_limiter', limiter)
+
+    video_id = stub.fixture['video_id']
+    comments = list(at.iter_raw_comments(video_id, 100))
+    assert [c['cid'] for c in comments] == [c['cid'] for c in stub.fixture['comments']]
+    assert [c['reply'] for c in comments] == [c['reply'] for c in stub.fixture['comments']]
+    assert limiter.stats()['allowed'] == 4     # pagina del video e tre pagine di commenti
+
+def test_extraction_replayed_through_real_clients(stub):
+    fixture = stub.fixture
+    with at.replay_fixtures(stub):
+        assert not at.CACHE_ENABLED
+        result = at.run_extraction(fixture['video_id'], comment_opts=at.comment_options({'min_length': 0}))
+        stats = at._youtube_limiter.stats()
+
+    assert not result['errors']
+    assert result['title'] == fixture['info']['title']
+    assert len(result['transcript'].split()) == 24 * 8     # un minuto: 24 eventi da 8 parole
+    assert len(result['comment_items']) == len(fixture['comments'])
+    assert stats['allowed'] >= 4        # info, traccia e pagine dei commenti
+    # Fuori dal contesto tutto torna come prima
+    assert at.CACHE_ENABLED and at._ydl_extractors is not None
+
+def test_stub_errors_show_up_as_partial_results(stub, monkeypatch):
+    monkeypatch.setattr(at, 'HTTP_RETRIES', 0)
+    stub.error_rate = 1.0
+    with at.replay_fixtures(stub):
+        result = at.run_extraction(stub.fixture['video_id'])
+    assert set(result['errors']) == {'info', 'comments'}
+    assert '503' in result['errors']['info']
+
+def test_latency_summary():
+    summary = at.latency_summary([i / 1000 for i in range(1, 101)])
+    assert (summary['p50'], summary['p95'], summary['p99']) == (50.0, 95.0, 99.0)
+    assert (summary['min'], summary['max']) == (1.0, 100.0)
+    assert at.latency_summary([]) == {}
@@ -0,0 +1,57 @@
+import analyzetube as at
+
+VIDEO = 'dQw4w9WgXcQ'
+
+class TestResultCache:
+
+    def test_memory_then_disk(self, db_path):
+        cache = at.ResultCache(db_path)
+        cache.set('k', {'a': 1}, ttl=60)
+        assert cache.get('k') == ({'a': 1}, 'memory')
+        assert at.ResultCache(db_path).get('k') == ({'a': 1}, 'disk')   # sopravvive al riavvio
+        assert cache.get('altro') is None
+
+    def test_expired_entries_are_kept_as_stale(self, db_path):
+        cache = at.ResultCache(db_path)
+        cache.set('k', 'vecchio', ttl=-1)
+        assert cache.get('k') is None
+        assert cache.get('k', allow_stale=True) == ('vecchio', 'stale')
+        assert cache.peek('k') == 'vecchio'
+
+    def test_memory_lru(self, db_path):
+        cache = at.ResultCache(db_path, memory_items=2)
+        for key in ('a', 'b', 'c'):
+            cache.set(key, key, ttl=60)
+        assert cache.get('a') == ('a', 'disk')
+        assert cache.get('c') == ('c', 'memory')
+
+    def test_iter_keys(self, db_path):
+        cache = at.ResultCache(db_path)
+        for key in ('v2:info:b', 'v2:info:a', 'v2:comments:a'):
+            cache.set(key, 1, ttl=60)
+        assert list(cache.iter_keys('v2:info:')) == ['v2:info:a', 'v2:info:b']
+
+def test_second_extraction_is_served_from_cache(youtube):
+    first = at.run_extraction(VIDEO)
+    second = at.run_extraction(VIDEO)
+
+    assert first['cache'] == {'info': 'miss', 'comments': 'miss'}
+    assert second['cache'] == {'info': 'memory', 'comments': 'memory'}
+    assert second['transcript'] == first['transcript']
+    assert youtube.calls == {'info': 1, 'title': 0, 'comments': 1}
+
+    at.run_extraction(VIDEO, refresh=True)
+    assert youtube.calls['info'] == 2
+
+def test_failed_leg_falls_back_to_stale_entry(youtube, monkeypatch):
+    options = at.comment_options({})
+    at.get_cache().set(at.comments_cache_key(VIDEO, options), {'text': 'vecchi', 'items': []}, ttl=-1)
+
+    def broken(video_id, options=None, cancel=None):
+        raise RuntimeError('YouTube non risponde')
+    monkeypatch.setattr(at, 'fetch_comments', broken)
+    result = at.run_extraction(VIDEO)
+
+    assert result['cache']['comments'] == 'stale'
+    assert result['comments'] == 'vecchi'
+    assert not result['errors']
@@ -0,0 +1,41 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import analyzetube as at
+
+VIDEO = 'dQw4w9WgXcQ'
+
+def test_single_flight_shares_running_call():
+    release = threading.Event()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        flight = at.SingleFlight(executor)
+        first, leader = flight.submit('k', release.wait)
+        second, follower = flight.submit('k', release.wait)
+        assert leader and not follower
+        assert first is second
+        assert flight.running('k') is first
+
+        release.set()
+        first.result(timeout=5)
+    assert flight.running('k') is None
+    assert flight.stats() == {'started': 1, 'shared': 1, 'in_flight': 0}
+
+def test_concurrent_extractions_are_coalesced(youtube):
+    youtube.delay = {'info': 0.3, 'comments': 0.3}
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda _: at.run_extraction(VIDEO, refresh=True), range(4)))
+
+    assert youtube.calls['info'] == 1 and youtube.calls['comments'] == 1
+    # Per ogni ramo un solo leader, non per forza la stessa richiesta
+    assert sum(len(result['coalesced']) for result in results) == 6
+    assert len({result['transcript'] for result in results}) == 1
+
+def test_different_options_are_not_coalesced(youtube):
+    youtube.delay = {'info': 0.2, 'comments': 0.2}
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        a = executor.submit(at.run_extraction, VIDEO, None, at.comment_options({'comments_limit': 10}), True)
+        b = executor.submit(at.run_extraction, VIDEO, None, at.comment_options({'comments_limit': 20}), True)
+        a.result(), b.result()
+
+    assert youtube.calls['info'] == 1
+    assert youtube.calls['comments'] == 2
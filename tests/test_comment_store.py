@@ -0,0 +1,93 @@
+import time
+
+import pytest
+
+import analyzetube as at
+
+def raw_comment(cid, votes='0', published=None, text='testo'):
+    comment = {'cid': cid, 'author': '@u', 'text': text, 'votes': votes, 'time': '1 day ago',
+               'reply': '.' in cid}
+    if published is not None:
+        comment['time_parsed'] = published
+    return comment
+
+class TestCommentStore:
+
+    def test_merge_counts_new_and_updates_votes(self, db_path):
+        store = at.CommentStore(db_path)
+        assert store.merge('v', [raw_comment('a', '1'), raw_comment('b', '5')]) == 2
+        assert store.merge('v', [raw_comment('a', '1.2K'), raw_comment('c')]) == 1
+        assert store.count('v') == 3
+        assert [(r['id'], r['votes']) for r in store.top('v', 2)] == [('a', 1200), ('b', 5)]
+        assert store.stats() == {'videos': 1, 'comments': 3}
+
+    def test_latest_by_publication(self, db_path):
+        store = at.CommentStore(db_path)
+        store.merge('v', [raw_comment('vecchio', published=100), raw_comment('nuovo', published=200)])
+        assert [r['id'] for r in store.latest('v', 5)] == ['nuovo', 'vecchio']
+        assert store.top('v', 5, min_length=100) == []
+
+    def test_watermark(self, db_path):
+        store = at.CommentStore(db_path)
+        assert store.watermark('v') is None
+        store.set_watermark('v', 'c9', 123.0)
+        assert tuple(at.CommentStore(db_path).watermark('v')) == ('c9', 123.0)
+
+@pytest.mark.parametrize('comments, watermark, expected', [
+    ([raw_comment('fissato', published=50), raw_comment('nuovo', published=200),
+      raw_comment('vecchio', published=100)], None, ('nuovo', 200)),
+    ([raw_comment('a.1', published=300), raw_comment('a', published=100)], None, ('a', 100)),
+    ([raw_comment('primo'), raw_comment('secondo')], None, ('primo', None)),
+    ([raw_comment('vecchio', published=100)], ('segno', 150), ('segno', 150)),
+    ([], ('segno', 150), ('segno', 150)),
+])
+def test_newest_comment(comments, watermark, expected):
+    assert at.newest_comment(comments, watermark) == expected
+
+class TestRefreshComments:
+    """Refresh incrementale contro un downloader finto che conta le pagine lette"""
+
+    @pytest.fixture
+    def thread(self, db_path, monkeypatch):
+        now = time.time()
+        comments = [raw_comment(f'c{i}', str(i % 7), now - (1000 - i) * 60) for i in range(1000)]
+        pages = []
+
+        class Downloader:
+            def get_comments_from_url(self, url, sort_by=None):
+                recent = sort_by == at.comment_downloader.SORT_BY_RECENT
+                ordered = comments[::-1] if recent else sorted(comments, key=lambda c: -int(c['votes']))
+                for i, comment in enumerate(ordered):
+                    if i % 20 == 0:
+                        pages.append('recent' if recent else 'popular')
+                    yield dict(comment)
+
+        monkeypatch.setattr(at, 'COMMENT_STORE_ENABLED', True)
+        monkeypatch.setattr(at, '_comment_store', at.CommentStore(db_path))
+        monkeypatch.setattr(at, '_comment_downloaders', at.ResourcePool(Downloader, 1))
+        return comments, pages, now
+
+    def test_first_refresh_seeds_from_one_page(self, thread):
+        comments, pages, _ = thread
+        at.fetch_comments('v', at.comment_options({}))
+        pages.clear()
+
+        result = at.refresh_comments('v', at.comment_options({'comments_mode': 'refresh'}))
+        assert pages.count('recent') == 1
+        assert tuple(at.get_comment_store().watermark('v'))[0] == 'c999'
+        assert result['new'] <= at.COMMENTS_SEED
+
+    def test_refresh_stops_at_watermark(self, thread):
+        comments, pages, now = thread
+        options = at.comment_options({'comments_mode': 'refresh'})
+        at.refresh_comments('v', options)
+        comments += [raw_comment(f'n{i}', published=now + i) for i in range(30)]
+        pages.clear()
+
+        assert at.refresh_comments('v', options)['new'] == 30
+        assert pages.count('recent') == 2
+        assert at.get_comment_store().watermark('v')[0] == 'n29'
+
+        pages.clear()
+        assert at.refresh_comments('v', options)['new'] == 0
+        assert pages.count('recent') == 1
@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+import analyzetube as at
+
+VIDEO = 'dQw4w9WgXcQ'
+
+# Quella vera: la fixture youtube sostituisce anche fetch_comments
+fetch_comments = at.fetch_comments
+
+@pytest.mark.parametrize('votes, expected', [
+    ('0', 0), ('', 0), (None, 0), ('12', 12), ('1,234', 1234), ('1.2K', 1200), ('3M', 3_000_000),
+    ('2.5b', 2_500_000_000), ('n/d', 0),
+])
+def test_parse_votes(votes, expected):
+    assert at.parse_votes(votes) == expected
+
+def test_comment_record_and_format():
+    record = at.comment_record({'cid': 'c1', 'author': '@a', 'text': 'ciao', 'votes': '1.5K', 'reply': True})
+    assert record == {'id': 'c1', 'author': '@a', 'text': 'ciao', 'votes': 1500, 'time': None, 'reply': True}
+    assert at.format_comment(3, record) == '3. @a [1500 likes]\nciao\n\n'
+    assert at.format_comment(1, dict(record, votes=0)) == '1. @a\nciao\n\n'
+    assert at.format_comments([record, record]).startswith('1. @a')
+    assert at.finish_comments('', 0) == 'Nessun commento disponibile'
+    assert at.finish_comments('', 5) == 'Commenti non disponibili'
+
+def test_comment_options_clamp_values():
+    options = at.comment_options({'comments_limit': '999999', 'min_length': 'x', 'min_votes': '-5'})
+    assert options['limit'] == at.COMMENTS_MAX_LIMIT
+    assert options['min_length'] == at.DEFAULT_MIN_LENGTH
+    assert options['min_votes'] == 0
+    assert at.comment_options({'comments_limit': 0})['limit'] == at.DEFAULT_COMMENTS_LIMIT
+
+def test_pipeline_is_lazy_and_filters(youtube):
+    youtube.comments[1]['text'] = 'corto'
+    pipeline = at.CommentPipeline(VIDEO, limit=4, min_length=11, min_votes=8)
+    iterator = iter(pipeline)
+
+    assert next(iterator)['id'] == '0'
+    assert pipeline.read == 1
+    assert [record['id'] for record in iterator] == ['2']     # '1' è corto, '3' ha solo 7 like
+    assert pipeline.read == 4
+
+def test_fetch_comments_caps_limit(youtube, monkeypatch):
+    monkeypatch.setattr(at, 'COMMENTS_MAX_LIMIT', 3)
+    result = fetch_comments(VIDEO, {'limit': 1000, 'min_length': 0, 'min_votes': 0})
+    assert [record['id'] for record in result['items']] == ['0', '1', '2']
+    assert result['text'].startswith('1. Utente 0 [10 likes]\nCommento numero 0')
+
+def test_fetch_comments_messages(youtube):
+    youtube.comments = []
+    assert fetch_comments(VIDEO)['text'] == 'Nessun commento disponibile'
+
+def test_api_comments_ndjson(client, youtube):
+    response = client.get(f'/api/comments?url={VIDEO}&comments_limit=3&format=ndjson')
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [line['id'] for line in lines] == ['0', '1', '2']
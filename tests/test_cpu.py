@@ -0,0 +1,42 @@
+import pytest
+
+import analyzetube as at
+from test_prompt import LONG, comments
+from test_subtitles import JSON3
+
+def test_parse_cpu_modes():
+    assert at.parse_cpu_modes(['process']) == {stage: 'process' for stage in at.CPU_STAGES}
+    assert at.parse_cpu_modes(['prompt=process', 'subtitles=thread']) == {'subtitles': 'thread', 'prompt': 'process'}
+    with pytest.raises(ValueError):
+        at.parse_cpu_modes(['info=process'])
+    with pytest.raises(ValueError):
+        at.parse_cpu_modes(['fast'])
+
+@pytest.fixture
+def process_mode(monkeypatch):
+    """Tutte le fasi CPU in un pool di un processo, chiuso a fine test"""
+    monkeypatch.setattr(at, 'CPU_MODES', at.parse_cpu_modes(['process']))
+    monkeypatch.setattr(at, 'CPU_WORKERS', 1)
+    yield
+    if at._cpu_pool is not None:
+        at._cpu_pool.shutdown()
+        at._cpu_pool = None
+
+def test_subtitles_are_parsed_in_the_pool(process_mode):
+    transcript = at.run_cpu('subtitles', at.parse_subtitle_bytes, JSON3)
+    assert at._cpu_pool is not None
+    assert transcript.text == at.parse_subtitle_bytes(JSON3).text
+    assert transcript.to_index() == at.parse_subtitle_bytes(JSON3).to_index()
+
+def test_prompt_is_built_in_the_pool(process_mode):
+    args = ('budget', 'Titolo', LONG.text, LONG.to_index(), comments(30), 2000)
+    assert at.run_cpu('prompt', at.prompt_for_result, *args) == at.prompt_for_result(*args)
+    assert at._cpu_pool is not None
+
+    with pytest.raises(ValueError):
+        at.run_cpu('prompt', at.prompt_for_result, 'budget', 'Titolo', '', None, [], 1)
+
+def test_api_prompt_in_process_mode(client, youtube, process_mode):
+    data = client.post('/api/prompt', json={'url': 'dQw4w9WgXcQ', 'token_budget': 500}).get_json()
+    assert at._cpu_pool is not None
+    assert data['tokens']['total'] <= 500 and 'Commento numero 0' in data['prompt']
@@ -0,0 +1,84 @@
+import pytest
+
+import analyzetube as at
+
+VIDEO = 'dQw4w9WgXcQ'
+OTHER = 'aaaaaaaaaaa'
+
+def sample_records():
+    transcript = at.Transcript.from_segments([(0, 500, 'uno'), (500, 700, 'due')])
+    info = {'title': 'Titolo', 'transcript': transcript.text, 'segments': transcript.to_index()}
+    comments = {'items': [{'id': 'c1', 'author': '@a', 'text': 'ciao', 'votes': 3, 'time': None, 'reply': False}]}
+    return [at.export_record('v1', info, comments), at.export_record('v2', None, None)]
+
+@pytest.mark.parametrize('codec', ['msgpack', 'json'])
+def test_packed_round_trip(tmp_path, monkeypatch, codec):
+    if codec == 'json':
+        monkeypatch.setattr(at, 'msgpack', None)
+    records = sample_records()
+    path = tmp_path / 'out.packed'
+    with open(path, 'wb') as f:
+        assert at.export_to(f, [('v1', records[0]), ('assente', None), ('v2', records[1])], 'packed') == (2, 1)
+
+    assert list(at.iter_packed(str(path))) == records
+    assert records[0]['segments'] == {'start_ms': [0, 500], 'duration_ms': [500, 700], 'text': ['uno', 'due']}
+
+def test_packed_rejects_other_files(tmp_path):
+    path = tmp_path / 'altro.bin'
+    path.write_bytes(b'non un export' * 4)
+    with pytest.raises(ValueError):
+        list(at.iter_packed(str(path)))
+
+def test_arrow_round_trip(tmp_path):
+    pyarrow = pytest.importorskip('pyarrow')
+    import pyarrow.ipc
+
+    path = tmp_path / 'out.arrow'
+    with open(path, 'wb') as f:
+        assert at.export_to(f, [(record['video_id'], record) for record in sample_records()], 'arrow') == (2, 0)
+
+    reader = pyarrow.ipc.open_file(pyarrow.memory_map(str(path)))
+    assert reader.num_record_batches == 2 and reader.schema == at.arrow_schema()
+    rows = reader.get_batch(0).to_pylist()
+    assert [row['kind'] for row in rows] == ['video', 'segment', 'segment', 'comment']
+    assert rows[0]['title'] == 'Titolo' and rows[0]['text'] is None
+    assert [(row['start_ms'], row['text']) for row in rows[1:3]] == [(0, 'uno'), (500, 'due')]
+    assert (rows[3]['comment_id'], rows[3]['votes'], rows[3]['reply'], rows[3]['start_ms']) == ('c1', 3, False, None)
+    assert reader.get_batch(1).to_pylist() == [dict.fromkeys(at.arrow_schema().names) | {'video_id': 'v2', 'kind': 'video'}]
+
+def test_records_come_from_cache_or_extraction(youtube):
+    at.run_extraction(VIDEO)
+    assert [(video_id, record is None) for video_id, record in at.iter_export_records([VIDEO, OTHER])] == [
+        (VIDEO, False), (OTHER, True)]
+    assert youtube.calls['info'] == 1
+
+    (_, record), = at.iter_export_records([OTHER], extract=True)
+    assert record['title'] == f'Video {OTHER}' and len(record['comments']) == 5
+    assert youtube.calls['info'] == 2
+
+def test_api_export_packed(client, youtube, tmp_path):
+    at.run_extraction(VIDEO)
+    response = client.get(f'/api/export?ids={VIDEO},{OTHER},{VIDEO}&format=packed')
+    assert response.status_code == 200
+    assert response.headers['Content-Disposition'] == 'attachment; filename=analyzetube.packed'
+
+    path = tmp_path / 'export.packed'
+    path.write_bytes(response.data)
+    assert [record['video_id'] for record in at.iter_packed(str(path))] == [VIDEO]
+
+def test_api_export_arrow(client, youtube):
+    pyarrow = pytest.importorskip('pyarrow')
+    import pyarrow.ipc
+
+    response = client.get(f'/api/export?ids={VIDEO}&extract=1')
+    assert response.mimetype == 'application/vnd.apache.arrow.file'
+    table = pyarrow.ipc.open_file(pyarrow.BufferReader(response.data)).read_all()
+    assert table.column('kind').to_pylist().count('comment') == 5
+
+@pytest.mark.parametrize('query', ['', 'ids=nonvalido', f'ids={VIDEO}&format=csv'])
+def test_api_export_rejects_bad_input(client, query):
+    assert client.get(f'/api/export?{query}').status_code == 400
+
+def test_api_export_limits_ids(client, monkeypatch):
+    monkeypatch.setattr(at, 'EXPORT_MAX_IDS', 1)
+    assert client.get(f'/api/export?ids={VIDEO},{OTHER}').status_code == 400
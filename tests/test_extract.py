@@ -0,0 +1,76 @@
+import time
+
+import pytest
+
+import analyzetube as at
+
+VIDEO = 'dQw4w9WgXcQ'
+
+@pytest.mark.parametrize('url, expected', [
+    ('https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=10s', 'dQw4w9WgXcQ'),
+    ('https://youtu.be/dQw4w9WgXcQ?si=x', 'dQw4w9WgXcQ'),
+    ('https://www.youtube.com/embed/dQw4w9WgXcQ', 'dQw4w9WgXcQ'),
+    ('dQw4w9WgXcQ', 'dQw4w9WgXcQ'),
+    ('https://example.com/video', None),
+])
+def test_extract_video_id(url, expected):
+    assert at.extract_video_id(url) == expected
+
+def test_legs_run_concurrently(youtube):
+    youtube.delay = {'info': 0.4, 'comments': 0.4}
+    start = time.perf_counter()
+    result = at.run_extraction(VIDEO, refresh=True)
+    elapsed = time.perf_counter() - start
+
+    assert result['title'] == f'Video {VIDEO}'
+    assert result['comment_items'] == youtube.comments
+    assert not result['partial']
+    # In sequenza servirebbero almeno 0,8 secondi
+    assert elapsed < 0.75
+    assert result['timings']['info'] >= 400 and result['timings']['comments'] >= 400
+
+def test_leg_timeout_keeps_other_leg(youtube, monkeypatch):
+    monkeypatch.setattr(at, 'INFO_TIMEOUT', 0.2)
+    youtube.delay['info'] = 5
+    start = time.perf_counter()
+    result = at.run_extraction(VIDEO, refresh=True)
+
+    assert time.perf_counter() - start < 1
+    assert result['partial']
+    assert result['errors']['info'].startswith('Timeout')
+    assert 'comments' not in result['errors']
+    assert result['comment_items'] == youtube.comments
+    assert result['title'] == 'Errore'
+
+def test_leg_error_is_reported(youtube, monkeypatch):
+    def broken(video_id, options=None, cancel=None):
+        raise RuntimeError('commenti disattivati')
+    monkeypatch.setattr(at, 'fetch_comments', broken)
+    result = at.run_extraction(VIDEO, refresh=True)
+
+    assert result['errors'] == {'comments': 'commenti disattivati'}
+    assert result['transcript'] == f'Trascrizione di {VIDEO}'
+
+def test_api_extract(client, youtube):
+    response = client.post('/api/extract', json={'url': f'https://youtu.be/{VIDEO}'})
+    data = response.get_json()
+    assert response.status_code == 200
+    assert data['success'] and data['title'] == f'Video {VIDEO}'
+    assert set(data['timings']) >= {'info', 'comments', 'total'}
+
+def test_api_extract_both_legs_failed(client, youtube, monkeypatch):
+    monkeypatch.setattr(at, 'INFO_TIMEOUT', 0.1)
+    monkeypatch.setattr(at, 'COMMENTS_TIMEOUT', 0.1)
+    youtube.delay = {'info': 5, 'comments': 5}
+    response = client.post('/api/extract', json={'url': VIDEO, 'refresh': True})
+    assert response.status_code == 502
+    assert set(response.get_json()['errors']) == {'info', 'comments'}
+
+@pytest.mark.parametrize('body', [[VIDEO], 'dQw4w9WgXcQ', 42])
+def test_api_extract_rejects_non_object_body(client, youtube, body):
+    response = client.post('/api/extract?url=' + VIDEO, json=body)
+    assert response.status_code == 400
+    assert youtube.calls['info'] == 0
+
+def test_api_extract_invalid_url(client):
+    assert client.post('/api/extract', json={'url': 'https://example.com/x'}).status_code == 400
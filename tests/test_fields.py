@@ -0,0 +1,40 @@
+import threading
+
+import analyzetube as at
+
+VIDEO = 'dQw4w9WgXcQ'
+
+def test_parse_fields():
+    assert at.parse_fields({'fields': 'title, comments'}) == {'title', 'comments'}
+    assert at.parse_fields({'fields': ['transcript', 'bogus']}) == {'transcript'}
+    assert at.parse_fields({'fields': 'bogus'}) == set(at.EXTRACT_FIELDS)
+    assert at.parse_fields({}) == set(at.EXTRACT_FIELDS)
+
+def test_title_only_skips_transcript_and_comments(youtube):
+    result = at.run_extraction(VIDEO, fields={'title'})
+    assert result['title'] == f'Video {VIDEO}'
+    assert 'transcript' not in result and 'comments' not in result
+    assert youtube.calls == {'info': 0, 'title': 1, 'comments': 0}
+
+def test_title_reuses_cached_info(youtube):
+    at.run_extraction(VIDEO, fields={'transcript'})
+    result = at.run_extraction(VIDEO, fields={'title'})
+    assert result['cache'] == {'title': 'memory'}
+    assert youtube.calls['title'] == 0
+
+def test_title_waits_for_running_info(youtube):
+    youtube.delay['info'] = 0.3
+    info = threading.Thread(target=at.run_extraction, args=(VIDEO,), kwargs={'fields': {'transcript'}})
+    info.start()
+    while at._inflight.running(at.info_cache_key(VIDEO, at.DEFAULT_LANGS)) is None:
+        pass
+    result = at.run_extraction(VIDEO, fields={'title'})
+    info.join()
+
+    assert result['title'] == f'Video {VIDEO}' and result['coalesced'] == ['title']
+    assert youtube.calls == {'info': 1, 'title': 0, 'comments': 0}
+
+def test_api_fields(client, youtube):
+    data = client.get(f'/api/extract?url={VIDEO}&fields=comments').get_json()
+    assert set(data) >= {'comments', 'comment_items'} and 'title' not in data and 'transcript' not in data
+    assert youtube.calls['info'] == 0
@@ -0,0 +1,124 @@
+import threading
+import time
+
+import pytest
+
+import analyzetube as at
+
+VIDEO = 'dQw4w9WgXcQ'
+
+def wait_for(queue, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f'Job {job_id} non concluso: {job}')
+
+@pytest.fixture
+def jobs(monkeypatch):
+    """Coda dei job dell'app, con i worker avviati"""
+    monkeypatch.setattr(at, 'JOB_POLL_INTERVAL', 0.05)
+    queue = at.JobQueue(at.JOBS_DB, workers=2)
+    monkeypatch.setattr(at, '_jobs', queue)
+    queue.start()
+    yield queue
+    queue.stop(timeout=5)
+
+@pytest.mark.parametrize('value, expected', [
+    (True, True), (1, True), ('1', True), ('true', True), ('Yes', True), (' TRUE ', True),
+    (False, False), (0, False), ('0', False), ('false', False), ('', False), (None, False), ('no', False),
+])
+def test_parse_flag(value, expected):
+    assert at.parse_flag(value) is expected
+
+def test_queued_job_survives_restart(youtube, db_path, monkeypatch):
+    monkeypatch.setattr(at, 'JOB_POLL_INTERVAL', 0.05)
+    job_id = at.JobQueue(db_path).submit({'video_id': VIDEO})     # nessun worker: il processo "muore" qui
+
+    restarted = at.JobQueue(db_path, workers=1)
+    assert restarted.get(job_id)['status'] == 'queued'
+    restarted.start()
+    try:
+        job = wait_for(restarted, job_id)
+    finally:
+        restarted.stop(timeout=5)
+
+    assert job['status'] == 'done' and job['progress'] == 1.0
+    assert job['result']['title'] == f'Video {VIDEO}'
+
+def test_stale_running_job_is_taken_over(youtube, db_path, monkeypatch):
+    monkeypatch.setattr(at, 'JOB_POLL_INTERVAL', 0.05)
+    crashed = at.JobQueue(db_path)
+    job_id = crashed.submit({'video_id': VIDEO})
+    assert crashed._claim() == (job_id, {'video_id': VIDEO})
+    assert crashed.get(job_id)['status'] == 'running'
+
+    restarted = at.JobQueue(db_path, workers=1)
+    assert restarted._claim() is None       # in corso da poco: potrebbe essere ancora vivo
+    monkeypatch.setattr(at, 'JOB_STALE_AFTER', -1)
+    restarted.start()
+    try:
+        assert wait_for(restarted, job_id)['status'] == 'done'
+    finally:
+        restarted.stop(timeout=5)
+
+def test_job_is_claimed_once(db_path):
+    first, second = at.JobQueue(db_path), at.JobQueue(db_path)
+    job_id = first.submit({'video_id': VIDEO})
+    assert first._claim()[0] == job_id
+    assert second._claim() is None
+
+def test_api_jobs(client, youtube, jobs):
+    response = client.post('/api/jobs', json={'url': VIDEO, 'comments_limit': 3})
+    assert response.status_code == 202
+    job_id = response.get_json()['job_id']
+
+    job = wait_for(jobs, job_id)
+    assert client.get(f'/api/jobs/{job_id}').get_json() == job
+    assert job['result']['success']
+    assert client.get('/api/jobs/inesistente').status_code == 404
+
+def test_api_jobs_failed_extraction(client, youtube, jobs, monkeypatch):
+    monkeypatch.setattr(at, 'INFO_TIMEOUT', 0.1)
+    monkeypatch.setattr(at, 'COMMENTS_TIMEOUT', 0.1)
+    youtube.delay = {'info': 5, 'comments': 5}
+    job_id = client.post('/api/jobs', json={'url': VIDEO}).get_json()['job_id']
+
+    job = wait_for(jobs, job_id)
+    assert job['status'] == 'failed' and job['error']
+
+def test_api_jobs_rejects_bad_input(client, jobs):
+    assert client.post('/api/jobs', json={'url': 'https://example.com'}).status_code == 400
+    assert client.post('/api/jobs', json=[VIDEO]).status_code == 400
+
+def background_threads():
+    return {t.name for t in threading.enumerate() if t.name.startswith(('job-', 'prefetch-'))}
+
+def test_read_only_endpoints_start_no_workers(client, monkeypatch):
+    monkeypatch.setattr(at, 'PREFETCH_ENABLED', True)
+    before = background_threads()
+
+    stats = client.get('/api/stats').get_json()
+    assert stats['jobs'] is None and stats['prefetch'] is None
+    assert client.get('/api/watchlist').status_code == 200
+    job_id = client.post('/api/jobs', json={'url': VIDEO}).get_json()['job_id']
+
+    assert client.get(f'/api/jobs/{job_id}').get_json()['status'] == 'queued'
+    assert client.get('/api/stats').get_json()['jobs']['queued'] == 1
+    assert background_threads() == before
+
+def test_start_background_starts_workers_once(youtube, monkeypatch):
+    monkeypatch.setattr(at, 'PREFETCH_ENABLED', True)
+    monkeypatch.setattr(at, 'JOB_POLL_INTERVAL', 0.05)
+    at.start_background()
+    at.start_background()
+    try:
+        assert len(at._jobs._threads) == at._jobs.workers
+        assert len(at._prefetcher._threads) == at._prefetcher.workers + 1
+        job_id = at._jobs.submit({'video_id': VIDEO})
+        assert wait_for(at._jobs, job_id)['status'] == 'done'
+    finally:
+        at._jobs.stop(timeout=5)
+        at._prefetcher.stop(timeout=5)
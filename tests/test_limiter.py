@@ -0,0 +1,78 @@
+import time
+
+import pytest
+import requests
+
+import analyzetube as at
+
+@pytest.fixture
+def limiter(monkeypatch):
+    """Limitatore senza tetto e con backoff trascurabile, al posto di quello globale"""
+    limiter = at.OutboundLimiter(rate=1e6, burst=1e6, backoff_base=0.001, backoff_max=0.001,
+                                 threshold=3, cooldown=60)
+    monkeypatch.setattr(at, '_youtube_limiter', limiter)
+    return limiter
+
+def test_token_bucket_paces_requests():
+    limiter = at.OutboundLimiter(rate=20, burst=2)
+    start = time.monotonic()
+    for _ in range(4):
+        limiter.acquire()
+    # Due subito (burst), le altre due a 1/20 di secondo l'una dall'altra
+    assert time.monotonic() - start >= 0.09
+    assert limiter.stats()['allowed'] == 4 and limiter.stats()['waited_ms'] > 0
+
+def test_too_long_wait_is_rejected():
+    limiter = at.OutboundLimiter(rate=0.1, burst=1)
+    limiter.acquire()
+    with pytest.raises(at.YouTubeThrottled):
+        limiter.acquire(max_wait=0.1)
+    assert limiter.stats()['rejected'] == 1
+
+def test_breaker_opens_after_consecutive_failures(limiter):
+    for _ in range(3):
+        limiter.acquire()
+        limiter.record(True)
+    assert limiter.stats()['state'] == 'open'
+    with pytest.raises(at.YouTubeThrottled):
+        limiter.acquire()
+    assert limiter.stats()['rejected'] == 1
+
+def test_half_open_probe_closes_or_reopens(limiter):
+    limiter.cooldown = 0
+    for _ in range(3):
+        limiter.acquire()
+        limiter.record(True)
+    limiter.acquire()
+    assert limiter.stats()['state'] == 'half_open'
+    limiter.record(True)
+    assert limiter.stats()['state'] == 'open'
+
+    limiter.acquire()
+    limiter.record(False)
+    assert limiter.stats()['state'] == 'closed'
+
+def test_success_resets_failures(limiter):
+    limiter.acquire()
+    limiter.record(True)
+    limiter.acquire()
+    limiter.record(False)
+    stats = limiter.stats()
+    assert (stats['state'], stats['consecutive_failures'], stats['allowed']) == ('closed', 0, 2)
+
+def test_5xx_retries_go_through_the_limiter(stub, limiter, monkeypatch):
+    monkeypatch.setattr(at, 'HTTP_RETRIES', 2)
+    stub.error_rate = 1.0
+    session = at.stub_session(at._tune_session(requests.Session()), stub.base_url)
+    url = next(iter(stub.fixture['tracks']))
+
+    assert session.get(url, timeout=5).status_code == 503
+    stats = limiter.stats()
+    assert (stats['allowed'], stats['throttled']) == (3, 3)
+
+def test_connection_errors_are_recorded(limiter, monkeypatch):
+    monkeypatch.setattr(at, 'HTTP_RETRIES', 0)
+    session = at._tune_session(requests.Session())
+    with pytest.raises(requests.ConnectionError):
+        session.get('http://127.0.0.1:9/', timeout=1)
+    assert limiter.stats()['throttled'] == 1
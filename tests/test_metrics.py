@@ -0,0 +1,51 @@
+import analyzetube as at
+
+VIDEO = 'dQw4w9WgXcQ'
+
+def sample(text, name):
+    """Valore della prima serie che inizia con name nel testo di /metrics"""
+    for line in text.splitlines():
+        if line.startswith(name):
+            return float(line.rsplit(' ', 1)[1])
+    return 0.0
+
+def test_histogram_and_labels():
+    metrics = at.Metrics(buckets=(0.1, 1))
+    metrics.describe('prova_seconds', 'histogram', 'Prova')
+    metrics.describe('prova_total', 'counter', 'Prova')
+    for value in (0.05, 0.5, 5):
+        metrics.observe('prova_seconds', value, stage='a')
+    metrics.inc('prova_total', path='/x"y')
+
+    text = metrics.render()
+    assert '# TYPE prova_seconds histogram' in text
+    assert 'prova_seconds_bucket{stage="a",le="0.1"} 1' in text
+    assert 'prova_seconds_bucket{stage="a",le="1"} 2' in text
+    assert 'prova_seconds_bucket{stage="a",le="+Inf"} 3' in text
+    assert 'prova_seconds_count{stage="a"} 3' in text
+    assert 'prova_total{path="/x\\"y"} 1' in text
+
+def test_server_timing_includes_stages_from_leg_threads(client, youtube, monkeypatch):
+    fetch = youtube.fetch_video_info
+
+    def timed_fetch(video_id, langs=None):
+        with at.timed('extract_info'):
+            return fetch(video_id, langs)
+    monkeypatch.setattr(at, 'fetch_video_info', timed_fetch)
+
+    header = client.get(f'/api/extract?url={VIDEO}').headers['Server-Timing']
+    names = [entry.split(';')[0] for entry in header.split(', ')]
+    assert 'extract_info' in names and 'serialize' in names
+    assert names[-1] == 'total'
+
+def test_metrics_endpoint_counts_requests(client, youtube):
+    series = 'analyzetube_http_requests_total{endpoint="/api/extract",method="GET",status="200"}'
+    before = sample(client.get('/metrics').get_data(as_text=True), series)
+    client.get(f'/api/extract?url={VIDEO}')
+
+    response = client.get('/metrics')
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert sample(text, series) == before + 1
+    assert '# TYPE analyzetube_stage_seconds histogram' in text
+    assert 'analyzetube_cache_lookups_total' in text
@@ -0,0 +1,100 @@
+import time
+
+import pytest
+
+import analyzetube as at
+
+CHANNEL = 'https://www.youtube.com/@canale'
+VIDEOS = ['aaaaaaaaaaa', 'bbbbbbbbbbb']
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'condizione non raggiunta'
+        time.sleep(0.02)
+
+@pytest.fixture
+def prefetcher(db_path, monkeypatch):
+    monkeypatch.setattr(at, 'PREFETCH_IDLE_WAIT', 0.05)
+    monkeypatch.setattr(at, 'PREFETCH_PER_HOUR', 36000)
+    listed = []
+
+    def expand_playlist(url, limit):
+        listed.append((url, limit))
+        if 'errore' in url:
+            raise RuntimeError('non trovato')
+        return VIDEOS
+    monkeypatch.setattr(at, 'expand_playlist', expand_playlist)
+
+    prefetcher = at.Prefetcher(db_path, workers=1)
+    prefetcher.listed = listed
+    yield prefetcher
+    prefetcher.stop(timeout=5)
+
+def test_watchlist_add_and_remove(prefetcher):
+    prefetcher.add(CHANNEL)
+    prefetcher.add(CHANNEL)
+    assert [entry['url'] for entry in prefetcher.watchlist()] == [CHANNEL]
+    assert prefetcher.watchlist()[0]['checked'] is None
+    assert prefetcher.remove(CHANNEL) and not prefetcher.remove(CHANNEL)
+    assert prefetcher.stats() == {'sources': 0, 'videos': {}}
+
+def test_new_videos_are_extracted_once(prefetcher, youtube):
+    prefetcher.add(CHANNEL)
+    prefetcher.add('https://www.youtube.com/@errore')
+    prefetcher.start()
+    wait_until(lambda: prefetcher.stats()['videos'] == {'done': 2})
+
+    assert prefetcher.listed[0] == (CHANNEL, at.PREFETCH_RECENT)
+    assert youtube.calls['info'] == 2 and youtube.calls['comments'] == 2
+    errors = {entry['url']: entry['error'] for entry in prefetcher.watchlist()}
+    assert errors[CHANNEL] is None and 'non trovato' in errors['https://www.youtube.com/@errore']
+
+    # Le richieste degli utenti trovano la cache
+    assert at.run_extraction(VIDEOS[0])['cache'] == {'info': 'memory', 'comments': 'memory'}
+
+def test_source_is_checked_once_per_interval(prefetcher):
+    prefetcher.add(CHANNEL)
+    assert prefetcher._claim_source() == CHANNEL
+    assert prefetcher._claim_source() is None
+
+def test_videos_are_claimed_by_one_process(prefetcher, db_path):
+    prefetcher.add(CHANNEL)
+    other = at.Prefetcher(db_path, workers=1)
+    with prefetcher._lock:
+        prefetcher._db.executemany(
+            "INSERT INTO videos (video_id, source, status, found, updated) VALUES (?, ?, 'queued', ?, ?)",
+            [(video_id, CHANNEL, i, i) for i, video_id in enumerate(VIDEOS)])
+        prefetcher._db.commit()
+
+    assert [prefetcher._claim_video(), other._claim_video()] == VIDEOS
+    assert prefetcher._claim_video() is None
+
+def test_yields_to_user_requests(prefetcher, monkeypatch):
+    assert not prefetcher._busy()
+    monkeypatch.setattr(at._inflight, 'stats', lambda: {'in_flight': at.PREFETCH_BUSY_INFLIGHT})
+    assert prefetcher._busy()
+
+    prefetcher.stop()
+    assert not prefetcher._wait_turn()      # in chiusura smette di aspettare
+
+def test_hourly_budget_spaces_extractions(prefetcher, monkeypatch):
+    monkeypatch.setattr(at, 'PREFETCH_PER_HOUR', 3600 * 10)    # un video ogni 0,1 secondi
+    started = time.monotonic()
+    for _ in range(3):
+        assert prefetcher._wait_turn()
+    assert time.monotonic() - started >= 0.2
+
+def test_api_watchlist(client):
+    assert client.post('/api/watchlist', json={'url': 'https://www.youtube.com/watch?v=aaaaaaaaaaa'}).status_code == 400
+    assert client.post('/api/watchlist', json={'url': CHANNEL}).status_code == 201
+
+    data = client.get('/api/watchlist').get_json()
+    assert [entry['url'] for entry in data['watchlist']] == [CHANNEL] and data['sources'] == 1
+
+    assert client.delete(f'/api/watchlist?url={CHANNEL}').get_json() == {'success': True, 'url': CHANNEL}
+    assert client.delete(f'/api/watchlist?url={CHANNEL}').status_code == 404
+
+def test_api_watchlist_disabled(client, monkeypatch):
+    monkeypatch.setattr(at, 'PREFETCH_ENABLED', False)
+    assert client.get('/api/watchlist').status_code == 503
@@ -0,0 +1,87 @@
+import pytest
+
+import analyzetube as at
+
+VIDEO = 'dQw4w9WgXcQ'
+
+def comments(count, size=200):
+    return [{'id': str(i), 'author': f'Utente {i}', 'text': f'commento {i} ' + 'parola ' * (size // 7),
+             'votes': count - i, 'time': None, 'reply': False} for i in range(count)]
+
+def timed(segments):
+    return at.Transcript.from_segments([(i * 2000, 2000, text) for i, text in enumerate(segments)])
+
+LONG = timed([f'frase numero {i} del video con qualche parola in più' for i in range(3000)])
+HUGE_SEGMENT = timed(['inizio', 'parola ' * 20000, 'fine'])
+NO_SPACES = timed(['字' * 50000])
+
+@pytest.mark.parametrize('name, transcript', [('long', LONG), ('huge_segment', HUGE_SEGMENT), ('no_spaces', NO_SPACES)])
+@pytest.mark.parametrize('budget', [300, 1000, 4000, 12000])
+def test_prompt_fits_budget(name, transcript, budget):
+    prompt = at.build_prompt('Titolo', transcript.text, transcript, comments(200), budget)
+    assert at.estimate_tokens(prompt['prompt']) <= budget
+    assert prompt['tokens']['total'] <= budget
+    assert prompt['transcript_truncated']
+
+@pytest.mark.parametrize('budget', [300, 1000, 12000])
+def test_prompt_without_timing_fits_budget(budget):
+    text = 'parola ' * 50000
+    prompt = at.build_prompt('Titolo', text, None, [], budget)
+    assert at.estimate_tokens(prompt['prompt']) <= budget
+    assert at.NO_COMMENTS in prompt['prompt']
+
+def test_short_video_is_included_whole():
+    transcript = timed(['ciao a tutti', 'oggi parliamo di test'])
+    prompt = at.build_prompt('Titolo', transcript.text, transcript, comments(3, 20))
+    assert not prompt['transcript_truncated']
+    assert '[00:00] ciao a tutti oggi parliamo di test' in prompt['prompt']
+    assert prompt['comments_included'] == 3
+
+def test_budget_smaller_than_template():
+    with pytest.raises(ValueError):
+        at.build_prompt('Titolo', 'testo', None, [], 100)
+
+@pytest.mark.parametrize('transcript', [LONG, HUGE_SEGMENT, NO_SPACES])
+@pytest.mark.parametrize('budget', [300, 1000, 4000])
+def test_map_reduce_prompts_fit_budget(transcript, budget):
+    result = at.build_map_reduce_prompts('Titolo', transcript.text, transcript, comments(50), budget)
+    assert result['map_prompts']
+    assert all(at.estimate_tokens(part['prompt']) <= budget for part in result['map_prompts'])
+    assert at.estimate_tokens(result['reduce_prompt']) <= budget
+
+def test_map_reduce_covers_whole_transcript():
+    result = at.build_map_reduce_prompts('Titolo', HUGE_SEGMENT.text, HUGE_SEGMENT, [], 1000)
+    words = sum(part['prompt'].split('\n', 4)[-1].count('parola') for part in result['map_prompts'])
+    assert words == 20000
+
+def test_truncate_and_split_tokens():
+    text = 'uno due tre quattro cinque sei sette otto nove dieci'
+    assert at.truncate_tokens(text, 100) == text
+    assert at.truncate_tokens(text, 4) == 'uno due tre'
+    assert at.truncate_tokens('x' * 100, 5) == 'x' * 20
+    assert at.truncate_tokens(text, 0) == ''
+
+    pieces = list(at.split_tokens(text, 4))
+    assert ' '.join(pieces) == text
+    assert all(at.estimate_tokens(piece) <= 4 for piece in pieces)
+
+def test_api_prompt_extracts_once(client, youtube, monkeypatch):
+    def fetch(video_id, langs=None):
+        youtube.calls['info'] += 1
+        return {'title': 'Con tempi', 'transcript': LONG.text, 'segments': LONG.to_index()}
+    monkeypatch.setattr(at, 'fetch_video_info', fetch)
+
+    response = client.post('/api/prompt', json={'url': VIDEO, 'token_budget': 2000})
+    data = response.get_json()
+    assert response.status_code == 200
+    assert data['tokens']['total'] <= 2000
+    assert '[00:00]' in data['prompt']
+    assert youtube.calls['info'] == 1
+
+    data = client.post('/api/prompt', json={'url': VIDEO, 'mode': 'map_reduce'}).get_json()
+    assert data['mode'] == 'map_reduce' and len(data['map_prompts']) > 1
+    assert youtube.calls['info'] == 1     # il secondo prompt usa la cache
+
+def test_api_prompt_rejects_bad_input(client):
+    assert client.post('/api/prompt', json={'url': VIDEO, 'token_budget': 'tanti'}).status_code == 400
+    assert client.post('/api/prompt', json=[VIDEO]).status_code == 400
@@ -0,0 +1,60 @@
+import gzip
+import json
+
+import analyzetube as at
+
+VIDEO = 'dQw4w9WgXcQ'
+
+def test_etag_and_not_modified(client, youtube):
+    first = client.get(f'/api/extract?url={VIDEO}')
+    etag = first.headers['ETag']
+    assert first.status_code == 200
+    assert etag.startswith(f'W/"{VIDEO}-')
+
+    again = client.get(f'/api/extract?url={VIDEO}', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.get_data() == b''
+    # Tempi ed esito della cache cambiano, il contenuto no: stesso ETag
+    assert again.headers['ETag'] == etag
+
+def test_etag_changes_with_content(client, youtube):
+    etag = client.get(f'/api/extract?url={VIDEO}').headers['ETag']
+    youtube.comments = youtube.comments[:2]
+    response = client.get(f'/api/extract?url={VIDEO}&refresh=1', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+def test_transcript_pages(client, youtube, monkeypatch):
+    text = ' '.join(f'parola{i}' for i in range(100))
+    monkeypatch.setattr(at, 'fetch_video_info', lambda video_id, langs=None: {
+        'title': 'Lungo', 'transcript': text, 'segments': None})
+
+    pages, offset = [], 0
+    while offset is not None:
+        page = client.get(f'/api/extract?url={VIDEO}&transcript_offset={offset}&transcript_limit=50').get_json()
+        assert 'comments' not in page and page['transcript_total'] == len(text)
+        pages.append(page['transcript'])
+        offset = page['transcript_next_offset']
+
+    assert ' '.join(pages) == text
+    assert all(not page.startswith(' ') and not page.endswith(' ') for page in pages)
+    assert youtube.calls['comments'] == 0      # solo il ramo richiesto
+
+def test_comment_pages(client, youtube):
+    page = client.get(f'/api/extract?url={VIDEO}&comments_page=2&comments_per_page=2').get_json()
+    assert [item['id'] for item in page['comment_items']] == ['2', '3']
+    assert page['comments'].startswith('3. Utente 2')
+    assert (page['comments_total'], page['comments_pages']) == (5, 3)
+    assert 'transcript' not in page and youtube.calls['info'] == 0
+
+    assert client.get(f'/api/extract?url={VIDEO}&comments_page=x').status_code == 400
+
+def test_large_responses_are_compressed(client, youtube):
+    youtube.comments = youtube.comments * 40
+    response = client.get(f'/api/extract?url={VIDEO}', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert json.loads(gzip.decompress(response.get_data()))['success']
+
+    plain = client.get(f'/api/extract?url={VIDEO}')
+    assert 'Content-Encoding' not in plain.headers
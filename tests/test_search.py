@@ -0,0 +1,72 @@
+import pytest
+
+import analyzetube as at
+
+VIDEO = 'dQw4w9WgXcQ'
+
+def test_search_terms():
+    assert at.search_terms('Ciao "Buona Sera" mondo ""') == ['ciao', 'buona sera', 'mondo']
+    assert at.search_terms('   ') == []
+
+def test_like_escape():
+    assert at.like_escape('100%_a\\b') == '100\\%\\_a\\\\b'
+
+def test_transcript_passages():
+    transcript = at.Transcript.from_segments([(i * 1000, 900, 'parola') for i in range(5)])
+    passages = at.transcript_passages(transcript, size=14)
+    assert passages == [(0, 1900, 'parola parola'), (2000, 3900, 'parola parola'), (4000, 4900, 'parola')]
+
+@pytest.fixture(params=['fts5', 'like'])
+def index(request, db_path, monkeypatch):
+    if request.param == 'like':
+        monkeypatch.setattr(at.SearchIndex, '_create_fts', lambda self: False)
+    index = at.SearchIndex(db_path)
+    if index.engine != request.param:
+        pytest.skip(f'SQLite senza {request.param}')
+    return index
+
+class TestSearchIndex:
+
+    def test_transcript_passages_with_times(self, index):
+        transcript = at.Transcript.from_segments(
+            [(0, 1000, 'introduzione al tema'), (60000, 1000, 'il gatto nero dorme')] * 3)
+        assert index.add_transcript('v1', 'Titolo', transcript.text, transcript.to_index())
+        assert not index.add_transcript('v1', 'Titolo', transcript.text, transcript.to_index())
+
+        hits = index.search('gatto nero')
+        assert hits and all(hit['kind'] == 'transcript' and hit['title'] == 'Titolo' for hit in hits)
+        assert hits[0]['url'] == f"https://www.youtube.com/watch?v=v1&t={hits[0]['start_ms'] // 1000}s"
+
+    def test_comments_filters_and_limit(self, index):
+        items = [{'id': f'c{i}', 'author': '@u', 'text': f'commento numero {i}', 'votes': i} for i in range(5)]
+        assert index.add_comments('v1', items) == 5
+        assert index.add_comments('v1', items) == 0
+        index.add_comments('v2', [{'id': 'x', 'author': '@u', 'text': 'un altro commento', 'votes': 0}])
+
+        assert len(index.search('commento')) == 6
+        assert {hit['video_id'] for hit in index.search('commento', video_id='v2')} == {'v2'}
+        assert index.search('commento', kind='transcript') == []
+        assert len(index.search('commento', limit=2, offset=5)) == 1
+        assert index.search('"numero 3"')[0]['comment_id'] == 'c3'
+
+    def test_like_wildcards_are_literal(self, index):
+        index.add_comments('v1', [{'id': '1', 'author': '@u', 'text': 'sconto del 100% oggi', 'votes': 0},
+                                  {'id': '2', 'author': '@u', 'text': 'siamo in 1000', 'votes': 0},
+                                  {'id': '3', 'author': '@u', 'text': 'axb', 'votes': 0}])
+        assert [hit['comment_id'] for hit in index.search('a_b')] == []
+        if index.engine == 'like':
+            assert [hit['comment_id'] for hit in index.search('100%')] == ['1']
+
+def test_api_search_finds_extracted_comments(client, youtube):
+    client.get(f'/api/extract?url={VIDEO}')
+    at._search_executor.submit(lambda: None).result()     # attende l'indicizzazione in background
+
+    data = client.get('/api/search?q="numero 3"&kind=comment').get_json()
+    assert data['count'] == 1 and data['results'][0]['video_id'] == VIDEO
+    assert client.get('/api/search?q=numero&url=aaaaaaaaaaa').get_json()['count'] == 0
+
+@pytest.mark.parametrize('query, status', [
+    ('', 400), ('q=x&kind=video', 400), ('q=x&url=nonvalido', 400), ('q=x&limit=abc', 400),
+])
+def test_api_search_rejects_bad_input(client, query, status):
+    assert client.get(f'/api/search?{query}').status_code == status
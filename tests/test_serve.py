@@ -0,0 +1,74 @@
+import json
+import os
+import signal
+import socket
+import threading
+import time
+import urllib.request
+
+import pytest
+
+import analyzetube as at
+
+VIDEO = 'dQw4w9WgXcQ'
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def connects(port):
+    try:
+        socket.create_connection(('127.0.0.1', port), timeout=1).close()
+        return True
+    except OSError:
+        return False
+
+def test_healthz_reports_draining(client, monkeypatch):
+    assert client.get('/healthz').get_json()['status'] == 'ok'
+    draining = threading.Event()
+    draining.set()
+    monkeypatch.setattr(at, '_draining', draining)
+
+    response = client.get('/healthz')
+    assert response.status_code == 503 and response.get_json()['status'] == 'draining'
+    assert client.get(f'/api/extract?url={VIDEO}').status_code == 503
+
+@pytest.mark.skipif(not hasattr(signal, 'SIGTERM') or os.name == 'nt', reason='serve SIGTERM')
+def test_waitress_stops_accepting_then_drains_then_closes(youtube, monkeypatch):
+    pytest.importorskip('waitress')
+    port = free_port()
+    youtube.delay['info'] = 0.6
+    responses, responded, steps = [], threading.Event(), []
+
+    def fake_drain(timeout=at.DRAIN_TIMEOUT):
+        steps.append('finished' if responded.is_set() else 'in flight')
+        steps.append('accepting' if connects(port) else 'refused')
+        # La risposta in corso deve arrivare mentre si attende il drain
+        steps.append('response' if responded.wait(5) else 'no response')
+        return True
+    monkeypatch.setattr(at, 'drain', fake_drain)
+    monkeypatch.setattr(at, 'start_background', lambda: None)
+
+    def request():
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/api/extract?url={VIDEO}', timeout=10) as response:
+            responses.append((response.status, json.load(response)['title']))
+        responded.set()
+
+    def stop_soon():
+        while not connects(port):
+            time.sleep(0.02)
+        threading.Thread(target=request, daemon=True).start()
+        time.sleep(0.2)
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    previous = signal.getsignal(signal.SIGTERM)
+    threading.Thread(target=stop_soon, daemon=True).start()
+    try:
+        at.serve_waitress('127.0.0.1', port, 1, 4)
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+
+    assert steps == ['in flight', 'refused', 'response']
+    assert responses == [(200, f'Video {VIDEO}')]
+    assert not connects(port)
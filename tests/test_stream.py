@@ -0,0 +1,67 @@
+import json
+
+import analyzetube as at
+
+VIDEO = 'dQw4w9WgXcQ'
+
+def names(events):
+    return [name for name, _ in events]
+
+def parse_sse(text):
+    events = []
+    for block in text.strip().split('\n\n'):
+        name, data = block.split('\n')
+        events.append((name[len('event: '):], json.loads(data[len('data: '):])))
+    return events
+
+def test_events_in_order(youtube):
+    events = list(at.stream_extraction(VIDEO, refresh=True))
+    order = names(events)
+
+    assert order[-1] == 'done'
+    assert order.index('metadata') < order.index('transcript')
+    assert order.count('comments') == 1
+    assert events[0] == ('metadata', {'video_id': VIDEO, 'title': f'Video {VIDEO}'})
+    done = events[-1][1]
+    assert not done['partial'] and done['cache'] == {'info': 'miss', 'comments': 'miss'}
+    assert set(done['timings']) == {'info', 'comments', 'total'}
+
+def test_comments_arrive_in_chunks(youtube):
+    youtube.comments = [dict(youtube.comments[0], id=str(i)) for i in range(at.COMMENTS_CHUNK + 2)]
+    chunks = [data for name, data in at.stream_extraction(VIDEO, refresh=True) if name == 'comments']
+    assert [chunk['count'] for chunk in chunks] == [at.COMMENTS_CHUNK, at.COMMENTS_CHUNK + 2]
+    assert len(chunks[0]['items']) == at.COMMENTS_CHUNK
+
+def test_expired_leg_drops_late_events_and_is_not_cached(youtube, monkeypatch):
+    # Il ramo info finisce dopo la scadenza ma prima dei commenti, mentre lo stream è aperto
+    monkeypatch.setattr(at, 'INFO_TIMEOUT', 0.2)
+    youtube.delay = {'info': 0.3, 'comments': 0.6}
+    events = list(at.stream_extraction(VIDEO, refresh=True))
+
+    errors = [data for name, data in events if name == 'error']
+    assert len(errors) == 1 and errors[0]['leg'] == 'info'
+    assert errors[0]['error'].startswith('Timeout')
+    assert [data['title'] for name, data in events if name == 'metadata'] == ['Errore']
+    done = events[-1][1]
+    assert done['partial'] and set(done['errors']) == {'info'}
+    assert done['timings']['info'] < 300
+    assert youtube.calls['info'] == 1
+    assert at.get_cache().get(at.info_cache_key(VIDEO, at.DEFAULT_LANGS)) is None
+    assert at.get_cache().get(at.comments_cache_key(VIDEO, at.comment_options({}))) is not None
+
+def test_cached_legs_are_replayed(youtube):
+    list(at.stream_extraction(VIDEO, refresh=True))
+    events = list(at.stream_extraction(VIDEO))
+
+    assert youtube.calls['info'] == 1
+    assert names(events) == ['metadata', 'transcript', 'comments', 'done']
+    assert events[-1][1]['cache'] == {'info': 'memory', 'comments': 'memory'}
+
+def test_sse_endpoint(client, youtube):
+    response = client.get(f'/api/extract/stream?url={VIDEO}&lazy=1')
+    assert response.mimetype == 'text/event-stream'
+    events = parse_sse(response.get_data(as_text=True))
+
+    assert names(events)[-1] == 'done'
+    assert dict(events)['comments'] == {'count': len(youtube.comments)}
+    assert 'length' in dict(events)['transcript']
@@ -0,0 +1,87 @@
+import json
+
+import pytest
+import requests
+
+import analyzetube as at
+
+def chunked(data, size=7):
+    """La traccia a pezzi piccoli, per esercitare il parsing a cavallo dei chunk"""
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+JSON3 = json.dumps({'events': [
+    {'tStartMs': 0, 'dDurationMs': 2000, 'segs': [{'utf8': 'ciao'}, {'utf8': ' mondo', 'tOffsetMs': 800}]},
+    {'tStartMs': 1900, 'dDurationMs': 100, 'segs': [{'utf8': '\n'}]},
+    {'tStartMs': 2000, 'dDurationMs': 1500, 'segs': [{'utf8': 'secondo'}]},
+    {'tStartMs': 3500},
+]}).encode()
+
+VTT = b"""WEBVTT
+
+00:00:01.000 --> 00:00:02.500
+<c>prima</c> riga
+seconda &amp; riga
+
+00:01:00,000 --> 00:01:01,000
+dopo un minuto
+"""
+
+SRV3 = b"""<?xml version="1.0" encoding="utf-8"?>
+<timedtext format="3"><body>
+<p t="0" d="1000">uno<br/>due</p>
+<p t="1500" d="500">tre &amp; quattro</p>
+</body></timedtext>"""
+
+TTML = b"""<tt xmlns="http://www.w3.org/ns/ttml"><body><div>
+<p begin="00:00:01.000" end="00:00:02.000">prima</p>
+<p begin="2.5s" dur="500ms">seconda</p>
+</div></body></tt>"""
+
+@pytest.mark.parametrize('size', [1, 7, 4096])
+def test_json3_segments_and_offsets(size):
+    transcript = at.parse_subtitles(chunked(JSON3, size))
+    assert transcript.text == 'ciao mondo secondo'
+    assert [(s.start, s.duration, s.text) for s in transcript] == [
+        (0, 800, 'ciao'), (800, 1200, 'mondo'), (2000, 1500, 'secondo')]
+
+def test_json3_streaming_without_orjson(monkeypatch):
+    monkeypatch.setattr(at, 'orjson', None)
+    assert at.parse_subtitles(chunked(JSON3)).text == 'ciao mondo secondo'
+
+def test_json3_truncated_track_is_an_error(monkeypatch):
+    monkeypatch.setattr(at, 'orjson', None)
+    with pytest.raises(ValueError):
+        at.parse_subtitles(chunked(JSON3[:-10]))
+
+def test_vtt_strips_markup_and_joins_lines():
+    transcript = at.parse_subtitles(chunked(VTT))
+    assert [(s.start, s.duration, s.text) for s in transcript] == [
+        (1000, 1500, 'prima riga seconda & riga'), (60000, 1000, 'dopo un minuto')]
+
+def test_vtt_automatic_drops_rolling_lines():
+    vtt = b"WEBVTT\n\n00:00:00.000 --> 00:00:01.000\nuno\n\n00:00:01.000 --> 00:00:02.000\nuno\ndue\n"
+    assert at.parse_subtitles([vtt], automatic=True).text == 'uno due'
+
+def test_srv3_and_ttml():
+    assert [(s.start, s.text) for s in at.parse_subtitles(chunked(SRV3))] == [(0, 'uno due'), (1500, 'tre & quattro')]
+    assert [(s.start, s.duration) for s in at.parse_subtitles(chunked(TTML))] == [(1000, 1000), (2500, 500)]
+
+def test_unknown_or_empty_track():
+    assert at.parse_subtitles([b'nessun formato']) is None
+    assert at.parse_subtitles([b'  ', b'']) is None
+    assert at.parse_subtitle_bytes(JSON3).text == 'ciao mondo secondo'
+
+def test_clock_ms():
+    assert at._clock_ms('01:02:03.456') == 3723456
+    assert at._clock_ms('02:03,5') == 123500
+    assert at._clock_ms('12.5s') == 12500
+    assert at._clock_ms('1500ms') == 1500
+
+def test_download_transcript_parses_while_streaming(stub, monkeypatch):
+    session = at.stub_session(at._tune_session(requests.Session()), stub.base_url)
+    monkeypatch.setattr(at, '_http_session', session)
+    monkeypatch.setattr(at, 'SUBTITLE_CHUNK', 64)
+    url = next(iter(stub.fixture['tracks']))
+
+    transcript = at.download_transcript(url)
+    assert len(transcript) == 24 * 8 and transcript[1].start == 300
@@ -0,0 +1,73 @@
+
+import pytest
+
+import analyzetube as at
+
+INFO = {
+    'subtitles': {'it': [{'ext': 'vtt', 'url': 'it.vtt'}], 'en-US': [{'ext': 'srv3', 'url': 'en.srv3'}]},
+    'automatic_captions': {'en': [{'ext': 'vtt', 'url': 'a.vtt'}, {'ext': 'json3', 'url': 'a.json3'}]},
+}
+
+def test_parse_langs():
+    assert at.parse_langs({'langs': 'en, it,,'}) == ['en', 'it']
+    assert at.parse_langs({'langs': ['de']}) == ['de']
+    assert at.parse_langs({'langs': ''}) is None
+    assert at.parse_langs({}) is None
+    assert len(at.parse_langs({'langs': ','.join(f'l{i}' for i in range(50))})) == at.MAX_LANGS
+
+def test_rank_subtitle_tracks_prefers_manual_then_language_order():
+    ranked = at.rank_subtitle_tracks(INFO, ['en', 'it'])
+    assert [(lang, automatic) for lang, automatic, _, _ in ranked] == [('en-US', False), ('it', False), ('en', True)]
+    assert ranked[2][2:] == ('json3', 'a.json3')
+
+def test_rank_subtitle_tracks_falls_back_to_original_language():
+    info = {'automatic_captions': {'de': [{'ext': 'vtt', 'url': 'de'}], 'fr-orig': [{'ext': 'vtt', 'url': 'fr'}]}}
+    assert at.rank_subtitle_tracks(info, ['en']) == [('fr-orig', True, 'vtt', 'fr')]
+
+@pytest.fixture
+def downloads(monkeypatch):
+    """download_transcript finto: url -> (ritardo, testo o eccezione)"""
+    outcomes, started = {}, []
+
+    def download(url, cancel=None, automatic=False):
+        started.append(url)
+        delay, outcome = outcomes[url]
+        if cancel.wait(delay):
+            return None
+        if isinstance(outcome, Exception):
+            raise outcome
+        return at.Transcript.from_segments([(0, 1000, outcome)])
+    monkeypatch.setattr(at, 'download_transcript', download)
+    return outcomes, started
+
+def test_best_track_wins_even_if_slower(downloads):
+    outcomes, started = downloads
+    outcomes.update({'en.srv3': (0.2, 'manuale'), 'it.vtt': (0, 'italiano'), 'a.json3': (0, 'automatica')})
+    transcript, track = at.resolve_subtitles(INFO, ['en', 'it'])
+
+    assert transcript.text == 'manuale'
+    assert track == ('en-US', False, 'srv3')
+    assert sorted(started) == ['a.json3', 'en.srv3', 'it.vtt']     # partite insieme
+
+def test_failed_track_falls_back_to_next(downloads):
+    outcomes, _ = downloads
+    outcomes.update({'en.srv3': (0, RuntimeError('404')), 'it.vtt': (0, ''), 'a.json3': (0.05, 'automatica')})
+    transcript, track = at.resolve_subtitles(INFO, ['en', 'it'])
+    assert (transcript.text, track) == ('automatica', ('en', True, 'json3'))
+
+def test_parallel_downloads_are_bounded(downloads, monkeypatch):
+    outcomes, started = downloads
+    monkeypatch.setattr(at, 'SUBTITLE_PARALLEL', 1)
+    outcomes.update({'en.srv3': (0, RuntimeError('404')), 'it.vtt': (0, 'italiano'), 'a.json3': (0, 'automatica')})
+    assert at.resolve_subtitles(INFO, ['en', 'it'])[0].text == 'italiano'
+    assert started == ['en.srv3', 'it.vtt']
+
+def test_throttling_is_not_a_missing_track(downloads):
+    outcomes, _ = downloads
+    outcomes.update({'en.srv3': (0, at.YouTubeThrottled('429')), 'it.vtt': (0.2, 'italiano'), 'a.json3': (0.2, 'a')})
+    with pytest.raises(at.YouTubeThrottled):
+        at.resolve_subtitles(INFO, ['en', 'it'])
+
+def test_no_tracks():
+    assert at.resolve_subtitles({'title': 'senza sottotitoli'}) is None
+    assert at.extract_transcript({}) == ("⚠️ Trascrizione non disponibile per questo video", None)
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+import analyzetube as at
+
+VIDEO = 'dQw4w9WgXcQ'
+
+def sample():
+    return at.Transcript.from_segments([(0, 1000, 'uno'), (1000, 1000, '  '), (2000, 500, 'due tre'),
+                                        (4000, 1000, 'quattro')])
+
+class TestTranscript:
+
+    @pytest.fixture
+    def transcript(self):
+        return sample()
+
+    def test_empty_segments_are_dropped(self, transcript):
+        assert transcript.text == 'uno due tre quattro'
+        assert len(transcript) == 3
+        assert transcript[-1].text == 'quattro'
+
+    def test_lookup_by_time(self, transcript):
+        assert transcript.text_at(2100) == 'due tre'
+        assert transcript.text_at(3000) == 'due tre'    # l'ultimo segmento iniziato
+        assert transcript.index_at(-1) is None
+
+    def test_time_range_of_characters(self, transcript):
+        start = transcript.text.index('tre')
+        assert transcript.time_range(start, len(transcript.text)) == (2000, 5000)
+        assert at.Transcript().time_range(0, 1) is None
+
+    def test_segments_between(self, transcript):
+        assert [s.text for s in transcript.segments_between(900, 2100)] == ['uno', 'due tre']
+        assert [s.text for s in transcript.segments_between(2500, 4000)] == []
+
+    def test_index_round_trip(self, transcript):
+        copy = at.Transcript.from_index(transcript.text, json.loads(json.dumps(transcript.to_index())))
+        assert list(map(str, copy)) == list(map(str, transcript))
+        assert [s.to_dict() for s in copy] == [s.to_dict() for s in transcript]
+
+@pytest.fixture
+def timed_video(youtube, monkeypatch):
+    def fetch(video_id, langs=None):
+        transcript = sample()
+        return {'title': 'Con tempi', 'transcript': transcript.text, 'segments': transcript.to_index()}
+    monkeypatch.setattr(at, 'fetch_video_info', fetch)
+
+def test_api_transcript_segments(client, timed_video):
+    data = client.get(f'/api/transcript?url={VIDEO}').get_json()
+    assert data['segment_count'] == 3
+    assert [segment['text'] for segment in data['segments']] == ['uno', 'due tre', 'quattro']
+
+    data = client.get(f'/api/transcript?url={VIDEO}&start=1.5&end=3').get_json()
+    assert [segment['text'] for segment in data['segments']] == ['due tre']
+
+    assert client.get(f'/api/transcript?url={VIDEO}&at=4.5').get_json()['segment']['text'] == 'quattro'
+    assert client.get(f'/api/transcript?url={VIDEO}&char_start=4&char_end=7').get_json()['start_ms'] == 2000
+    assert client.get(f'/api/transcript?url={VIDEO}&at=x').status_code == 400
+
+def test_api_transcript_without_timing(client, youtube):
+    response = client.get(f'/api/transcript?url={VIDEO}')
+    assert response.status_code == 404
+    assert response.get_json()['error'] == f'Trascrizione di {VIDEO}'